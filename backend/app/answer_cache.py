@@ -0,0 +1,162 @@
+# app/answer_cache.py
+
+import re
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Callable, FrozenSet, Iterable, List, Optional
+
+from rag_index import stem
+
+_PUNCTUATION_RE = re.compile(r"[^\w\s]")
+_SPACE_RE = re.compile(r"\s+")
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_NEGATION_RE = re.compile(r"\b(?:can['’]t|cannot|won['’]t)\b|n['’]t\b")
+_NEGATION_FORMS = {"can't": "can not", "can’t": "can not", "cannot": "can not", "won't": "will not", "won’t": "will not"}
+
+# Only filler is dropped: unlike retrieval, question words and negations change the answer
+# ("When can I swap?" is not "How do I swap?", "Why can't I swap?" is not "Why can I swap?")
+_FILLER_WORDS = frozenset("""
+a an and are am as at be by can could did do does for from i in is it me my of on please should
+so that the this to was will with would you your
+""".split())
+QUESTION_WORDS = frozenset("how what when where which who whom whose why".split())
+NEGATIONS = frozenset("no not never none nothing".split())
+
+
+def normalize_question(text: str) -> str:
+    """Case-, punctuation- and whitespace-insensitive form used as the exact-match key ("can't" -> "can not")"""
+    text = _NEGATION_RE.sub(lambda m: " " + _NEGATION_FORMS.get(m.group(0), "not"), (text or "").lower())
+    return _SPACE_RE.sub(" ", _PUNCTUATION_RE.sub(" ", text)).strip()
+
+
+def question_tokens(text: str) -> List[str]:
+    """Tokens compared by the near-duplicate tier: stemmed words minus filler, question words and negations kept"""
+    return [stem(t) for t in _WORD_RE.findall(normalize_question(text)) if t not in _FILLER_WORDS]
+
+
+class AnswerCache:
+    """LRU + TTL cache of chatbot answers with two lookup tiers.
+
+    1. exact: the normalized question was answered before
+    2. similar: a cached question whose token set has Jaccard similarity
+       >= ``threshold`` with this one ("how can I earn points" ~ "how do I earn points?")
+       and that has the same question words and negations and shares at least
+       ``min_shared`` content words with it, so short questions ("How do I swap?",
+       "Where do I swap?") only ever match exactly
+
+    Entries are tagged with the knowledge-base ``version`` they were produced
+    from; a lookup with a different version clears the cache.
+    """
+
+    def __init__(self, tokenize: Callable[[str], Iterable[str]] = question_tokens, maxsize: int = 1000,
+                 ttl: float = 3600.0, threshold: float = 0.8, min_shared: int = 2):
+        self.tokenize = tokenize
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.threshold = threshold
+        self.min_shared = min_shared
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (answer, tokens, expires_at)
+        self._by_token = defaultdict(set)  # token -> keys, for near-duplicate candidates
+        self._version = None
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _tokens(self, key: str) -> FrozenSet[str]:
+        return frozenset(self.tokenize(key))
+
+    def _remove(self, key):
+        _, tokens, _ = self._entries.pop(key)
+        for token in tokens:
+            keys = self._by_token.get(token)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_token[token]
+
+    def _check_version(self, version):
+        if version != self._version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._by_token.clear()
+            self._version = version
+
+    def _live(self, key, now) -> bool:
+        if self._entries[key][2] > now:
+            return True
+        self._remove(key)
+        return False
+
+    def _similar(self, tokens, now) -> Optional[str]:
+        candidates = set()
+        for token in tokens:
+            candidates.update(self._by_token.get(token, ()))
+        best_key, best_score = None, self.threshold
+        for key in candidates:
+            other = self._entries[key][1]
+            shared = tokens & other
+            # A different question word or negation is a different question, however similar the rest
+            if (tokens ^ other) & (QUESTION_WORDS | NEGATIONS):
+                continue
+            if len(shared - QUESTION_WORDS - NEGATIONS) < self.min_shared:
+                continue
+            score = len(shared) / len(tokens | other)
+            if score >= best_score and self._live(key, now):
+                best_key, best_score = key, score
+        return best_key
+
+    def get(self, question: str, version=None) -> Optional[str]:
+        key = normalize_question(question)
+        now = time.monotonic()
+        with self._lock:
+            self._check_version(version)
+            if key in self._entries and self._live(key, now):
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                return self._entries[key][0]
+            tokens = self._tokens(key)
+            match = self._similar(tokens, now) if tokens else None
+            if match is not None:
+                self._entries.move_to_end(match)
+                self.similar_hits += 1
+                return self._entries[match][0]
+            self.misses += 1
+            return None
+
+    def set(self, question: str, answer: str, version=None):
+        key = normalize_question(question)
+        with self._lock:
+            self._check_version(version)
+            if key in self._entries:
+                self._remove(key)
+            tokens = self._tokens(key)
+            self._entries[key] = (answer, tokens, time.monotonic() + self.ttl)
+            for token in tokens:
+                self._by_token[token].add(key)
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_token.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        hits = self.exact_hits + self.similar_hits
+        lookups = hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "exact_hits": self.exact_hits,
+            "similar_hits": self.similar_hits,
+            "misses": self.misses,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "invalidations": self.invalidations,
+        }
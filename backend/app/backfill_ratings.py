@@ -0,0 +1,25 @@
+#!/usr/bin/env python3
+"""
+Compute the denormalized users.rating_sum / users.rating_count columns from
+the ratings table. Importing main adds the columns to an existing users table
+(ALTER TABLE, existing rows start at 0), so this can run right after upgrading.
+Run once, from the backend directory:
+
+    python app/backfill_ratings.py
+"""
+
+import os
+import sys
+
+sys.path.append(os.path.dirname(__file__))
+
+from main import SessionLocal, backfill_rating_aggregates
+
+
+if __name__ == "__main__":
+    db = SessionLocal()
+    try:
+        rated_users = backfill_rating_aggregates(db)
+    finally:
+        db.close()
+    print(f"✅ Rating aggregates rebuilt for {rated_users} rated users")
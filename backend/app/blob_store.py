@@ -0,0 +1,104 @@
+# app/blob_store.py
+
+import os
+import time
+
+
+class BlobStore:
+    """Content-addressed file store: one file per sha256, sharded as ab/cd/<hash><ext>.
+
+    Blobs are shared between ItemImage rows with the same content_hash; the
+    rows are the reference counts, and ``collect_garbage`` removes blobs no
+    row points to any more.
+    """
+
+    def __init__(self, root: str, url_prefix: str, ext: str = ".jpg"):
+        self.root = root
+        self.url_prefix = url_prefix.rstrip("/")
+        self.ext = ext
+
+    def _relative(self, digest: str) -> str:
+        return os.path.join(digest[:2], digest[2:4], f"{digest}{self.ext}")
+
+    def path_for(self, digest: str) -> str:
+        return os.path.join(self.root, self._relative(digest))
+
+    def url_for(self, digest: str) -> str:
+        return f"{self.url_prefix}/{self._relative(digest).replace(os.sep, '/')}"
+
+    def put(self, tmp_path: str, digest: str):
+        """Move a fully written temp file into the store, dropping it if the blob exists.
+
+        Returns (path, created_mtime): the mtime (ns) of a newly created blob, or
+        None when an existing blob was re-used.
+        """
+        path = self.path_for(digest)
+        if os.path.exists(path):
+            os.remove(tmp_path)
+            os.utime(path)  # fresh mtime keeps a re-used blob inside the GC grace period
+            return path, None
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp_path, path)
+        return path, os.stat(path).st_mtime_ns
+
+    def discard(self, digest: str, created_mtime: int):
+        """Undo a put() whose rows were never committed.
+
+        A blob whose mtime changed since was re-used by another upload in the
+        meantime and is kept.
+        """
+        try:
+            if os.stat(self.path_for(digest)).st_mtime_ns != created_mtime:
+                return 0
+        except FileNotFoundError:
+            return 0
+        return self.delete(digest)
+
+    def iter_blobs(self):
+        """Yield (digest, path) for every stored blob (variants like thumbnails excluded)"""
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                stem, ext = os.path.splitext(name)
+                if ext == self.ext and len(stem) == 64:
+                    yield stem, os.path.join(dirpath, name)
+
+    def delete(self, digest: str):
+        """Remove a blob together with any derived variants (e.g. <hash>_thumb.webp)"""
+        directory = os.path.dirname(self.path_for(digest))
+        try:
+            names = os.listdir(directory)
+        except FileNotFoundError:
+            return 0
+        freed = 0
+        for name in names:
+            if name.startswith(digest):
+                path = os.path.join(directory, name)
+                try:
+                    freed += os.path.getsize(path)
+                    os.remove(path)
+                except OSError:
+                    pass
+        return freed
+
+    def collect_garbage(self, referenced: set, grace_seconds: float = 3600, dry_run: bool = False):
+        """Delete blobs whose digest is not in ``referenced``.
+
+        Blobs younger than ``grace_seconds`` are kept, since an upload writes its
+        blob before the ItemImage row is committed.
+        """
+        cutoff = time.time() - grace_seconds
+        removed, freed = [], 0
+        for digest, path in list(self.iter_blobs()):
+            if digest in referenced:
+                continue
+            try:
+                if os.path.getmtime(path) > cutoff:
+                    continue
+            except OSError:
+                continue
+            removed.append(digest)
+            if dry_run:
+                freed += os.path.getsize(path)
+            else:
+                freed += self.delete(digest)
+        return removed, freed
@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""
+Compile the chatbot knowledge base (chunks JSON) into the binary index the
+server memory-maps. Running servers pick the new file up within
+CHATBOT_INDEX_CHECK_SECONDS. Run from the backend directory:
+
+    python app/build_rag_index.py [--chunks app/rewear_chunks.json] [--out app/rewear_chunks.idx] [--dense-dim 0]
+"""
+
+import argparse
+import json
+import os
+import sys
+
+sys.path.append(os.path.dirname(__file__))
+
+from rag_index_file import build_index_file
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the chatbot retrieval index")
+    parser.add_argument("--chunks", default=os.getenv("CHATBOT_KNOWLEDGE_BASE", os.path.join(HERE, "rewear_chunks.json")),
+                        help="knowledge-base chunks (JSON list of {title, content, tags})")
+    parser.add_argument("--out", default=None, help="index file to write (default: chunks path with .idx)")
+    parser.add_argument("--dense-dim", type=int, default=int(os.getenv("CHATBOT_DENSE_DIM", "0")),
+                        help="add hashed dense vectors of this dimension (0 = BM25 only)")
+    args = parser.parse_args()
+
+    out = args.out or os.getenv("CHATBOT_INDEX_PATH") or os.path.splitext(args.chunks)[0] + ".idx"
+    with open(args.chunks, "r", encoding="utf-8") as f:
+        chunks = json.load(f)
+    header = build_index_file(chunks, out, dense_dim=args.dense_dim)
+    print(f"Wrote {out}: {header['n_docs']} chunks, {header['n_terms']} terms, "
+          f"{os.path.getsize(out)} bytes" + (f", {args.dense_dim}-dim vectors" if args.dense_dim else ""))
@@ -0,0 +1,140 @@
+# app/chat_sessions.py
+
+import re
+import secrets
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Callable, List, Optional, Tuple
+
+from rag_index import estimate_tokens
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+def _clip(text: str, limit: int) -> str:
+    text = " ".join((text or "").split())
+    return text if len(text) <= limit else text[:limit - 1].rstrip() + "…"
+
+
+def extractive_summary(summary: str, dropped: List[Tuple[str, str]], max_tokens: int = 300) -> str:
+    """Fold turns that left the window into the running summary, without an LLM call.
+
+    Each turn becomes one "Q: ... A: <first sentence>" line; the oldest lines are
+    dropped once the summary exceeds ``max_tokens``.
+    """
+    lines = [line for line in (summary or "").split("\n") if line]
+    for question, answer in dropped:
+        first_sentence = _SENTENCE_RE.split((answer or "").strip(), maxsplit=1)[0]
+        lines.append(f"- Q: {_clip(question, 200)} A: {_clip(first_sentence, 300)}")
+    while len(lines) > 1 and estimate_tokens("\n".join(lines)) > max_tokens:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+class ChatSession:
+    """One conversation: a sliding window of recent (question, answer) turns plus a running summary"""
+
+    def __init__(self, conversation_id: str, owner_id: Optional[str] = None):
+        self.id = conversation_id
+        self.owner_id = owner_id
+        self.turns = deque()
+        self.summary = ""
+        self.lock = threading.Lock()
+
+    def history(self, token_budget: int) -> Tuple[str, List[Tuple[str, str]]]:
+        """(summary, newest turns that fit in ``token_budget`` together with the summary), oldest turn first"""
+        with self.lock:
+            used = estimate_tokens(self.summary) if self.summary else 0
+            kept = []
+            for question, answer in reversed(self.turns):
+                cost = estimate_tokens(question) + estimate_tokens(answer)
+                if used + cost > token_budget:
+                    break
+                kept.append((question, answer))
+                used += cost
+            return self.summary, kept[::-1]
+
+
+class ChatSessionStore:
+    """Bounded in-memory store of chat sessions keyed by conversation id.
+
+    Ids are generated here (unguessable), never taken from clients. A session
+    created for a signed-in user can only be continued by that user.
+    Sessions idle for longer than ``ttl`` seconds expire, and the least recently
+    used ones are evicted beyond ``maxsize``. Each session keeps at most
+    ``window_turns`` turns verbatim; older turns are folded into its summary by
+    ``summarize(summary, dropped_turns)``.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 1800.0, window_turns: int = 6,
+                 summarize: Callable[[str, List[Tuple[str, str]]], str] = extractive_summary):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.window_turns = window_turns
+        self.summarize = summarize
+        self._sessions = OrderedDict()  # id -> (session, last_used)
+        self._lock = threading.Lock()
+        self.created = 0
+        self.evicted = 0
+        self.expired = 0
+
+    def _prune(self, now):
+        while self._sessions:
+            conversation_id, (_, last_used) = next(iter(self._sessions.items()))
+            if now - last_used <= self.ttl:
+                break
+            del self._sessions[conversation_id]
+            self.expired += 1
+        while len(self._sessions) > self.maxsize:
+            self._sessions.popitem(last=False)
+            self.evicted += 1
+
+    def create(self, owner_id: Optional[str] = None) -> ChatSession:
+        """A new, empty session with a server-generated id"""
+        now = time.monotonic()
+        session = ChatSession(secrets.token_urlsafe(24), owner_id)
+        with self._lock:
+            self._prune(now)
+            self._sessions[session.id] = (session, now)
+            self.created += 1
+            self._prune(now)
+        return session
+
+    def get(self, conversation_id: str, owner_id: Optional[str] = None) -> Optional[ChatSession]:
+        """The live session for ``conversation_id``; None if unknown, expired or owned by someone else"""
+        now = time.monotonic()
+        with self._lock:
+            self._prune(now)
+            entry = self._sessions.get(conversation_id)
+            if entry is None or entry[0].owner_id != owner_id:
+                return None
+            # Moved to the end: the OrderedDict stays sorted by last use
+            self._sessions[conversation_id] = (entry[0], now)
+            self._sessions.move_to_end(conversation_id)
+            return entry[0]
+
+    def record_turn(self, session: ChatSession, question: str, answer: str):
+        with session.lock:
+            session.turns.append((question, answer))
+            dropped = []
+            while len(session.turns) > self.window_turns:
+                dropped.append(session.turns.popleft())
+            if dropped:
+                session.summary = self.summarize(session.summary, dropped)
+
+    def drop(self, conversation_id: str):
+        with self._lock:
+            self._sessions.pop(conversation_id, None)
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def stats(self) -> dict:
+        return {
+            "sessions": len(self._sessions),
+            "maxsize": self.maxsize,
+            "created": self.created,
+            "evicted": self.evicted,
+            "expired": self.expired,
+        }
@@ -1,9 +1,10 @@
 # app/database.py
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
+from contextlib import contextmanager
 from dotenv import load_dotenv
 
 load_dotenv()  # Load from .env
@@ -21,3 +22,27 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+@contextmanager
+def count_queries(bind=None):
+    """Count SQL statements issued inside the block.
+
+    Used to check that an endpoint's query count does not grow with the
+    number of rows it returns (N+1 loads):
+
+        with count_queries() as queries:
+            browse_items(db=db, limit=50)
+        assert len(queries) <= 3
+    """
+    bind = bind or engine
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(bind, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(bind, "before_cursor_execute", before_cursor_execute)
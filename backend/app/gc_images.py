@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+Reclaim image blobs that no ItemImage row references any more
+(e.g. after reject_item / remove_item). Run from the backend directory:
+
+    python app/gc_images.py [--dry-run] [--grace-seconds 3600]
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.dirname(__file__))
+
+from main import SessionLocal, ItemImage, blob_store
+
+
+def collect_image_garbage(grace_seconds: float = 3600, dry_run: bool = False):
+    db = SessionLocal()
+    try:
+        referenced = {
+            content_hash for (content_hash,) in
+            db.query(ItemImage.content_hash)
+            .filter(ItemImage.content_hash.isnot(None), ItemImage.item_id.isnot(None))
+            .distinct()
+        }
+    finally:
+        db.close()
+    return blob_store.collect_garbage(referenced, grace_seconds=grace_seconds, dry_run=dry_run)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Delete unreferenced image blobs")
+    parser.add_argument("--dry-run", action="store_true", help="only report what would be deleted")
+    parser.add_argument("--grace-seconds", type=float, default=3600,
+                        help="keep blobs written more recently than this (uploads in flight)")
+    args = parser.parse_args()
+
+    removed, freed = collect_image_garbage(args.grace_seconds, args.dry_run)
+    verb = "Would remove" if args.dry_run else "Removed"
+    print(f"✅ {verb} {len(removed)} blobs ({freed / (1024 * 1024):.1f} MB)")
@@ -5,6 +5,7 @@ Database initialization script for the Clothing Swap Platform
 
 import os
 import sys
+from datetime import datetime
 from dotenv import load_dotenv
 
 # Add the app directory to the Python path
@@ -76,7 +77,7 @@ def init_database():
             admin = User(
                 id=str(uuid.uuid4()),
                 email=admin_email,
-                password_hash=pwd_context.hash(admin_password),
+                password_hash=get_password_hash(admin_password),
                 first_name="Admin",
                 last_name="User",
                 is_admin=True,
@@ -2,8 +2,7 @@ from fastapi import FastAPI, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from sqlalchemy import Column, String, Boolean, DateTime, Integer, ForeignKey
-from sqlalchemy.orm import declarative_base, Session, relationship
-from passlib.context import CryptContext
+from sqlalchemy.orm import declarative_base, Session, relationship, joinedload, selectinload
 from jose import jwt, JWTError
 from datetime import datetime, timedelta
 from pydantic import BaseModel
@@ -16,14 +15,49 @@ from fastapi import Query
 from fastapi import status
 from fastapi import BackgroundTasks
 import google.generativeai as genai
+from langchain_groq import ChatGroq
+from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
 from dotenv import load_dotenv
 import os
 from sqlalchemy import func  # For average rating
-from pydantic import Field
+from pydantic import Field, field_validator
 from enum import Enum
 from fastapi import Form, File, UploadFile, Request
 from fastapi.staticfiles import StaticFiles
 from fastapi.staticfiles import StaticFiles
+from sqlalchemy import bindparam, Index, false, text
+from fastapi import Response
+import base64
+import json
+from view_buffer import ViewBuffer
+from search_index import init_search_index, index_item, unindex_item, apply_search
+from schema_upgrade import upgrade_schema
+from moderation import ModerationQueue, KeywordClassifier, parse_batch_verdicts, retry_delay
+from cache import TTLCache
+from uploads import UploadBudget, UploadSizeLimitMiddleware, FORM_OVERHEAD_BYTES, stream_upload_to_disk, make_thumbnail
+from blob_store import BlobStore
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy.dialects import postgresql, sqlite
+from password_pool import PasswordHasher, HasherOverloaded
+from sqlalchemy import event, inspect as sa_inspect
+from sqlalchemy.orm import Session as OrmSession
+from sqlalchemy.orm.exc import StaleDataError
+from collections import Counter, defaultdict
+from platform_stats import PlatformStats
+from recommendations import RecommendationEngine, RecommendationSnapshot
+from similarity import SimilarityIndex
+from notification_broker import InMemoryBroker, PostgresNotifyBroker
+from outbox import OutboxDispatcher, BatchResult
+from rag_index import select_context, format_context
+from rag_index_file import KnowledgeBase
+from answer_cache import AnswerCache
+from chat_sessions import ChatSessionStore
+from fastapi.responses import StreamingResponse, JSONResponse
+import asyncio
+import hashlib
+import threading
+import time
+import httpx
 
 
 # Load env vars manually (or use dotenv if needed)
@@ -31,12 +65,125 @@ SECRET_KEY = os.getenv("SECRET_KEY", "supersecretkey")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# Item views are buffered in memory and written in batches.
+# VIEW_BUFFER_MAX_PENDING caps how many views can be lost on a crash.
+VIEW_FLUSH_INTERVAL_SECONDS = float(os.getenv("VIEW_FLUSH_INTERVAL_SECONDS", "5"))
+VIEW_BUFFER_MAX_PENDING = int(os.getenv("VIEW_BUFFER_MAX_PENDING", "1000"))
+
+# AI moderation runs in background workers; "gemini" or the local "keyword" classifier
+MODERATION_CLASSIFIER = os.getenv("MODERATION_CLASSIFIER", "gemini")
+MODERATION_WORKERS = int(os.getenv("MODERATION_WORKERS", "2"))
+MODERATION_BATCH_SIZE = int(os.getenv("MODERATION_BATCH_SIZE", "16"))
+# Unscored listings are retried by a sweep every MODERATION_SWEEP_SECONDS, after a backoff that starts at
+# MODERATION_RETRY_SECONDS and doubles per attempt up to MODERATION_RETRY_MAX_SECONDS
+MODERATION_SWEEP_SECONDS = float(os.getenv("MODERATION_SWEEP_SECONDS", "15"))
+MODERATION_RETRY_SECONDS = float(os.getenv("MODERATION_RETRY_SECONDS", "60"))
+MODERATION_RETRY_MAX_SECONDS = float(os.getenv("MODERATION_RETRY_MAX_SECONDS", "3600"))
+
+# Verdict cache in front of the AI moderator, keyed by normalized title + description.
+# MODERATION_CACHE_DB=1 also persists verdicts in the moderation_verdicts table.
+MODERATION_CACHE_SIZE = int(os.getenv("MODERATION_CACHE_SIZE", "10000"))
+MODERATION_CACHE_TTL_SECONDS = int(os.getenv("MODERATION_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+MODERATION_CACHE_DB = os.getenv("MODERATION_CACHE_DB", "0") == "1"
+
+# Warm in-process tag name -> id cache used by item creation
+TAG_CACHE_SIZE = int(os.getenv("TAG_CACHE_SIZE", "50000"))
+TAG_CACHE_TTL_SECONDS = int(os.getenv("TAG_CACHE_TTL_SECONDS", "3600"))
+
+# Short-lived cache of authenticated principals, keyed by token subject
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+PRINCIPAL_CACHE_TTL_SECONDS = int(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "60"))
+
+# bcrypt runs in a dedicated process pool; requests beyond PASSWORD_HASH_MAX_PENDING get a 503.
+# Changing BCRYPT_ROUNDS rehashes passwords transparently on the next successful login.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "32"))
+
+# Platform totals for /stats/public and /admin/dashboard are served from memory
+# and recounted in the background at most this often
+PLATFORM_STATS_REFRESH_SECONDS = float(os.getenv("PLATFORM_STATS_REFRESH_SECONDS", "300"))
+
+# Recommendations are precomputed by a background job
+RECOMMENDATION_REFRESH_SECONDS = float(os.getenv("RECOMMENDATION_REFRESH_SECONDS", "600"))
+RECOMMENDATION_CANDIDATES_PER_CATEGORY = int(os.getenv("RECOMMENDATION_CANDIDATES_PER_CATEGORY", "200"))
+RECOMMENDATION_VIEW_WINDOW_DAYS = int(os.getenv("RECOMMENDATION_VIEW_WINDOW_DAYS", "90"))
+RECOMMENDATION_CACHE_TTL_SECONDS = float(os.getenv("RECOMMENDATION_CACHE_TTL_SECONDS", "300"))
+
+# "More like this" index: hashed feature vectors of approved items, kept in memory per worker.
+# Memory and query time grow with items x SIMILARITY_DIM (100k items x 2048 dims = 800 MB); fewer
+# dimensions save memory but make unrelated listings collide. Every SIMILARITY_REFRESH_SECONDS the
+# index is rebuilt from the database, which picks up approvals and removals made by other workers.
+SIMILARITY_DIM = int(os.getenv("SIMILARITY_DIM", "2048"))
+SIMILARITY_REFRESH_SECONDS = float(os.getenv("SIMILARITY_REFRESH_SECONDS", "300"))
+
+# GET /notifications page size when a cursor is passed without a limit
+NOTIFICATIONS_PAGE_SIZE = 20
+
+# Push channel for new notifications (GET /notifications/stream, Server-Sent Events)
+NOTIFICATION_STREAM_QUEUE_SIZE = int(os.getenv("NOTIFICATION_STREAM_QUEUE_SIZE", "100"))
+NOTIFICATION_STREAM_HEARTBEAT_SECONDS = float(os.getenv("NOTIFICATION_STREAM_HEARTBEAT_SECONDS", "15"))
+NOTIFICATION_STREAM_TICKET_SECONDS = int(os.getenv("NOTIFICATION_STREAM_TICKET_SECONDS", "60"))
+
+# Transactional outbox: side effects of a write are delivered in batches after it commits.
+# Events that keep failing are left in outbox_events after OUTBOX_MAX_ATTEMPTS tries.
+OUTBOX_DISPATCH_INTERVAL_SECONDS = float(os.getenv("OUTBOX_DISPATCH_INTERVAL_SECONDS", "2"))
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "100"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))
+
+# Chatbot retrieval: at most CHATBOT_TOP_K knowledge-base chunks, within CHATBOT_CONTEXT_TOKENS, go into each prompt
+CHATBOT_TOP_K = int(os.getenv("CHATBOT_TOP_K", "4"))
+CHATBOT_CONTEXT_TOKENS = int(os.getenv("CHATBOT_CONTEXT_TOKENS", "1200"))
+
+# Knowledge base: CHATBOT_KNOWLEDGE_BASE (chunks JSON) is compiled into the binary CHATBOT_INDEX_PATH
+# (see build_rag_index.py), which every worker mmaps and remaps when it is replaced.
+# CHATBOT_DENSE_DIM > 0 adds hashed dense vectors to BM25 scoring when the server has to build the index.
+# Set CHATBOT_INDEX_AUTO_BUILD=0 when the index is built in the deploy step; a stale index is then
+# served from memory instead of being rebuilt by the workers.
+CHATBOT_KNOWLEDGE_BASE = os.getenv("CHATBOT_KNOWLEDGE_BASE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "rewear_chunks.json"))
+CHATBOT_INDEX_PATH = os.getenv("CHATBOT_INDEX_PATH", os.path.splitext(CHATBOT_KNOWLEDGE_BASE)[0] + ".idx")
+CHATBOT_DENSE_DIM = int(os.getenv("CHATBOT_DENSE_DIM", "0"))
+CHATBOT_INDEX_CHECK_SECONDS = float(os.getenv("CHATBOT_INDEX_CHECK_SECONDS", "5"))
+CHATBOT_INDEX_AUTO_BUILD = os.getenv("CHATBOT_INDEX_AUTO_BUILD", "1") == "1"
+
+# Chatbot answer cache: exact and near-duplicate questions (token-set Jaccard >= CHATBOT_CACHE_SIMILARITY)
+# skip the LLM; cleared whenever the knowledge-base index changes
+CHATBOT_CACHE_SIZE = int(os.getenv("CHATBOT_CACHE_SIZE", "1000"))
+CHATBOT_CACHE_TTL_SECONDS = float(os.getenv("CHATBOT_CACHE_TTL_SECONDS", "3600"))
+CHATBOT_CACHE_SIMILARITY = float(os.getenv("CHATBOT_CACHE_SIMILARITY", "0.8"))
+
+# Streaming chatbot: one shared HTTP connection pool to the LLM, at most CHATBOT_MAX_CONCURRENCY
+# answers in flight (more get a 503), each cut off after CHATBOT_TIMEOUT_SECONDS
+CHATBOT_MAX_CONCURRENCY = int(os.getenv("CHATBOT_MAX_CONCURRENCY", "16"))
+CHATBOT_TIMEOUT_SECONDS = float(os.getenv("CHATBOT_TIMEOUT_SECONDS", "30"))
+
+# Multi-turn chat sessions kept server-side per conversation_id: the last CHATBOT_HISTORY_TURNS turns
+# (within CHATBOT_HISTORY_TOKENS) go into the prompt, older ones as a running summary.
+# Sessions idle for CHATBOT_SESSION_TTL_SECONDS expire; at most CHATBOT_SESSION_MAX are kept (LRU).
+CHATBOT_HISTORY_TURNS = int(os.getenv("CHATBOT_HISTORY_TURNS", "6"))
+CHATBOT_HISTORY_TOKENS = int(os.getenv("CHATBOT_HISTORY_TOKENS", "1000"))
+CHATBOT_SESSION_MAX = int(os.getenv("CHATBOT_SESSION_MAX", "10000"))
+CHATBOT_SESSION_TTL_SECONDS = float(os.getenv("CHATBOT_SESSION_TTL_SECONDS", "1800"))
+
+# Image uploads
+UPLOAD_DIR = "static/uploads"
+UPLOAD_MAX_FILE_BYTES = int(os.getenv("UPLOAD_MAX_FILE_BYTES", str(10 * 1024 * 1024)))
+UPLOAD_MAX_REQUEST_BYTES = int(os.getenv("UPLOAD_MAX_REQUEST_BYTES", str(40 * 1024 * 1024)))
+THUMBNAIL_MAX_SIDE = int(os.getenv("THUMBNAIL_MAX_SIDE", "400"))
+
+# Uploaded images are stored once per content hash under static/uploads/blobs/ab/cd/<sha256>.jpg
+blob_store = BlobStore(os.path.join(UPLOAD_DIR, "blobs"), "/static/uploads/blobs")
+
 app = FastAPI()
 
 load_dotenv()
 genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
 
 
+# Oversized uploads are refused while the body streams in, before it is spooled to disk
+# (added first, so CORS headers still wrap the 413)
+app.add_middleware(UploadSizeLimitMiddleware, max_body_bytes=UPLOAD_MAX_REQUEST_BYTES + FORM_OVERHEAD_BYTES)
+
 # Enable CORS
 app.add_middleware(
     CORSMiddleware,
@@ -44,13 +191,28 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
+@app.exception_handler(StaleDataError)
+async def concurrent_update_handler(request: Request, exc: StaleDataError):
+    # Another request changed the same item/swap first (see the version columns)
+    return JSONResponse(status_code=409, content={"detail": "This was changed by another request, please retry"})
+
 # Mount static files
 #app.mount("/static", StaticFiles(directory="static"), name="static")
 
 # Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+password_hasher = PasswordHasher(
+    workers=PASSWORD_HASH_WORKERS,
+    max_pending=PASSWORD_HASH_MAX_PENDING,
+    rounds=BCRYPT_ROUNDS,
+)
+
+@app.on_event("startup")
+def start_password_hasher():
+    # Registered before the startup hooks that start background threads
+    password_hasher.start()
 
 # OAuth2
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
@@ -66,104 +228,6 @@ class ItemType(str, Enum):
     REDEEM = "redeem"
 
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    credentials_exception = HTTPException(
-        status_code=401,
-        detail="Could not validate credentials",
-    )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: Optional[str] = payload.get("sub")
-        if email is None:
-            raise credentials_exception
-    except JWTError:
-        raise credentials_exception
-
-    user = db.query(User).filter(User.email == email).first()
-    if user is None:
-        raise credentials_exception
-    return user
-
-@app.post("/items")
-async def create_item(
-    title: str = Form(...),
-    description: Optional[str] = Form(None),
-    category_id: str = Form(...),
-    size: Optional[str] = Form(None),
-    condition: ItemCondition = Form(...),
-    item_type: ItemType = Form(...),
-    brand: Optional[str] = Form(None),
-    color: Optional[str] = Form(None),
-    material: Optional[str] = Form(None),
-    points_value: Optional[int] = Form(0),
-    tags: Optional[str] = Form(""),
-    images: List[UploadFile] = File(...),
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
-):
-    try:
-        # Check if spam using AI
-        is_flagged = check_if_spam_with_ai(title, description or "")
-        
-        # Create Item
-        item = Item(
-            id=str(uuid.uuid4()),
-            title=title,
-            description=description,
-            category_id=category_id,
-            size=size,
-            condition=condition.value,
-            item_type=item_type.value,
-            brand=brand,
-            color=color,
-            material=material,
-            points_value=points_value,
-            user_id=current_user.id,
-            is_flagged_by_ai=is_flagged
-        )
-        db.add(item)
-        db.commit()
-        db.refresh(item)
-
-        # Save Images
-        for idx, img in enumerate(images):
-            img_bytes = await img.read()
-            filename = f"{uuid.uuid4()}.jpg"
-            filepath = f"static/uploads/{filename}"
-            os.makedirs(os.path.dirname(filepath), exist_ok=True)
-            with open(filepath, "wb") as f:
-                f.write(img_bytes)
-
-            image = ItemImage(
-                id=str(uuid.uuid4()),
-                item_id=item.id,
-                image_url=f"/static/uploads/{filename}",
-                is_primary=(idx == 0)
-            )
-            db.add(image)
-
-        # Tags
-        tag_list = [t.strip() for t in (tags or "").split(",") if t.strip()]
-        for tag_name in tag_list:
-            tag = db.query(Tag).filter(Tag.name == tag_name).first()
-            if not tag:
-                tag = Tag(id=str(uuid.uuid4()), name=tag_name)
-                db.add(tag)
-                db.flush()
-            item_tag = ItemTag(id=str(uuid.uuid4()), item_id=item.id, tag_id=tag.id)
-            db.add(item_tag)
-
-        db.commit()
-
-        return {"message": "Item created successfully", "item_id": item.id, "flagged_by_ai": is_flagged}
-
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(status_code=500, detail=f"Failed to create item: {e}")
-
-@app.get("/items/{item_id}", response_model=ItemDetailResponse)
-
-
 # Database Dependency
 def get_db():
     db = SessionLocal()
@@ -185,6 +249,9 @@ class User(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow)
     points_balance = Column(Integer, default=0)
+    # Denormalized rating aggregates, maintained by rate_user (see backfill_rating_aggregates)
+    rating_sum = Column(Integer, default=0, server_default="0", nullable=False)
+    rating_count = Column(Integer, default=0, server_default="0", nullable=False)
 
 # Missing Database Models
 class Category(Base):
@@ -211,9 +278,25 @@ class Item(Base):
     is_approved = Column(Boolean, default=False)
     is_featured = Column(Boolean, default=False)
     is_flagged_by_ai = Column(Boolean, default=False)
+    ai_checked_at = Column(DateTime, nullable=True)  # NULL while AI moderation is pending
+    # Moderation lease: the worker that claimed the listing has it until then, after which it may be retried
+    moderation_retry_at = Column(DateTime, nullable=True)
+    moderation_attempts = Column(Integer, nullable=False, server_default="0")
     view_count = Column(Integer, default=0)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow)
+
+    # Optimistic locking: ORM updates check and bump this, so two requests that both
+    # read is_available=True cannot both claim the item (StaleDataError -> 409)
+    version = Column(Integer, nullable=False, server_default="1")
+
+    # Composite indexes backing keyset pagination in browse_items
+    __table_args__ = (
+        Index("ix_items_browse_newest", "is_available", "is_approved", "created_at", "id"),
+        # Keyed on coalesce() because view_count is nullable: browse_items seeks on the same expression
+        Index("ix_items_browse_views", "is_available", "is_approved", func.coalesce(view_count, 0), "id"),
+    )
+    __mapper_args__ = {"version_id_col": version}
     
     # Relationships
     category = relationship("Category", backref="items")
@@ -226,6 +309,8 @@ class ItemImage(Base):
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     item_id = Column(String, ForeignKey("items.id"))
     image_url = Column(String, nullable=False)
+    thumbnail_url = Column(String, nullable=True)  # small WebP variant, filled in by a background task
+    content_hash = Column(String, nullable=True, index=True)  # sha256 of the blob in blob_store
     is_primary = Column(Boolean, default=False)
     created_at = Column(DateTime, default=datetime.utcnow)
 
@@ -254,6 +339,8 @@ class Swap(Base):
     points_exchanged = Column(Integer, default=0)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow)
+    version = Column(Integer, nullable=False, server_default="1")  # optimistic locking of status transitions
+    __mapper_args__ = {"version_id_col": version}
     
     # Relationships
     initiator = relationship("User", foreign_keys=[initiator_id], backref="initiated_swaps")
@@ -271,11 +358,28 @@ class Notification(Base):
     related_swap_id = Column(String, ForeignKey("swaps.id"), nullable=True)
     is_read = Column(Boolean, default=False)
     created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_notifications_user_unread_created", "user_id", "is_read", "created_at"),
+    )
     
     # Relationships
     user = relationship("User", backref="notifications")
     related_swap = relationship("Swap", backref="notifications")
 
+def notification_is_unread():
+    """Rows written before is_read had a default hold NULL, which counts as unread"""
+    return or_(Notification.is_read == False, Notification.is_read.is_(None))
+
+class OutboxEvent(Base):
+    """Side effect recorded in the transaction that caused it; delivered and deleted by the outbox dispatcher"""
+    __tablename__ = "outbox_events"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    event_type = Column(String, nullable=False)  # notification
+    payload = Column(String, nullable=False)  # JSON
+    attempts = Column(Integer, default=0, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
 class PointTransaction(Base):
     __tablename__ = "point_transactions"
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
@@ -332,6 +436,31 @@ class AdminAction(Base):
     target_item = relationship("Item", foreign_keys=[target_item_id])
     target_user = relationship("User", foreign_keys=[target_user_id])
 
+class ModerationVerdict(Base):
+    __tablename__ = "moderation_verdicts"
+    content_hash = Column(String, primary_key=True)  # sha256 of normalized title + description
+    is_flagged = Column(Boolean, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class UserStats(Base):
+    """Per-user counters kept up to date by the flush hooks below (see reconcile_user_stats)"""
+    __tablename__ = "user_stats"
+    user_id = Column(String, ForeignKey("users.id"), primary_key=True)
+    total_items = Column(Integer, default=0, nullable=False)
+    active_items = Column(Integer, default=0, nullable=False)
+    pending_items = Column(Integer, default=0, nullable=False)
+    total_swaps = Column(Integer, default=0, nullable=False)
+    completed_swaps = Column(Integer, default=0, nullable=False)
+    points_earned = Column(Integer, default=0, nullable=False)
+    points_spent = Column(Integer, default=0, nullable=False)
+    unread_notifications = Column(Integer, default=0, nullable=False)
+
+class UserCategorySwapCount(Base):
+    __tablename__ = "user_category_swap_counts"
+    user_id = Column(String, ForeignKey("users.id"), primary_key=True)
+    category_id = Column(String, ForeignKey("categories.id"), primary_key=True)
+    swap_count = Column(Integer, default=0, nullable=False)
+
 # Enums for Item conditions and types
 class ItemCondition(str, Enum):
     NEW = "NEW"
@@ -348,8 +477,656 @@ class ItemType(str, Enum):
     ACCESSORY = "ACCESSORY"
 
 
-# Create tables
+# Create tables, then add columns and indexes that existing databases predate
 Base.metadata.create_all(bind=engine)
+for added_column in upgrade_schema(engine, Base.metadata):
+    print(f"Added column {added_column}")
+init_search_index(engine)
+
+
+def flush_item_views(counts: Dict[str, int], logs: List[dict]):
+    """Write a batch of buffered views: one bulk UPDATE and one bulk INSERT"""
+    items_table = Item.__table__
+    db = SessionLocal()
+    try:
+        db.execute(
+            items_table.update()
+            .where(items_table.c.id == bindparam("b_item_id"))
+            .values(view_count=func.coalesce(items_table.c.view_count, 0) + bindparam("b_views")),
+            [{"b_item_id": item_id, "b_views": n} for item_id, n in counts.items()],
+        )
+        db.execute(ItemViewLog.__table__.insert(), logs)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+view_buffer = ViewBuffer(
+    flush_item_views,
+    interval=VIEW_FLUSH_INTERVAL_SECONDS,
+    max_pending=VIEW_BUFFER_MAX_PENDING,
+)
+
+@app.on_event("startup")
+def start_view_buffer():
+    view_buffer.start()
+
+@app.on_event("shutdown")
+def stop_view_buffer():
+    view_buffer.stop()
+
+
+# ----------------------------------
+# Materialized per-user counters
+# ----------------------------------
+USER_STATS_COUNTERS = [
+    "total_items", "active_items", "pending_items",
+    "total_swaps", "completed_swaps", "points_earned", "points_spent",
+    "unread_notifications",
+]
+
+def item_counters(is_approved, is_available) -> Dict[str, int]:
+    approved = bool(is_approved)
+    available = True if is_available is None else bool(is_available)  # column default
+    return {"total_items": 1, "active_items": int(approved and available), "pending_items": int(not approved)}
+
+def previous_value(obj, attr):
+    history = sa_inspect(obj).attrs[attr].history
+    return history.deleted[0] if history.deleted else getattr(obj, attr)
+
+def swap_category_ids(session, swap):
+    item_ids = [swap.initiator_item_id, swap.recipient_item_id]
+    items = [session.get(Item, item_id) for item_id in item_ids if item_id]
+    return [item.category_id for item in items if item is not None and item.category_id]
+
+@event.listens_for(OrmSession, "before_flush")
+def collect_user_stats_deltas(session, flush_context, instances):
+    """Turn pending Item / Swap / PointTransaction / Notification changes into counter deltas"""
+    deltas = session.info.setdefault("user_stats_deltas", defaultdict(Counter))
+    category_deltas = session.info.setdefault("user_category_deltas", Counter())
+
+    def add_item(user_id, is_approved, is_available, sign):
+        if user_id:
+            for counter, value in item_counters(is_approved, is_available).items():
+                deltas[user_id][counter] += sign * value
+
+    for obj in session.new:
+        if isinstance(obj, Item):
+            add_item(obj.user_id, obj.is_approved, obj.is_available, 1)
+        elif isinstance(obj, Swap):
+            parties = [uid for uid in (obj.initiator_id, obj.recipient_id) if uid]
+            for uid in parties:
+                deltas[uid]["total_swaps"] += 1
+                if obj.status == "COMPLETED":
+                    deltas[uid]["completed_swaps"] += 1
+                for category_id in swap_category_ids(session, obj):
+                    category_deltas[(uid, category_id)] += 1
+        elif isinstance(obj, PointTransaction) and obj.user_id:
+            if obj.transaction_type == "EARNED":
+                deltas[obj.user_id]["points_earned"] += obj.amount
+            elif obj.transaction_type == "SPENT":
+                deltas[obj.user_id]["points_spent"] += obj.amount
+        elif isinstance(obj, Notification) and obj.user_id and not obj.is_read:
+            deltas[obj.user_id]["unread_notifications"] += 1
+
+    for obj in session.dirty:
+        if not session.is_modified(obj):
+            continue
+        if isinstance(obj, Item):
+            before = tuple(previous_value(obj, a) for a in ("user_id", "is_approved", "is_available"))
+            after = (obj.user_id, obj.is_approved, obj.is_available)
+            if before != after:
+                add_item(*before, -1)
+                add_item(*after, 1)
+        elif isinstance(obj, Swap):
+            was_completed = previous_value(obj, "status") == "COMPLETED"
+            if was_completed != (obj.status == "COMPLETED"):
+                for uid in (obj.initiator_id, obj.recipient_id):
+                    if uid:
+                        deltas[uid]["completed_swaps"] += -1 if was_completed else 1
+        elif isinstance(obj, Notification) and obj.user_id:
+            was_read = bool(previous_value(obj, "is_read"))
+            if was_read != bool(obj.is_read):
+                deltas[obj.user_id]["unread_notifications"] += 1 if was_read else -1
+
+    for obj in session.deleted:
+        if isinstance(obj, Item):
+            add_item(previous_value(obj, "user_id"), previous_value(obj, "is_approved"),
+                     previous_value(obj, "is_available"), -1)
+        elif isinstance(obj, Notification) and obj.user_id and not previous_value(obj, "is_read"):
+            deltas[obj.user_id]["unread_notifications"] -= 1
+
+def upsert_counters(conn, table, key: Dict[str, str], deltas: Dict[str, int]):
+    """UPDATE counters by delta, inserting the row if it does not exist yet"""
+    dialect = conn.dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        insert_stmt = (sqlite.insert if dialect == "sqlite" else postgresql.insert)(table).values(**key, **deltas)
+        conn.execute(insert_stmt.on_conflict_do_update(
+            index_elements=list(key),
+            set_={c: table.c[c] + insert_stmt.excluded[c] for c in deltas},
+        ))
+        return
+    result = conn.execute(
+        table.update()
+        .where(and_(*(table.c[k] == v for k, v in key.items())))
+        .values({c: table.c[c] + v for c, v in deltas.items()})
+    )
+    if result.rowcount == 0:
+        conn.execute(table.insert().values(**key, **deltas))
+
+@event.listens_for(OrmSession, "after_flush")
+def apply_user_stats_deltas(session, flush_context):
+    """Write collected deltas in the same transaction as the change itself"""
+    deltas = session.info.pop("user_stats_deltas", {})
+    category_deltas = session.info.pop("user_category_deltas", {})
+    if not deltas and not category_deltas:
+        return
+    conn = session.connection()
+    # Rows are locked in key order, so two transactions touching the same users cannot deadlock
+    for user_id, counters in sorted(deltas.items()):
+        changed = {c: v for c, v in counters.items() if v}
+        if changed:
+            upsert_counters(conn, UserStats.__table__, {"user_id": user_id}, changed)
+    for (user_id, category_id), n in sorted(category_deltas.items()):
+        upsert_counters(conn, UserCategorySwapCount.__table__,
+                        {"user_id": user_id, "category_id": category_id}, {"swap_count": n})
+
+@event.listens_for(OrmSession, "after_rollback")
+def discard_user_stats_deltas(session):
+    session.info.pop("user_stats_deltas", None)
+    session.info.pop("user_category_deltas", None)
+
+def compute_user_stats(db: Session):
+    """Recompute every counter from the source tables"""
+    stats = defaultdict(lambda: dict.fromkeys(USER_STATS_COUNTERS, 0))
+    for user_id, total, active, pending in db.query(
+        Item.user_id,
+        func.count(Item.id),
+        func.sum(case((and_(Item.is_approved == True, Item.is_available == True), 1), else_=0)),
+        func.sum(case((Item.is_approved == True, 0), else_=1)),
+    ).filter(Item.user_id.isnot(None)).group_by(Item.user_id):
+        stats[user_id].update(total_items=total, active_items=active or 0, pending_items=pending or 0)
+
+    completed = case((Swap.status == "COMPLETED", 1), else_=0)
+    for party in (Swap.initiator_id, Swap.recipient_id):
+        for user_id, total, done in db.query(party, func.count(Swap.id), func.sum(completed)).\
+                filter(party.isnot(None)).group_by(party):
+            stats[user_id]["total_swaps"] += total
+            stats[user_id]["completed_swaps"] += done or 0
+
+    for user_id, tx_type, amount in db.query(
+        PointTransaction.user_id, PointTransaction.transaction_type, func.sum(PointTransaction.amount)
+    ).filter(PointTransaction.transaction_type.in_(["EARNED", "SPENT"])).\
+            group_by(PointTransaction.user_id, PointTransaction.transaction_type):
+        stats[user_id]["points_earned" if tx_type == "EARNED" else "points_spent"] = amount or 0
+
+    for user_id, unread in db.query(Notification.user_id, func.count(Notification.id)).\
+            filter(Notification.user_id.isnot(None), notification_is_unread()).\
+            group_by(Notification.user_id):
+        stats[user_id]["unread_notifications"] = unread
+
+    categories = Counter()
+    for party in (Swap.initiator_id, Swap.recipient_id):
+        for side in (Swap.initiator_item_id, Swap.recipient_item_id):
+            for user_id, category_id, n in db.query(party, Item.category_id, func.count(Swap.id)).\
+                    join(Item, Item.id == side).\
+                    filter(party.isnot(None), Item.category_id.isnot(None)).\
+                    group_by(party, Item.category_id):
+                categories[(user_id, category_id)] += n
+    return stats, categories
+
+def lock_counter_tables(db: Session):
+    """Hold off concurrent counter writes until this transaction ends.
+
+    Writers update the source rows and their counters in one transaction, so
+    once no counter write can run, the recount and the rewrite below see the
+    same data and no delta committed in between is overwritten.
+
+    On SQLite this is the database-wide write lock: every writer (not only
+    counter writes) waits for the whole rebuild and fails with "database is
+    locked" once its busy timeout runs out, so only rebuild there (run
+    reconcile_stats.py without --check) in a quiet period.
+    """
+    dialect = db.bind.dialect.name
+    stats_table, categories_table = UserStats.__table__, UserCategorySwapCount.__table__
+    if dialect == "postgresql":
+        db.execute(text(f"LOCK TABLE {stats_table.name}, {categories_table.name} IN EXCLUSIVE MODE"))
+    elif dialect == "sqlite":
+        # Any write takes SQLite's database-wide write lock for the rest of the transaction
+        db.execute(stats_table.update().where(false()).values(total_items=stats_table.c.total_items))
+    else:
+        db.query(UserStats).with_for_update().all()
+        db.query(UserCategorySwapCount).with_for_update().all()
+
+def reconcile_user_stats(db: Session, fix: bool = True):
+    """Rebuild user_stats from scratch and report how far the stored counters drifted"""
+    if fix:
+        lock_counter_tables(db)
+    actual, categories = compute_user_stats(db)
+    stored = {row.user_id: row for row in db.query(UserStats)}
+    drift = {}
+    for user_id in set(actual) | set(stored):
+        expected = actual.get(user_id, dict.fromkeys(USER_STATS_COUNTERS, 0))
+        row = stored.get(user_id)
+        diff = {
+            c: {"stored": getattr(row, c) if row else 0, "actual": expected[c]}
+            for c in USER_STATS_COUNTERS
+            if (getattr(row, c) if row else 0) != expected[c]
+        }
+        if diff:
+            drift[user_id] = diff
+
+    if fix:
+        db.query(UserStats).delete(synchronize_session=False)
+        db.query(UserCategorySwapCount).delete(synchronize_session=False)
+        if actual:
+            db.execute(UserStats.__table__.insert(), [{"user_id": u, **c} for u, c in actual.items()])
+        if categories:
+            db.execute(UserCategorySwapCount.__table__.insert(), [
+                {"user_id": u, "category_id": c, "swap_count": n} for (u, c), n in categories.items()
+            ])
+        db.commit()
+    return {"users_checked": len(set(actual) | set(stored)), "users_drifted": len(drift), "drift": drift}
+
+def get_user_stats(db: Session, user_id: str) -> Dict[str, int]:
+    row = db.get(UserStats, user_id)
+    return {c: (getattr(row, c) if row else 0) for c in USER_STATS_COUNTERS}
+
+@app.on_event("startup")
+def backfill_user_stats():
+    # First start with counters: build them from existing data
+    db = SessionLocal()
+    try:
+        if db.query(UserStats.user_id).first() is None and db.query(User.id).first() is not None:
+            reconcile_user_stats(db)
+    finally:
+        db.close()
+
+
+# ----------------------------------
+# Platform-wide totals (in memory)
+# ----------------------------------
+def load_platform_stats() -> Dict[str, int]:
+    db = SessionLocal()
+    try:
+        return {
+            "total_users": db.query(User).count(),
+            "total_items": db.query(Item).count(),
+            "pending_items": db.query(Item).filter(Item.is_approved == False).count(),
+            "flagged_items": db.query(Item).filter(Item.is_flagged_by_ai == True).count(),
+            "total_swaps": db.query(Swap).count(),
+            "completed_swaps": db.query(Swap).filter(Swap.status == "COMPLETED").count(),
+        }
+    finally:
+        db.close()
+
+platform_stats = PlatformStats(load_platform_stats, refresh_interval=PLATFORM_STATS_REFRESH_SECONDS)
+
+def current_platform_stats() -> Dict[str, int]:
+    """The in-memory totals; 503 while they could not be loaded even once (e.g. database down at startup)"""
+    stats = platform_stats.get()
+    if not stats:
+        raise HTTPException(status_code=503, detail="Stats are temporarily unavailable", headers={"Retry-After": "5"})
+    return stats
+
+def platform_item_counters(is_approved, is_flagged) -> Dict[str, int]:
+    return {"total_items": 1, "pending_items": int(not is_approved), "flagged_items": int(bool(is_flagged))}
+
+@event.listens_for(OrmSession, "before_flush")
+def collect_platform_stat_deltas(session, flush_context, instances):
+    deltas = session.info.setdefault("platform_stat_deltas", Counter())
+
+    def add(counters, sign):
+        for key, value in counters.items():
+            deltas[key] += sign * value
+
+    for obj in session.new:
+        if isinstance(obj, User):
+            deltas["total_users"] += 1
+        elif isinstance(obj, Item):
+            add(platform_item_counters(obj.is_approved, obj.is_flagged_by_ai), 1)
+        elif isinstance(obj, Swap):
+            deltas["total_swaps"] += 1
+            deltas["completed_swaps"] += int(obj.status == "COMPLETED")
+
+    for obj in session.dirty:
+        if not session.is_modified(obj):
+            continue
+        if isinstance(obj, Item):
+            add(platform_item_counters(previous_value(obj, "is_approved"), previous_value(obj, "is_flagged_by_ai")), -1)
+            add(platform_item_counters(obj.is_approved, obj.is_flagged_by_ai), 1)
+        elif isinstance(obj, Swap):
+            deltas["completed_swaps"] += int(obj.status == "COMPLETED") - int(previous_value(obj, "status") == "COMPLETED")
+
+    for obj in session.deleted:
+        if isinstance(obj, User):
+            deltas["total_users"] -= 1
+        elif isinstance(obj, Item):
+            add(platform_item_counters(previous_value(obj, "is_approved"), previous_value(obj, "is_flagged_by_ai")), -1)
+
+@event.listens_for(OrmSession, "after_commit")
+def apply_platform_stat_deltas(session):
+    # Only committed writes reach the in-memory totals
+    deltas = session.info.pop("platform_stat_deltas", None)
+    if deltas and any(deltas.values()):
+        platform_stats.apply(deltas)
+
+@event.listens_for(OrmSession, "after_rollback")
+def discard_platform_stat_deltas(session):
+    session.info.pop("platform_stat_deltas", None)
+
+
+# ----------------------------------
+# Notification push
+# ----------------------------------
+# Notifications are published by whichever worker drains the outbox, not necessarily the one holding
+# the user's stream: on PostgreSQL every worker hears them over LISTEN/NOTIFY. The in-process broker
+# (SQLite) only reaches streams in the publishing worker, so run a single worker there.
+if engine.dialect.name == "postgresql":
+    notification_broker = PostgresNotifyBroker(engine, max_queue=NOTIFICATION_STREAM_QUEUE_SIZE)
+else:
+    notification_broker = InMemoryBroker(max_queue=NOTIFICATION_STREAM_QUEUE_SIZE)
+
+@app.on_event("startup")
+def start_notification_broker():
+    notification_broker.start()
+
+@app.on_event("shutdown")
+def stop_notification_broker():
+    notification_broker.stop()
+
+def notification_event(notification) -> dict:
+    return {
+        "id": notification.id,
+        "type": notification.type,
+        "title": notification.title,
+        "message": notification.message,
+        "related_swap_id": notification.related_swap_id,
+        "is_read": bool(notification.is_read),
+        "created_at": notification.created_at.isoformat() if notification.created_at else None,
+    }
+
+@event.listens_for(OrmSession, "after_flush")
+def collect_new_notifications(session, flush_context):
+    # Ids and created_at are populated by now; the objects are expired after commit
+    for obj in session.new:
+        if isinstance(obj, Notification) and obj.user_id:
+            session.info.setdefault("new_notifications", []).append((obj.user_id, notification_event(obj)))
+
+@event.listens_for(OrmSession, "after_commit")
+def publish_new_notifications(session):
+    for user_id, payload in session.info.pop("new_notifications", []):
+        notification_broker.publish(user_id, payload)
+
+@event.listens_for(OrmSession, "after_rollback")
+def discard_new_notifications(session):
+    session.info.pop("new_notifications", None)
+
+
+# ----------------------------------
+# Transactional outbox
+# ----------------------------------
+def enqueue_outbox_event(db: Session, event_type: str, payload: dict):
+    """Record a side effect in the caller's transaction; nothing happens unless it commits"""
+    db.add(OutboxEvent(event_type=event_type, payload=json.dumps(payload)))
+    db.info["outbox_pending"] = True
+
+def deliver_notifications(db: Session, payloads: List[dict]):
+    # Plain ORM inserts, so the unread counters and the push channel see them
+    db.add_all([
+        Notification(
+            id=str(uuid.uuid4()),
+            user_id=p["user_id"],
+            type=p["type"],
+            title=p["title"],
+            message=p["message"],
+            related_swap_id=p.get("related_swap_id"),
+            is_read=False,
+            created_at=datetime.fromisoformat(p["created_at"]) if p.get("created_at") else datetime.utcnow(),
+        )
+        for p in payloads
+    ])
+
+OUTBOX_HANDLERS = {
+    "notification": deliver_notifications,
+}
+
+def deliver_outbox_events(db: Session, events: List[OutboxEvent]):
+    """Run the handlers for ``events`` and delete them, committing both together"""
+    by_type = defaultdict(list)
+    for e in events:
+        by_type[e.event_type].append(json.loads(e.payload))
+    for event_type, payloads in by_type.items():
+        handler = OUTBOX_HANDLERS.get(event_type)
+        if handler is None:
+            print(f"Dropping {len(payloads)} outbox events of unknown type {event_type!r}")
+            continue
+        handler(db, payloads)
+    db.query(OutboxEvent).filter(OutboxEvent.id.in_([e.id for e in events])).delete(synchronize_session=False)
+    db.commit()
+
+def claim_outbox_events(db: Session, limit: int, event_id: Optional[int] = None) -> List[OutboxEvent]:
+    # SKIP LOCKED lets several workers drain the outbox without double delivery (ignored on SQLite)
+    query = db.query(OutboxEvent).filter(OutboxEvent.attempts < OUTBOX_MAX_ATTEMPTS)
+    if event_id is not None:
+        query = query.filter(OutboxEvent.id == event_id)
+    return query.order_by(OutboxEvent.id).limit(limit).with_for_update(skip_locked=True).all()
+
+def process_outbox_batch(limit: int) -> BatchResult:
+    """Deliver up to ``limit`` outbox events, oldest first.
+
+    The batch is delivered in one transaction. If that fails, its events are
+    retried one transaction each, so only the events that fail on their own
+    are charged an attempt; after OUTBOX_MAX_ATTEMPTS they are dead-lettered
+    (left in outbox_events, no longer retried).
+    """
+    db = SessionLocal()
+    try:
+        events = claim_outbox_events(db, limit)
+        if not events:
+            return BatchResult()
+        event_ids = [e.id for e in events]
+        try:
+            deliver_outbox_events(db, events)
+            return BatchResult(delivered=len(event_ids))
+        except Exception as e:
+            db.rollback()
+            print(f"Outbox batch of {len(event_ids)} failed ({e}), retrying its events one by one")
+
+        delivered = failed = dead_lettered = 0
+        for event_id in event_ids:
+            claimed = claim_outbox_events(db, 1, event_id=event_id)
+            if not claimed:
+                continue  # taken by another worker in the meantime
+            try:
+                deliver_outbox_events(db, claimed)
+                delivered += 1
+                continue
+            except Exception as e:
+                db.rollback()
+                error = e
+            db.query(OutboxEvent).filter(OutboxEvent.id == event_id).\
+                update({"attempts": OutboxEvent.attempts + 1}, synchronize_session=False)
+            attempts = db.query(OutboxEvent.attempts).filter(OutboxEvent.id == event_id).scalar()
+            db.commit()
+            if attempts >= OUTBOX_MAX_ATTEMPTS:
+                dead_lettered += 1
+                print(f"Outbox event {event_id} dead-lettered after {attempts} attempts: {error}")
+            else:
+                failed += 1
+        return BatchResult(delivered, failed, dead_lettered)
+    finally:
+        db.close()
+
+outbox_dispatcher = OutboxDispatcher(
+    process_outbox_batch,
+    interval=OUTBOX_DISPATCH_INTERVAL_SECONDS,
+    batch_size=OUTBOX_BATCH_SIZE,
+)
+
+@event.listens_for(OrmSession, "after_commit")
+def wake_outbox_dispatcher(session):
+    if session.info.pop("outbox_pending", False):
+        outbox_dispatcher.wake()
+
+@event.listens_for(OrmSession, "after_rollback")
+def discard_outbox_pending(session):
+    session.info.pop("outbox_pending", None)
+
+@app.on_event("startup")
+def start_outbox_dispatcher():
+    outbox_dispatcher.start()
+
+@app.on_event("shutdown")
+def stop_outbox_dispatcher():
+    outbox_dispatcher.stop()
+
+@app.on_event("startup")
+def warm_platform_stats():
+    platform_stats.get()
+
+
+# ----------------------------------
+# Precomputed recommendations
+# ----------------------------------
+# Affinity weight of each signal
+SWAP_AFFINITY = 3.0
+VIEW_AFFINITY = 1.0
+
+def load_recommendation_snapshot() -> RecommendationSnapshot:
+    """Build candidate lists and user affinities from swaps, views and ratings"""
+    db = SessionLocal()
+    try:
+        # Most viewed available items per category
+        candidates = defaultdict(list)
+        for item_id, category_id, owner_id, views in db.query(
+            Item.id, Item.category_id, Item.user_id, Item.view_count
+        ).filter(Item.is_approved == True, Item.is_available == True).\
+                order_by(Item.view_count.desc()).yield_per(1000):
+            bucket = candidates[category_id]
+            if len(bucket) < RECOMMENDATION_CANDIDATES_PER_CATEGORY:
+                bucket.append((item_id, owner_id, views or 0))
+
+        candidate_ids = [c[0] for bucket in candidates.values() for c in bucket]
+        item_tags = defaultdict(list)
+        for start in range(0, len(candidate_ids), 500):
+            for item_id, tag_id in db.query(ItemTag.item_id, ItemTag.tag_id).\
+                    filter(ItemTag.item_id.in_(candidate_ids[start:start + 500])):
+                item_tags[item_id].append(tag_id)
+
+        category_affinity = defaultdict(lambda: defaultdict(float))
+        tag_affinity = defaultdict(lambda: defaultdict(float))
+
+        # Swaps: both items of every swap a user took part in
+        for party in (Swap.initiator_id, Swap.recipient_id):
+            for side in (Swap.initiator_item_id, Swap.recipient_item_id):
+                for user_id, category_id, n in db.query(party, Item.category_id, func.count(Swap.id)).\
+                        join(Item, Item.id == side).group_by(party, Item.category_id):
+                    category_affinity[user_id][category_id] += SWAP_AFFINITY * n
+                for user_id, tag_id, n in db.query(party, ItemTag.tag_id, func.count(Swap.id)).\
+                        join(ItemTag, ItemTag.item_id == side).group_by(party, ItemTag.tag_id):
+                    tag_affinity[user_id][tag_id] += SWAP_AFFINITY * n
+
+        # Recent item views by signed-in users
+        since = datetime.utcnow() - timedelta(days=RECOMMENDATION_VIEW_WINDOW_DAYS)
+        for user_id, category_id, n in db.query(ItemViewLog.user_id, Item.category_id, func.count(ItemViewLog.id)).\
+                join(Item, Item.id == ItemViewLog.item_id).\
+                filter(ItemViewLog.user_id.isnot(None), ItemViewLog.created_at >= since).\
+                group_by(ItemViewLog.user_id, Item.category_id):
+            category_affinity[user_id][category_id] += VIEW_AFFINITY * n
+        for user_id, tag_id, n in db.query(ItemViewLog.user_id, ItemTag.tag_id, func.count(ItemViewLog.id)).\
+                join(ItemTag, ItemTag.item_id == ItemViewLog.item_id).\
+                filter(ItemViewLog.user_id.isnot(None), ItemViewLog.created_at >= since).\
+                group_by(ItemViewLog.user_id, ItemTag.tag_id):
+            tag_affinity[user_id][tag_id] += VIEW_AFFINITY * n
+
+        # Ratings after a swap: the item the rater received, +2..-2 around a neutral 3 stars
+        for party, received in ((Swap.initiator_id, Swap.recipient_item_id), (Swap.recipient_id, Swap.initiator_item_id)):
+            for user_id, category_id, score in db.query(Rating.rater_id, Item.category_id, func.sum(Rating.rating - 3)).\
+                    join(Swap, and_(Swap.id == Rating.swap_id, party == Rating.rater_id)).\
+                    join(Item, Item.id == received).\
+                    group_by(Rating.rater_id, Item.category_id):
+                category_affinity[user_id][category_id] += score or 0
+
+        return RecommendationSnapshot(dict(candidates), dict(item_tags), category_affinity, tag_affinity)
+    finally:
+        db.close()
+
+recommendation_engine = RecommendationEngine(
+    load_recommendation_snapshot,
+    refresh_interval=RECOMMENDATION_REFRESH_SECONDS,
+    cache_ttl=RECOMMENDATION_CACHE_TTL_SECONDS,
+)
+
+@app.on_event("startup")
+def start_recommendation_engine():
+    recommendation_engine.start()
+
+@app.on_event("shutdown")
+def stop_recommendation_engine():
+    recommendation_engine.stop()
+
+
+# ----------------------------------
+# "More like this" similarity index
+# ----------------------------------
+similarity_index = SimilarityIndex(dim=SIMILARITY_DIM)
+
+def similarity_listing(item, tags) -> dict:
+    return {
+        "title": item.title,
+        "description": item.description,
+        "brand": item.brand,
+        "color": item.color,
+        "material": item.material,
+        "category_id": item.category_id,
+        "tags": tags,
+    }
+
+def approved_listings(db: Session):
+    """(item id, similarity listing) of every approved item, in keyset batches so tag lookups stay bounded"""
+    last_id = ""
+    while True:
+        items = db.query(
+            Item.id, Item.title, Item.description, Item.brand, Item.color, Item.material, Item.category_id
+        ).filter(Item.is_approved == True, Item.id > last_id).order_by(Item.id).limit(1000).all()
+        if not items:
+            return
+        tags = defaultdict(list)
+        for item_id, name in db.query(ItemTag.item_id, Tag.name).join(Tag, Tag.id == ItemTag.tag_id).\
+                filter(ItemTag.item_id.in_([i.id for i in items])):
+            tags[item_id].append(name)
+        for i in items:
+            yield i.id, similarity_listing(i, tags[i.id])
+        last_id = items[-1].id
+
+def load_similarity_index():
+    """Rebuild the index from the database; approve/remove in this worker keep it current in between"""
+    db = SessionLocal()
+    try:
+        similarity_index.rebuild(approved_listings(db))
+    except Exception as e:
+        print(f"Similarity index build error: {e}")
+    finally:
+        db.close()
+
+similarity_refresh_stopped = threading.Event()
+
+def refresh_similarity_index():
+    load_similarity_index()
+    while not similarity_refresh_stopped.wait(SIMILARITY_REFRESH_SECONDS):
+        load_similarity_index()
+
+@app.on_event("startup")
+def build_similarity_index():
+    similarity_refresh_stopped.clear()
+    threading.Thread(target=refresh_similarity_index, name="similarity-index", daemon=True).start()
+
+@app.on_event("shutdown")
+def stop_similarity_refresh():
+    similarity_refresh_stopped.set()
 
 # Pydantic Schemas
 class UserCreate(BaseModel):
@@ -367,6 +1144,19 @@ class UserOut(BaseModel):
     class Config:
         from_attributes = True
 
+class Principal(BaseModel):
+    """Read-only snapshot of the authenticated user, served from principal_cache"""
+    id: str
+    email: str
+    first_name: Optional[str] = None
+    last_name: Optional[str] = None
+    is_admin: bool = False
+    is_verified: bool = False
+    points_balance: int = 0
+
+    class Config:
+        from_attributes = True
+
 class Token(BaseModel):
     access_token: str
     token_type: str
@@ -494,23 +1284,202 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
+def password_hashing_overloaded():
+    return HTTPException(
+        status_code=503,
+        detail="Server is busy, please try again shortly",
+        headers={"Retry-After": "1"},
+    )
+
 def verify_password(plain, hashed):
-    return pwd_context.verify(plain, hashed)
+    try:
+        return password_hasher.verify(plain, hashed)
+    except HasherOverloaded:
+        raise password_hashing_overloaded()
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    try:
+        return password_hasher.hash(password)
+    except HasherOverloaded:
+        raise password_hashing_overloaded()
 
-oauth2_scheme_optional = OAuth2PasswordBearer(tokenUrl="token", auto_error=False)
+def credentials_exception():
+    return HTTPException(
+        status_code=401,
+        detail="Could not validate credentials",
+    )
+
+STREAM_TICKET_SCOPE = "notification_stream"
 
-def get_current_user_optional(token: str = Depends(oauth2_scheme_optional), db: Session = Depends(get_db)):
+def decode_token_payload(token: str, scope: Optional[str] = None) -> dict:
+    """Verified claims of a JWT; access tokens carry no scope, so a stream ticket is not accepted as one"""
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: Optional[str] = payload.get("sub")
-        if not user_id:
-            return None
-        return db.query(User).filter(User.id == user_id).first()
-    except:
+    except JWTError:
+        raise credentials_exception()
+    if payload.get("sub") is None or payload.get("scope") != scope:
+        raise credentials_exception()
+    return payload
+
+def decode_token_subject(token: str) -> str:
+    return decode_token_payload(token)["sub"]
+
+principal_cache = TTLCache(maxsize=PRINCIPAL_CACHE_SIZE, ttl=PRINCIPAL_CACHE_TTL_SECONDS)
+
+def get_current_principal(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> Principal:
+    """Like get_current_user, but skips the user lookup while the principal is cached.
+
+    Returns a detached snapshot, so use get_current_user for handlers that modify the user.
+    """
+    return lookup_principal(db, decode_token_subject(token))
+
+def lookup_principal(db: Session, email: str) -> Principal:
+    principal = principal_cache.get(email)
+    if principal is None:
+        user = db.query(User).filter(User.email == email).first()
+        if user is None:
+            raise credentials_exception()
+        principal = Principal.model_validate(user)
+        principal_cache.set(email, principal)
+    return principal
+
+def invalidate_principal(*emails: str):
+    """Drop cached principals after the user row changed (ban/unban, profile, points)"""
+    for email in emails:
+        principal_cache.pop(email)
+
+def encode_cursor(sort_value, item_id: str) -> str:
+    """Opaque keyset cursor holding the (sort key, id) of the last row on a page"""
+    if isinstance(sort_value, datetime):
+        sort_value = sort_value.isoformat()
+    raw = json.dumps([sort_value, item_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_value, item_id = json.loads(base64.urlsafe_b64decode(padded))
+        return sort_value, item_id
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+async def save_item_images(item_id: str, images: List[UploadFile]):
+    """Stream uploaded images into the blob store and build their ItemImage rows (first image is primary).
+
+    Identical photos share one blob; it is only reclaimed by gc_images.py once
+    no ItemImage row references its hash. Returns the (ItemImage, path) pairs
+    and the blobs this call created, for discard_new_blobs if the item's
+    transaction fails.
+    """
+    budget = UploadBudget(UPLOAD_MAX_FILE_BYTES, UPLOAD_MAX_REQUEST_BYTES)
+    saved, new_blobs = [], []
+    try:
+        for idx, img in enumerate(images):
+            tmp_path, digest = await stream_upload_to_disk(img, os.path.join(UPLOAD_DIR, "tmp"), budget)
+            path, created_mtime = await run_in_threadpool(blob_store.put, tmp_path, digest)
+            if created_mtime is not None:
+                new_blobs.append((digest, created_mtime))
+            image = ItemImage(
+                id=str(uuid.uuid4()),
+                item_id=item_id,
+                image_url=blob_store.url_for(digest),
+                content_hash=digest,
+                is_primary=(idx == 0)
+            )
+            saved.append((image, path))
+    except BaseException:
+        # e.g. the third image is too large: the first two must not stay behind
+        await run_in_threadpool(discard_new_blobs, new_blobs)
+        raise
+    return saved, new_blobs
+
+def discard_new_blobs(new_blobs):
+    """Remove blobs written for an item that was never committed; blobs re-used by another upload since are kept"""
+    for digest, created_mtime in new_blobs:
+        blob_store.discard(digest, created_mtime)
+
+tag_id_cache = TTLCache(maxsize=TAG_CACHE_SIZE, ttl=TAG_CACHE_TTL_SECONDS)
+
+def insert_ignore_conflicts(db: Session, table):
+    """INSERT ... ON CONFLICT DO NOTHING where the dialect supports it"""
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert(table).on_conflict_do_nothing()
+    if dialect == "sqlite":
+        return sqlite.insert(table).on_conflict_do_nothing()
+    return table.insert()
+
+def resolve_tag_ids(db: Session, names: List[str]) -> Dict[str, str]:
+    """Map tag names to ids, creating missing tags: one SELECT ... IN plus one bulk INSERT at most"""
+    ids = {}
+    for name in names:
+        tag_id = tag_id_cache.get(name)
+        if tag_id:
+            ids[name] = tag_id
+    missing = [name for name in names if name not in ids]
+    if not missing:
+        return ids
+
+    ids.update({name: tag_id for tag_id, name in db.query(Tag.id, Tag.name).filter(Tag.name.in_(missing))})
+    new_names = [name for name in missing if name not in ids]
+    if new_names:
+        db.execute(
+            insert_ignore_conflicts(db, Tag.__table__),
+            [{"id": str(uuid.uuid4()), "name": name} for name in new_names],
+        )
+        # Re-read: a concurrent request may have created some of them first
+        ids.update({name: tag_id for tag_id, name in db.query(Tag.id, Tag.name).filter(Tag.name.in_(new_names))})
+
+    # Cached only once this transaction commits: a rolled-back insert must not leave phantom ids behind
+    db.info.setdefault("tag_ids_to_cache", {}).update({name: ids[name] for name in missing})
+    return ids
+
+@event.listens_for(OrmSession, "after_commit")
+def cache_committed_tag_ids(session):
+    for name, tag_id in session.info.pop("tag_ids_to_cache", {}).items():
+        tag_id_cache.set(name, tag_id)
+
+@event.listens_for(OrmSession, "after_rollback")
+def discard_uncommitted_tag_ids(session):
+    session.info.pop("tag_ids_to_cache", None)
+
+def attach_tags(db: Session, item_id: str, tag_names: List[str]):
+    """Link an item to its tags with a single bulk INSERT into item_tags"""
+    tag_names = list(dict.fromkeys(tag_names))
+    if not tag_names:
+        return
+    tag_ids = resolve_tag_ids(db, tag_names)
+    db.execute(
+        ItemTag.__table__.insert(),
+        [{"id": str(uuid.uuid4()), "item_id": item_id, "tag_id": tag_ids[name]} for name in tag_names],
+    )
+
+def generate_item_thumbnails(images):
+    """Background task: write WebP thumbnails and record them on ItemImage"""
+    db = SessionLocal()
+    try:
+        for image_id, path in images:
+            thumb_path = make_thumbnail(path, THUMBNAIL_MAX_SIDE)
+            if thumb_path:
+                db.query(ItemImage).filter(ItemImage.id == image_id).update(
+                    {"thumbnail_url": "/" + thumb_path.replace(os.sep, "/")}
+                )
+        db.commit()
+    finally:
+        db.close()
+
+oauth2_scheme_optional = OAuth2PasswordBearer(tokenUrl="token", auto_error=False)
+
+def get_current_user_optional(token: Optional[str] = Depends(oauth2_scheme_optional), db: Session = Depends(get_db)):
+    """The signed-in user, or None for anonymous requests and invalid tokens"""
+    if not token:
         return None
+    try:
+        # Same resolution as get_current_user: the token subject is the email
+        email = decode_token_subject(token)
+    except HTTPException:
+        return None
+    return db.query(User).filter(User.email == email).first()
 def create_notification(
     db: Session,
     user_id: str,
@@ -519,17 +1488,15 @@ def create_notification(
     message: str,
     related_swap_id: str,
 ):
-    notif = Notification(
-        userId=user_id,
-        type=notif_type,
-        title=title,
-        message=message,
-        relatedSwapId=related_swap_id,
-        isRead=False,
-        createdAt=datetime.utcnow(),
-    )
-    db.add(notif)
-    db.commit()
+    """Queue a notification in the caller's transaction; the outbox dispatcher creates it after commit"""
+    enqueue_outbox_event(db, "notification", {
+        "user_id": user_id,
+        "type": notif_type,
+        "title": title,
+        "message": message,
+        "related_swap_id": related_swap_id,
+        "created_at": datetime.utcnow().isoformat(),
+    })
 
 def create_point_transaction(
     db: Session,
@@ -539,74 +1506,86 @@ def create_point_transaction(
     description: str,
     related_swap_id: str,
 ):
-    pt = PointTransaction(
-        userId=user_id,
-        transactionType=transaction_type,
+    """Add a ledger row to the caller's transaction (committed together with the balance change)"""
+    db.add(PointTransaction(
+        id=str(uuid.uuid4()),
+        user_id=user_id,
+        transaction_type=transaction_type,
         amount=amount,
         description=description,
-        relatedSwapId=related_swap_id,
-        createdAt=datetime.utcnow(),
-    )
-    db.add(pt)
-    db.commit()
+        related_swap_id=related_swap_id,
+    ))
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    credentials_exception = HTTPException(
-        status_code=401,
-        detail="Could not validate credentials",
+def transfer_points(db: Session, from_user_id: str, to_user_id: str, amount: int):
+    """Move points between users with two guarded UPDATEs in the caller's transaction.
+
+    The balance check is part of the debit statement, so concurrent spends can
+    never take a balance below zero or lose an update.
+    """
+    if not amount or amount <= 0:
+        # A zero or negative "payment" would move points the other way
+        raise HTTPException(status_code=400, detail="Points amount must be positive")
+    debited = db.query(User).filter(User.id == from_user_id, User.points_balance >= amount).update(
+        {User.points_balance: User.points_balance - amount},
+        synchronize_session=False,
+    )
+    if debited != 1:
+        raise HTTPException(status_code=400, detail="Insufficient points")
+    db.query(User).filter(User.id == to_user_id).update(
+        {User.points_balance: User.points_balance + amount},
+        synchronize_session=False,
     )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: Optional[str] = payload.get("sub")
-        if email is None:
-            raise credentials_exception
-    except JWTError:
-        raise credentials_exception
 
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    email = decode_token_subject(token)
     user = db.query(User).filter(User.email == email).first()
     if user is None:
-        raise credentials_exception
+        raise credentials_exception()
     return user
 
 @app.put("/swaps/{swap_id}/status")
 def update_swap_status(
     swap_id: str,
     status_update: SwapStatusUpdate,
-    background_tasks: BackgroundTasks,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
+    """Change a swap's status; notifications and point transactions are committed with it"""
     allowed_statuses = {"ACCEPTED", "REJECTED", "CANCELLED", "COMPLETED"}
     new_status = status_update.status.upper()
 
     if new_status not in allowed_statuses:
         raise HTTPException(status_code=400, detail="Invalid status")
 
-    swap = db.query(Swap).filter(Swap.id == swap_id).first()
+    # Row locks on PostgreSQL; elsewhere the version columns reject the losing request at commit
+    swap = db.query(Swap).filter(Swap.id == swap_id).with_for_update().first()
     if not swap:
         raise HTTPException(status_code=404, detail="Swap not found")
 
-    if current_user.id not in [swap.initiatorId, swap.recipientId]:
+    if current_user.id not in [swap.initiator_id, swap.recipient_id]:
         raise HTTPException(status_code=403, detail="Not authorized to update this swap")
 
+    balance_changed_emails = []
+
     # Fetch items for points & ownership update
-    initiator_item = db.query(Item).filter(Item.id == swap.initiatorItemId).first()
-    recipient_item = db.query(Item).filter(Item.id == swap.recipientItemId).first()
+    initiator_item = db.query(Item).filter(Item.id == swap.initiator_item_id).with_for_update().first()
+    recipient_item = db.query(Item).filter(Item.id == swap.recipient_item_id).with_for_update().first()
 
     if new_status == "ACCEPTED":
         if swap.status != "PENDING":
             raise HTTPException(status_code=400, detail="Swap is not pending")
-        if current_user.id != swap.recipientId:
+        if current_user.id != swap.recipient_id:
             raise HTTPException(status_code=403, detail="Only recipient can accept")
+        if not (initiator_item.is_available and recipient_item.is_available):
+            raise HTTPException(status_code=409, detail="One of the items is no longer available")
         swap.status = "ACCEPTED"
-        initiator_item.isAvailable = False
-        recipient_item.isAvailable = False
+        initiator_item.is_available = False
+        recipient_item.is_available = False
 
         # Notify initiator that recipient accepted swap
-        background_tasks.add_task(
-            create_notification,
-            db=db,
-            user_id=swap.initiatorId,
+        create_notification(
+            db,
+            user_id=swap.initiator_id,
             notif_type="SWAP_ACCEPTED",
             title="Swap Request Accepted",
             message=f"Your swap request {swap.id} has been accepted.",
@@ -616,15 +1595,14 @@ def update_swap_status(
     elif new_status == "REJECTED":
         if swap.status != "PENDING":
             raise HTTPException(status_code=400, detail="Swap is not pending")
-        if current_user.id != swap.recipientId:
+        if current_user.id != swap.recipient_id:
             raise HTTPException(status_code=403, detail="Only recipient can reject")
         swap.status = "REJECTED"
 
         # Notify initiator about rejection
-        background_tasks.add_task(
-            create_notification,
-            db=db,
-            user_id=swap.initiatorId,
+        create_notification(
+            db,
+            user_id=swap.initiator_id,
             notif_type="SWAP_REJECTED",
             title="Swap Request Rejected",
             message=f"Your swap request {swap.id} has been rejected.",
@@ -637,10 +1615,9 @@ def update_swap_status(
         swap.status = "CANCELLED"
 
         # Notify other party
-        other_user_id = swap.recipientId if current_user.id == swap.initiatorId else swap.initiatorId
-        background_tasks.add_task(
-            create_notification,
-            db=db,
+        other_user_id = swap.recipient_id if current_user.id == swap.initiator_id else swap.initiator_id
+        create_notification(
+            db,
             user_id=other_user_id,
             notif_type="SWAP_REJECTED",  # Use same type for cancellation notification
             title="Swap Cancelled",
@@ -651,49 +1628,45 @@ def update_swap_status(
     elif new_status == "COMPLETED":
         if swap.status != "ACCEPTED":
             raise HTTPException(status_code=400, detail="Swap not accepted yet")
-        if current_user.id != swap.initiatorId:
+        if current_user.id != swap.initiator_id:
             raise HTTPException(status_code=403, detail="Only initiator can complete the swap")
         swap.status = "COMPLETED"
 
         # Transfer ownership
-        initiator_item.userId, recipient_item.userId = recipient_item.userId, initiator_item.userId
-        initiator_item.isAvailable = True
-        recipient_item.isAvailable = True
-
-        # Handle points exchange (example: initiator pays pointsExchanged)
-        if swap.pointsExchanged > 0:
-            # Deduct points from initiator
-            initiator = db.query(User).filter(User.id == swap.initiatorId).first()
-            recipient = db.query(User).filter(User.id == swap.recipientId).first()
-
-            initiator.pointsBalance -= swap.pointsExchanged
-            recipient.pointsBalance += swap.pointsExchanged
+        initiator_item.user_id, recipient_item.user_id = recipient_item.user_id, initiator_item.user_id
+        initiator_item.is_available = True
+        recipient_item.is_available = True
+
+        # Handle points exchange (example: initiator pays points_exchanged)
+        if swap.points_exchanged and swap.points_exchanged > 0:
+            # Initiator pays the recipient; fails with 400 if the initiator can no longer afford it
+            transfer_points(db, swap.initiator_id, swap.recipient_id, swap.points_exchanged)
+            balance_changed_emails = [
+                email for (email,) in db.query(User.email).filter(User.id.in_([swap.initiator_id, swap.recipient_id]))
+            ]
 
             # Create point transactions
-            background_tasks.add_task(
-                create_point_transaction,
-                db=db,
-                user_id=initiator.id,
+            create_point_transaction(
+                db,
+                user_id=swap.initiator_id,
                 transaction_type="SPENT",
-                amount=swap.pointsExchanged,
+                amount=swap.points_exchanged,
                 description=f"Points spent on swap {swap.id}",
                 related_swap_id=swap.id,
             )
-            background_tasks.add_task(
-                create_point_transaction,
-                db=db,
-                user_id=recipient.id,
+            create_point_transaction(
+                db,
+                user_id=swap.recipient_id,
                 transaction_type="EARNED",
-                amount=swap.pointsExchanged,
+                amount=swap.points_exchanged,
                 description=f"Points earned from swap {swap.id}",
                 related_swap_id=swap.id,
             )
-        
+
         # Notify both parties about completion
-        for user_id in [swap.initiatorId, swap.recipientId]:
-            background_tasks.add_task(
-                create_notification,
-                db=db,
+        for user_id in [swap.initiator_id, swap.recipient_id]:
+            create_notification(
+                db,
                 user_id=user_id,
                 notif_type="SWAP_ACCEPTED",
                 title="Swap Completed",
@@ -701,19 +1674,19 @@ def update_swap_status(
                 related_swap_id=swap.id,
             )
 
-    swap.updatedAt = datetime.utcnow()
+    swap.updated_at = datetime.utcnow()
+    # One commit for the status change, item updates, ledger rows and outbox events
     db.commit()
-    db.refresh(swap)
+    invalidate_principal(*balance_changed_emails)
 
     return {"message": f"Swap status updated to {swap.status}"}
 
 
-def require_admin(user: User = Depends(get_current_user)):
+def require_admin(user: Principal = Depends(get_current_principal)):
     if not user.is_admin:
         raise HTTPException(status_code=403, detail="Admin privileges required")
     return user
-def spam_detection_prompt(title: str, description: str) -> str:
-    return f"""
+MODERATION_RULES = """
 You are an AI moderator for a clothing swapping platform.
 
 Evaluate the following item listing based on its **description and title**.
@@ -726,30 +1699,194 @@ Flag the item if it:
 - Appears to be a duplicate of previously submitted items (assume context if needed).
 - Promotes ads, services, or anything beyond personal clothing swaps.
 - Contains unsafe or illegal content.
+"""
 
+def spam_detection_prompt(title: str, description: str) -> str:
+    return f"""{MODERATION_RULES}
 Reply only with one word: **FLAG** or **OK**
 
 ---
 Title: {title}
 Description: {description}
 """
-def check_if_spam_with_ai(title: str, description: str) -> bool:
-    prompt = spam_detection_prompt(title, description)
+
+def batch_spam_detection_prompt(listings) -> str:
+    """The same moderation rules for several listings at once, answered one numbered line per listing"""
+    entries = "\n".join(
+        f"[{i}]\nTitle: {title}\nDescription: {description}\n" for i, (title, description) in enumerate(listings, 1)
+    )
+    return f"""{MODERATION_RULES}
+Evaluate each numbered listing on its own.
+Reply with exactly one line per listing, in the form `<number>: FLAG` or `<number>: OK`, and nothing else.
+
+---
+{entries}"""
+
+moderation_cache = TTLCache(maxsize=MODERATION_CACHE_SIZE, ttl=MODERATION_CACHE_TTL_SECONDS)
+
+def moderation_cache_key(title: str, description: str) -> str:
+    """Hash of the listing text with case and whitespace normalized away"""
+    normalized = "\x00".join(" ".join((part or "").lower().split()) for part in (title, description))
+    return hashlib.sha256(normalized.encode()).hexdigest()
+
+def get_cached_verdict(key: str) -> Optional[bool]:
+    verdict = moderation_cache.get(key)
+    if verdict is not None or not MODERATION_CACHE_DB:
+        return verdict
+    db = SessionLocal()
+    try:
+        row = db.query(ModerationVerdict).filter(
+            ModerationVerdict.content_hash == key,
+            ModerationVerdict.created_at >= datetime.utcnow() - timedelta(seconds=MODERATION_CACHE_TTL_SECONDS)
+        ).first()
+        if row is None:
+            return None
+        moderation_cache.set(key, row.is_flagged, backfill=True)
+        return row.is_flagged
+    finally:
+        db.close()
+
+def store_verdict(key: str, is_flagged: bool):
+    moderation_cache.set(key, is_flagged)
+    if not MODERATION_CACHE_DB:
+        return
+    db = SessionLocal()
+    try:
+        db.merge(ModerationVerdict(content_hash=key, is_flagged=is_flagged, created_at=datetime.utcnow()))
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        print(f"Moderation cache write error: {e}")
+    finally:
+        db.close()
+
+def check_if_spam_with_ai(title: str, description: str) -> Optional[bool]:
+    """True / False verdict, or None when Gemini could not be asked (the listing stays unchecked)"""
+    return gemini_classifier([(title, description)])[0]
+
+def gemini_classifier(listings) -> List[Optional[bool]]:
+    """Score a moderation batch with one Gemini call; cached listings are not sent again.
+
+    A listing Gemini did not answer for (API error, malformed reply) gets None
+    instead of a verdict, so it is neither cached nor marked as checked.
+    """
+    keys = [moderation_cache_key(title, description) for title, description in listings]
+    verdicts = [get_cached_verdict(key) for key in keys]
+    unscored = [i for i, verdict in enumerate(verdicts) if verdict is None]
+    if not unscored:
+        return verdicts
+
     model = genai.GenerativeModel("gemini-pro")
     try:
-        response = model.generate_content(prompt)
-        decision = response.text.strip().upper()
-        return decision == "FLAG"
+        response = model.generate_content(batch_spam_detection_prompt([listings[i] for i in unscored]))
+        answers = parse_batch_verdicts(response.text, len(unscored))
     except Exception as e:
         print(f"Gemini error: {e}")
-        return False  # Fail-safe: allow item if AI fails
+        return verdicts
+
+    for i, is_flagged in zip(unscored, answers):
+        if is_flagged is not None:
+            verdicts[i] = is_flagged
+            store_verdict(keys[i], is_flagged)
+    return verdicts
+
+def save_moderation_results(results: Dict[str, bool]):
+    """Store a batch of AI verdicts; items already reviewed by an admin are left alone"""
+    items_table = Item.__table__
+    db = SessionLocal()
+    try:
+        db.execute(
+            items_table.update()
+            .where(items_table.c.id == bindparam("b_item_id"), items_table.c.ai_checked_at.is_(None))
+            .values(is_flagged_by_ai=bindparam("b_flagged"), ai_checked_at=datetime.utcnow()),
+            [{"b_item_id": item_id, "b_flagged": flagged} for item_id, flagged in results.items()],
+        )
+        db.commit()
+        # Bulk UPDATE bypasses the flush hooks; the periodic recount corrects any overcount
+        platform_stats.apply({"flagged_items": sum(results.values())})
+    finally:
+        db.close()
+
+moderation_queue = ModerationQueue(
+    KeywordClassifier() if MODERATION_CLASSIFIER == "keyword" else gemini_classifier,
+    save_moderation_results,
+    workers=MODERATION_WORKERS,
+    batch_size=MODERATION_BATCH_SIZE,
+)
+
+def moderation_lease(attempts: int) -> datetime:
+    """Until when a listing claimed for its next try (after ``attempts`` earlier ones) belongs to this worker"""
+    return datetime.utcnow() + timedelta(seconds=retry_delay(attempts, MODERATION_RETRY_SECONDS, MODERATION_RETRY_MAX_SECONDS))
+
+def claim_unscored_items(db: Session, limit: int):
+    """Claim up to ``limit`` unscored listings whose lease expired; returns their (id, title, description).
+
+    Each claim is an UPDATE guarded on the old lease, so when several workers
+    sweep at once every listing is claimed by exactly one of them.
+    """
+    now = datetime.utcnow()
+    due = or_(Item.moderation_retry_at.is_(None), Item.moderation_retry_at <= now)
+    candidates = (
+        db.query(Item.id, Item.title, Item.description, Item.moderation_attempts)
+        .filter(Item.ai_checked_at.is_(None), Item.is_approved == False, due)
+        .order_by(Item.created_at)
+        .limit(limit)
+        .all()
+    )
+    claimed = []
+    for item_id, title, description, attempts in candidates:
+        won = db.query(Item).filter(Item.id == item_id, Item.ai_checked_at.is_(None), due).update(
+            {"moderation_retry_at": moderation_lease(attempts), "moderation_attempts": Item.moderation_attempts + 1},
+            synchronize_session=False,
+        )
+        if won:
+            claimed.append((item_id, title, description))
+    db.commit()
+    return claimed
+
+def requeue_unscored_items():
+    """Hand this worker's share of due listings to its queue, keeping at most a few batches per thread queued"""
+    room = MODERATION_BATCH_SIZE * MODERATION_WORKERS * 4 - moderation_queue.pending()
+    if room <= 0:
+        return
+    db = SessionLocal()
+    try:
+        for item_id, title, description in claim_unscored_items(db, room):
+            moderation_queue.submit(item_id, title, description)
+    except Exception as e:
+        print(f"Moderation retry sweep failed: {e}")
+    finally:
+        db.close()
+
+moderation_sweep_stopped = threading.Event()
+
+def sweep_unscored_items():
+    # Also picks up listings left pending by the last shutdown or by a worker that died
+    requeue_unscored_items()
+    while not moderation_sweep_stopped.wait(MODERATION_SWEEP_SECONDS):
+        requeue_unscored_items()
+
+@app.on_event("startup")
+def start_moderation_queue():
+    moderation_queue.start()
+    moderation_sweep_stopped.clear()
+    threading.Thread(target=sweep_unscored_items, name="moderation-sweep", daemon=True).start()
+
+@app.on_event("shutdown")
+def stop_moderation_queue():
+    moderation_sweep_stopped.set()
+    moderation_queue.stop()
+
+@app.on_event("shutdown")
+def stop_password_hasher():
+    password_hasher.shutdown()
 
 
 
 
 
 @app.get("/me", response_model=UserOut)
-def get_my_profile(current_user: User = Depends(get_current_user)):
+def get_my_profile(current_user: Principal = Depends(get_current_principal)):
     return current_user
 
 
@@ -774,13 +1911,21 @@ def signup(user: UserCreate, db: Session = Depends(get_db)):
 @app.post("/login", response_model=Token)
 def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
     user = db.query(User).filter(User.email == form_data.username).first()
-    if not user or not verify_password(form_data.password, user.password_hash):
+    if not user:
         raise HTTPException(status_code=401, detail="Invalid credentials")
+    try:
+        valid, new_hash = password_hasher.verify_and_update(form_data.password, user.password_hash)
+    except HasherOverloaded:
+        raise password_hashing_overloaded()
+    if not valid:
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+    if new_hash:
+        # BCRYPT_ROUNDS changed since this password was hashed
+        user.password_hash = new_hash
+        db.commit()
 
     access_token = create_access_token(data={"sub": user.email})
     return {"access_token": access_token, "token_type": "bearer"}
-<<<<<<< Updated upstream
-=======
 
 @app.post("/items")
 async def create_item(
@@ -796,14 +1941,13 @@ async def create_item(
     points_value: Optional[int] = Form(0),
     tags: Optional[str] = Form(""),
     images: List[UploadFile] = File(...),
+    background_tasks: BackgroundTasks = None,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
+    new_blobs = []
     try:
-        # Check if spam using AI
-        is_flagged = check_if_spam_with_ai(title, description or "")
-        
-        # Create Item
+        # Create Item (AI spam check runs later in the moderation queue)
         item = Item(
             id=str(uuid.uuid4()),
             title=title,
@@ -817,78 +1961,72 @@ async def create_item(
             material=material,
             points_value=points_value,
             user_id=current_user.id,
-            is_flagged_by_ai=is_flagged
+            is_flagged_by_ai=False,
+            # Claimed by this worker's queue; the retry sweep takes over if it is not scored in time
+            moderation_retry_at=moderation_lease(0),
+            moderation_attempts=1,
         )
-        db.add(item)
-        db.commit()
-        db.refresh(item)
 
-        # Save Images
-        for idx, img in enumerate(images):
-            img_bytes = await img.read()
-            filename = f"{uuid.uuid4()}.jpg"
-            filepath = f"static/uploads/{filename}"
-            os.makedirs(os.path.dirname(filepath), exist_ok=True)
-            with open(filepath, "wb") as f:
-                f.write(img_bytes)
+        # Save Images (streamed to disk before any DB write, so oversized uploads fail cheaply)
+        saved_images, new_blobs = await save_item_images(item.id, images)
 
-            image = ItemImage(
-                id=str(uuid.uuid4()),
-                item_id=item.id,
-                image_url=f"/static/uploads/{filename}",
-                is_primary=(idx == 0)
-            )
+        # Item, images and tags are committed together
+        db.add(item)
+        db.flush()
+
+        for image, _ in saved_images:
             db.add(image)
 
         # Tags
         tag_list = [t.strip() for t in (tags or "").split(",") if t.strip()]
-        for tag_name in tag_list:
-            tag = db.query(Tag).filter(Tag.name == tag_name).first()
-            if not tag:
-                tag = Tag(id=str(uuid.uuid4()), name=tag_name)
-                db.add(tag)
-                db.flush()
-            item_tag = ItemTag(id=str(uuid.uuid4()), item_id=item.id, tag_id=tag.id)
-            db.add(item_tag)
+        attach_tags(db, item.id, tag_list)
 
+        index_item(db, item)
         db.commit()
 
-        return {"message": "Item created successfully", "item_id": item.id, "flagged_by_ai": is_flagged}
-
+    except HTTPException:
+        db.rollback()
+        await run_in_threadpool(discard_new_blobs, new_blobs)
+        raise
     except Exception as e:
         db.rollback()
+        await run_in_threadpool(discard_new_blobs, new_blobs)
         raise HTTPException(status_code=500, detail=f"Failed to create item: {e}")
 
+    moderation_queue.submit(item.id, item.title, item.description)
+    background_tasks.add_task(generate_item_thumbnails, [(image.id, path) for image, path in saved_images])
+
+    return {"message": "Item created successfully", "item_id": item.id, "flagged_by_ai": None, "moderation_status": "pending"}
+
 @app.get("/items/{item_id}", response_model=ItemDetailResponse)
->>>>>>> Stashed changes
 def get_item_detail(
     item_id: str,
     db: Session = Depends(get_db),
     request: Request = None,
     current_user: Optional[User] = Depends(get_current_user_optional),
 ):
+    # Load everything the response touches up front instead of lazily per relationship
     item = (
         db.query(Item)
-        .filter(Item.id == item_id, Item.isApproved == True)
+        .options(
+            joinedload(Item.category),
+            joinedload(Item.user),
+            selectinload(Item.images),
+            selectinload(Item.item_tags).joinedload(ItemTag.tag),
+        )
+        .filter(Item.id == item_id, Item.is_approved == True)
         .first()
     )
     if not item:
         raise HTTPException(status_code=404, detail="Item not found or not approved")
 
-    # Increment view count
-    item.view_count += 1
-    db.commit()
-
-    # Optional: Log view
-    view_log = ItemViewLog(
-        id=str(uuid.uuid4()),
-        item_id=item.id,
+    # Count the view and log it; both are written later by the view buffer
+    view_buffer.record(
+        item.id,
         user_id=current_user.id if current_user else None,
         user_agent=request.headers.get("user-agent") if request else None,
-        ip_address=request.client.host if request else None,
+        ip_address=request.client.host if request and request.client else None,
     )
-    db.add(view_log)
-    db.commit()
 
     return ItemDetailResponse(
         id=item.id,
@@ -909,18 +2047,65 @@ def get_item_detail(
             "id": item.category.id,
             "name": item.category.name,
         },
-        tags=[tag.name for tag in item.item_tags],
-        images=[img.image_url for img in item.item_images],
+        tags=[item_tag.tag.name for item_tag in item.item_tags],
+        images=[img.image_url for img in item.images],
         uploader={
             "id": item.user.id,
             "name": f"{item.user.first_name} {item.user.last_name}",
         }
     )
 
+@app.get("/items/{item_id}/similar", response_model=List[ItemListResponse])
+def get_similar_items(
+    item_id: str,
+    limit: int = Query(10, ge=1, le=50),
+    db: Session = Depends(get_db),
+):
+    """More like this: nearest approved items by title, description, brand, color, material, tags and category"""
+    if item_id not in similarity_index:
+        if not similarity_index.ready:
+            return []  # startup build still running
+        raise HTTPException(status_code=404, detail="Item not found or not approved")
+
+    # Over-fetch a little, since some neighbours may have been swapped away meanwhile
+    neighbours = similarity_index.similar_to(item_id, limit * 2)
+    ids = [neighbour_id for neighbour_id, _ in neighbours]
+    items = {
+        item.id: item
+        for item in db.query(Item).options(selectinload(Item.images)).
+        filter(Item.id.in_(ids), Item.is_approved == True, Item.is_available == True)
+    }
+
+    result = []
+    for neighbour_id in ids:
+        item = items.get(neighbour_id)
+        if item is None:
+            continue
+        primary_img = next((img.thumbnail_url or img.image_url for img in item.images if img.is_primary), None)
+        result.append(
+            ItemListResponse(
+                id=item.id,
+                title=item.title,
+                description=item.description,
+                category_id=item.category_id,
+                condition=item.condition,
+                item_type=item.item_type,
+                points_value=item.points_value,
+                is_available=item.is_available,
+                is_approved=item.is_approved,
+                is_featured=item.is_featured,
+                view_count=item.view_count or 0,
+                primary_image_url=primary_img,
+            )
+        )
+        if len(result) == limit:
+            break
+    return result
+
 @app.get("/users/me/points", response_model=List[PointTransactionResponse])
 def get_points_history(
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     skip: int = 0,
     limit: int = 20,
 ):
@@ -946,6 +2131,8 @@ def browse_items(
     sort_by: Optional[str] = "newest",
     skip: int = 0,
     limit: int = 20,
+    cursor: Optional[str] = Query(None, description="Opaque cursor from the X-Next-Cursor header of the previous page"),
+    response: Response = None,
     db: Session = Depends(get_db),
 ):
     query = db.query(Item).filter(Item.is_available == True, Item.is_approved == True)
@@ -959,43 +2146,67 @@ def browse_items(
     if item_type:
         query = query.filter(Item.item_type == item_type.upper())
 
+    ranked = False
     if search:
-        search_pattern = f"%{search.lower()}%"
-        query = query.filter(
-            or_(
-                Item.title.ilike(search_pattern),
-                Item.description.ilike(search_pattern)
-            )
-        )
+        # Full-text index lookup, ordered by relevance
+        query, ranked = apply_search(query, search, Item)
     
     if tags:
         tag_list = [tag.strip().lower() for tag in tags.split(",")]
         query = query.join(ItemTag).join(Tag).filter(Tag.name.in_(tag_list))
 
-    if sort_by == "popular":
-        query = query.order_by(Item.view_count.desc())
+    # NULL view counts rank as 0 so they sort, and compare in the cursor seek, like any other value
+    popular = sort_by == "popular"
+    sort_column = func.coalesce(Item.view_count, 0) if popular else Item.created_at
+    query = query.order_by(sort_column.desc(), Item.id.desc())
+
+    if ranked and cursor:
+        raise HTTPException(status_code=400, detail="Cursor pagination is not supported for search results; use skip/limit")
+
+    if cursor:
+        # Keyset pagination: seek past the last row instead of scanning with OFFSET
+        last_value, last_id = decode_cursor(cursor)
+        if not popular:
+            try:
+                last_value = datetime.fromisoformat(last_value)
+            except (TypeError, ValueError):
+                raise HTTPException(status_code=400, detail="Invalid cursor")
+        elif not isinstance(last_value, int):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query = query.filter(
+            or_(
+                sort_column < last_value,
+                and_(sort_column == last_value, Item.id < last_id)
+            )
+        )
+        items = query.options(selectinload(Item.images)).limit(limit).all()
     else:
-        query = query.order_by(Item.created_at.desc())
+        items = query.options(selectinload(Item.images)).offset(skip).limit(limit).all()
 
-    items = query.offset(skip).limit(limit).all()
+    if response is not None and not ranked and len(items) == limit:
+        last = items[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor(
+            (last.view_count or 0) if popular else last.created_at,
+            last.id,
+        )
 
     # For each item, get primary image URL
     result = []
     for item in items:
-        primary_img = next((img.image_url for img in item.item_images if img.is_primary), None)
+        primary_img = next((img.thumbnail_url or img.image_url for img in item.images if img.is_primary), None)
         result.append(
             ItemListResponse(
                 id=item.id,
                 title=item.title,
                 description=item.description,
                 category_id=item.category_id,
-                condition=item.condition.name,
-                item_type=item.item_type.name,
+                condition=item.condition,
+                item_type=item.item_type,
                 points_value=item.points_value,
                 is_available=item.is_available,
                 is_approved=item.is_approved,
                 is_featured=item.is_featured,
-                view_count=item.view_count,
+                view_count=item.view_count or 0,
                 primary_image_url=primary_img,
             )
         )
@@ -1066,28 +2277,31 @@ def request_swap(
 
 
 @app.get("/admin/items/pending")
-def get_pending_items(db: Session = Depends(get_db), admin: User = Depends(require_admin)):
+def get_pending_items(db: Session = Depends(get_db), admin: Principal = Depends(require_admin)):
     items = db.query(Item).filter(Item.is_approved == False).all()
     return items
 
 @app.post("/admin/items/{item_id}/approve")
-def approve_item(item_id: str, db: Session = Depends(get_db), admin: User = Depends(require_admin)):
+def approve_item(item_id: str, db: Session = Depends(get_db), admin: Principal = Depends(require_admin)):
     item = db.query(Item).filter(Item.id == item_id).first()
     if not item:
         raise HTTPException(status_code=404, detail="Item not found")
     item.is_approved = True
     item.is_flagged_by_ai = False  # if it was flagged previously
+    item.ai_checked_at = item.ai_checked_at or datetime.utcnow()  # admin decision wins over a pending AI verdict
     db.add(AdminAction(
         admin_id=admin.id,
         action_type="APPROVE_ITEM",
         target_item_id=item.id
     ))
+    index_item(db, item)
     db.commit()
+    similarity_index.add(item.id, similarity_listing(item, [item_tag.tag.name for item_tag in item.item_tags]))
     return {"message": f"Item {item_id} approved"}
 
 
 @app.post("/admin/items/{item_id}/reject")
-def reject_item(item_id: str, reason: Optional[str] = None, db: Session = Depends(get_db), admin: User = Depends(require_admin)):
+def reject_item(item_id: str, reason: Optional[str] = None, db: Session = Depends(get_db), admin: Principal = Depends(require_admin)):
     item = db.query(Item).filter(Item.id == item_id).first()
     if not item:
         raise HTTPException(status_code=404, detail="Item not found")
@@ -1097,12 +2311,16 @@ def reject_item(item_id: str, reason: Optional[str] = None, db: Session = Depend
         target_item_id=item.id,
         reason=reason
     ))
+    unindex_item(db, item.id)
+    # Drop image rows so their blobs become unreferenced and gc_images.py can reclaim them
+    db.query(ItemImage).filter(ItemImage.item_id == item.id).delete(synchronize_session=False)
     db.delete(item)
     db.commit()
+    similarity_index.remove(item_id)
     return {"message": f"Item {item_id} rejected and removed"}
 
 @app.delete("/admin/items/{item_id}/remove")
-def remove_item(item_id: str, reason: Optional[str] = None, db: Session = Depends(get_db), admin: User = Depends(require_admin)):
+def remove_item(item_id: str, reason: Optional[str] = None, db: Session = Depends(get_db), admin: Principal = Depends(require_admin)):
     item = db.query(Item).filter(Item.id == item_id).first()
     if not item:
         raise HTTPException(status_code=404, detail="Item not found")
@@ -1112,16 +2330,56 @@ def remove_item(item_id: str, reason: Optional[str] = None, db: Session = Depend
         target_item_id=item.id,
         reason=reason
     ))
+    unindex_item(db, item.id)
+    # Drop image rows so their blobs become unreferenced and gc_images.py can reclaim them
+    db.query(ItemImage).filter(ItemImage.item_id == item.id).delete(synchronize_session=False)
     db.delete(item)
     db.commit()
+    similarity_index.remove(item_id)
     return {"message": f"Item {item_id} removed"}
+
+@app.get("/admin/moderation/stats")
+def get_moderation_stats(admin: Principal = Depends(require_admin)):
+    """Moderation queue depth and verdict cache hit rate"""
+    return {
+        "queue_pending": moderation_queue.pending(),
+        "unscored": moderation_queue.unscored,
+        "verdict_cache": {**moderation_cache.stats(), "db_hits": moderation_cache.backfills},
+    }
+
+@app.get("/admin/auth/stats")
+def get_auth_stats(admin: Principal = Depends(require_admin)):
+    """Principal cache hit rate; every hit is a user lookup the database did not serve"""
+    return {
+        "principal_cache": {**principal_cache.stats(), "db_lookups_saved": principal_cache.hits},
+        "password_hashing": password_hasher.stats(),
+    }
+
+@app.get("/admin/views/stats")
+def get_view_buffer_stats(admin: Principal = Depends(require_admin)):
+    """Buffered item views in this worker; dropped views were lost while flushes failed or a slow flush ran"""
+    return view_buffer.stats()
+
+@app.get("/admin/notifications/stats")
+def get_notification_stream_stats(db: Session = Depends(get_db), admin: Principal = Depends(require_admin)):
+    """Open push connections and delivered / dropped events in this worker, plus outbox backlog and dead letters"""
+    dead_letter = OutboxEvent.attempts >= OUTBOX_MAX_ATTEMPTS
+    return {
+        **notification_broker.stats(),
+        "outbox": {
+            **outbox_dispatcher.stats(),
+            "pending": db.query(func.count(OutboxEvent.id)).filter(~dead_letter).scalar(),
+            "dead_letter_rows": db.query(func.count(OutboxEvent.id)).filter(dead_letter).scalar(),
+        },
+    }
+
 @app.get("/admin/items/flagged")
-def get_flagged_items(db: Session = Depends(get_db), admin: User = Depends(require_admin)):
+def get_flagged_items(db: Session = Depends(get_db), admin: Principal = Depends(require_admin)):
     items = db.query(Item).filter(Item.is_flagged_by_ai == True).all()
     return items
 
 @app.post("/admin/users/{user_id}/ban")
-def ban_user(user_id: str, reason: Optional[str] = None, db: Session = Depends(get_db), admin: User = Depends(require_admin)):
+def ban_user(user_id: str, reason: Optional[str] = None, db: Session = Depends(get_db), admin: Principal = Depends(require_admin)):
     user = db.query(User).filter(User.id == user_id).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
@@ -1133,10 +2391,11 @@ def ban_user(user_id: str, reason: Optional[str] = None, db: Session = Depends(g
         reason=reason
     ))
     db.commit()
+    invalidate_principal(user.email)
     return {"message": f"User {user_id} banned"}
 
 @app.post("/admin/users/{user_id}/unban")
-def unban_user(user_id: str, db: Session = Depends(get_db), admin: User = Depends(require_admin)):
+def unban_user(user_id: str, db: Session = Depends(get_db), admin: Principal = Depends(require_admin)):
     user = db.query(User).filter(User.id == user_id).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
@@ -1147,13 +2406,11 @@ def unban_user(user_id: str, db: Session = Depends(get_db), admin: User = Depend
         target_user_id=user.id,
     ))
     db.commit()
+    invalidate_principal(user.email)
     return {"message": f"User {user_id} unbanned"}
 
 @app.post("/items/add")
 def add_item(item: ItemCreate, db: Session = Depends(get_db), user: User = Depends(get_current_user)):
-    # Call Gemini to auto-flag inappropriate listings
-    is_flagged = check_if_spam_with_ai(item.title, item.description or "")
-
     new_item = Item(
         id=str(uuid.uuid4()),
         user_id=user.id,
@@ -1167,13 +2424,19 @@ def add_item(item: ItemCreate, db: Session = Depends(get_db), user: User = Depen
         color=item.color,
         material=item.material,
         points_value=item.points_value or 0,
-        is_flagged_by_ai=is_flagged
+        is_flagged_by_ai=False,
+        moderation_retry_at=moderation_lease(0),
+        moderation_attempts=1,
     )
     db.add(new_item)
+    index_item(db, new_item)
     db.commit()
     db.refresh(new_item)
 
-    return {"message": "Item added successfully", "flagged_by_ai": is_flagged}
+    # Gemini auto-flags inappropriate listings in the background
+    moderation_queue.submit(new_item.id, new_item.title, new_item.description)
+
+    return {"message": "Item added successfully", "item_id": new_item.id, "flagged_by_ai": None, "moderation_status": "pending"}
 
 
 
@@ -1181,16 +2444,22 @@ def add_item(item: ItemCreate, db: Session = Depends(get_db), user: User = Depen
 
 @app.post("/ratings", response_model=RatingResponse)
 def rate_user(rating: RatingCreate, db: Session = Depends(get_db), user: User = Depends(get_current_user)):
+    # Row lock on PostgreSQL, so a concurrent overwrite by the same rater waits for this one
     existing = db.query(Rating).filter(
         Rating.rater_id == user.id,
         Rating.rated_user_id == rating.rated_user_id
-    ).first()
+    ).with_for_update().first()
 
     if existing:
+        # Overwrite: shift the sum by the difference, count unchanged. The old value is read
+        # inside the UPDATE, not from `existing`, so it is the one this write replaces
+        old_rating = db.query(Rating.rating).filter(Rating.id == existing.id).scalar_subquery()
+        sum_delta, count_delta = rating.rating - old_rating, 0
         existing.rating = rating.rating
         existing.comment = rating.comment
         existing.swap_id = rating.swap_id
     else:
+        sum_delta, count_delta = rating.rating, 1
         new_rating = Rating(
             id=str(uuid.uuid4()),
             rater_id=user.id,
@@ -1202,19 +2471,61 @@ def rate_user(rating: RatingCreate, db: Session = Depends(get_db), user: User =
         )
         db.add(new_rating)
 
+    # Update the aggregates in SQL (not read-modify-write) in the same transaction
+    db.query(User).filter(User.id == rating.rated_user_id).update(
+        {
+            User.rating_sum: User.rating_sum + sum_delta,
+            User.rating_count: User.rating_count + count_delta,
+        },
+        synchronize_session=False,
+    )
     db.commit()
     return existing if existing else new_rating
 
+@event.listens_for(Rating, "after_delete")
+def remove_rating_from_aggregates(mapper, connection, rating):
+    users_table = User.__table__
+    connection.execute(
+        users_table.update()
+        .where(users_table.c.id == rating.rated_user_id)
+        .values(rating_sum=users_table.c.rating_sum - rating.rating, rating_count=users_table.c.rating_count - 1)
+    )
+
+def rating_summary(user: User):
+    """(average, count) from the denormalized aggregates on the user row"""
+    count = user.rating_count or 0
+    return (round((user.rating_sum or 0) / count, 2) if count else 0), count
+
+def backfill_rating_aggregates(db: Session) -> int:
+    """Recompute rating_sum / rating_count for every user from the ratings table"""
+    totals = {
+        user_id: (total or 0, count)
+        for user_id, total, count in db.query(
+            Rating.rated_user_id, func.sum(Rating.rating), func.count(Rating.id)
+        ).group_by(Rating.rated_user_id)
+    }
+    db.query(User).update({User.rating_sum: 0, User.rating_count: 0}, synchronize_session=False)
+    if totals:
+        users_table = User.__table__
+        db.execute(
+            users_table.update()
+            .where(users_table.c.id == bindparam("b_user_id"))
+            .values(rating_sum=bindparam("b_sum"), rating_count=bindparam("b_count")),
+            [{"b_user_id": u, "b_sum": total, "b_count": count} for u, (total, count) in totals.items()],
+        )
+    db.commit()
+    return len(totals)
+
 # --- API to get user ratings with avg and count ---
 
 @app.get("/ratings/user/{user_id}")
 def get_user_ratings(user_id: str, db: Session = Depends(get_db)):
-    avg_rating = db.query(func.avg(Rating.rating)).filter(Rating.rated_user_id == user_id).scalar()
-    total_ratings = db.query(func.count(Rating.id)).filter(Rating.rated_user_id == user_id).scalar()
+    user = db.query(User).filter(User.id == user_id).first()
+    avg_rating, total_ratings = rating_summary(user) if user else (0, 0)
     recent = db.query(Rating).filter(Rating.rated_user_id == user_id).order_by(Rating.created_at.desc()).limit(10).all()
 
     return {
-        "average_rating": round(avg_rating or 0, 2),
+        "average_rating": avg_rating,
         "total_ratings": total_ratings,
         "recent_feedback": recent
     }
@@ -1229,39 +2540,21 @@ def get_user_ratings(user_id: str, db: Session = Depends(get_db)):
 # 2. Swap & Points Analytics Summary
 # ----------------------------------
 @app.get("/analytics/swaps")
-def get_swap_analytics(db: Session = Depends(get_db), user: User = Depends(get_current_user)):
-    total_swaps = db.query(Swap).filter(
-        (Swap.initiator_id == user.id) | (Swap.recipient_id == user.id)
-    ).count()
-
-    completed_swaps = db.query(Swap).filter(
-        ((Swap.initiator_id == user.id) | (Swap.recipient_id == user.id)) &
-        (Swap.status == "COMPLETED")
-    ).count()
-
-    total_points_earned = db.query(func.sum(PointTransaction.amount)).filter(
-        PointTransaction.user_id == user.id,
-        PointTransaction.transaction_type == "EARNED"
-    ).scalar() or 0
-
-    total_points_spent = db.query(func.sum(PointTransaction.amount)).filter(
-        PointTransaction.user_id == user.id,
-        PointTransaction.transaction_type == "SPENT"
-    ).scalar() or 0
-
-    # Optional: Most swapped category
-    most_swapped_category = db.query(Category.name, func.count(Item.id)).\
-        join(Item, Category.id == Item.category_id).\
-        join(Swap, (Swap.initiator_item_id == Item.id) | (Swap.recipient_item_id == Item.id)).\
-        filter((Swap.initiator_id == user.id) | (Swap.recipient_id == user.id)).\
-        group_by(Category.name).\
-        order_by(func.count(Item.id).desc()).first()
+def get_swap_analytics(db: Session = Depends(get_db), user: Principal = Depends(get_current_principal)):
+    # Counters come from the materialized user_stats row
+    stats = get_user_stats(db, user.id)
+
+    # Most swapped category from the per-user category counters
+    most_swapped_category = db.query(Category.name).\
+        join(UserCategorySwapCount, UserCategorySwapCount.category_id == Category.id).\
+        filter(UserCategorySwapCount.user_id == user.id).\
+        order_by(UserCategorySwapCount.swap_count.desc()).first()
 
     return {
-        "total_swaps": total_swaps,
-        "completed_swaps": completed_swaps,
-        "total_points_earned": total_points_earned,
-        "total_points_spent": total_points_spent,
+        "total_swaps": stats["total_swaps"],
+        "completed_swaps": stats["completed_swaps"],
+        "total_points_earned": stats["points_earned"],
+        "total_points_spent": stats["points_spent"],
         "most_swapped_category": most_swapped_category[0] if most_swapped_category else None
     }
 
@@ -1278,19 +2571,136 @@ class NotificationResponse(BaseModel):
 
     class Config:
         from_attributes = True
+
+    @field_validator("is_read", mode="before")
+    @classmethod
+    def null_is_unread(cls, value):
+        return bool(value)
+
 @app.get("/notifications", response_model=List[NotificationResponse])
 def get_my_notifications(
     db: Session = Depends(get_db),
-    user: User = Depends(get_current_user)
+    user: Principal = Depends(get_current_principal),
+    unread_only: bool = False,
+    limit: Optional[int] = Query(None, ge=1, le=100, description=f"Page size (default {NOTIFICATIONS_PAGE_SIZE} once a cursor is passed)"),
+    cursor: Optional[str] = Query(None, description="Opaque cursor from the X-Next-Cursor header of the previous page"),
+    response: Response = None,
 ):
-    notifs = (
-        db.query(Notification)
-        .filter(Notification.user_id == user.id)
-        .order_by(Notification.created_at.desc())
-        .all()
-    )
+    """Newest notifications first; paged when ``limit`` or ``cursor`` is given, otherwise all of them"""
+    query = db.query(Notification).filter(Notification.user_id == user.id)
+    if unread_only:
+        query = query.filter(notification_is_unread())
+
+    if cursor:
+        last_created_at, last_id = decode_cursor(cursor)
+        try:
+            last_created_at = datetime.fromisoformat(last_created_at)
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query = query.filter(
+            or_(
+                Notification.created_at < last_created_at,
+                and_(Notification.created_at == last_created_at, Notification.id < last_id)
+            )
+        )
+
+    query = query.order_by(Notification.created_at.desc(), Notification.id.desc())
+    if limit is None and cursor is None:
+        return query.all()
+    limit = limit or NOTIFICATIONS_PAGE_SIZE
+    notifs = query.limit(limit).all()
+    if response is not None and len(notifs) == limit:
+        last = notifs[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor(last.created_at, last.id)
     return notifs
 
+def principal_for_email(email: str) -> Principal:
+    """get_current_principal for long-lived handlers: the session is closed before streaming starts"""
+    db = SessionLocal()
+    try:
+        return lookup_principal(db, email)
+    finally:
+        db.close()
+
+def sse_message(event: str, data: dict, event_id: Optional[str] = None) -> str:
+    lines = [f"id: {event_id}"] if event_id else []
+    lines += [f"event: {event}", f"data: {json.dumps(data)}"]
+    return "\n".join(lines) + "\n\n"
+
+@app.post("/notifications/stream/ticket")
+def create_notification_stream_ticket(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    """Short-lived credential for EventSource clients, which cannot set an Authorization header.
+
+    The ticket goes in the stream URL (and so into access logs) instead of the
+    access token; it is only accepted by GET /notifications/stream, only for
+    NOTIFICATION_STREAM_TICKET_SECONDS, and the stream it opens still ends when
+    the access token expires.
+    """
+    payload = decode_token_payload(token)
+    lookup_principal(db, payload["sub"])
+    ticket = create_access_token(
+        data={"sub": payload["sub"], "scope": STREAM_TICKET_SCOPE, "stream_until": payload["exp"]},
+        expires_delta=timedelta(seconds=NOTIFICATION_STREAM_TICKET_SECONDS),
+    )
+    return {"ticket": ticket, "expires_in": NOTIFICATION_STREAM_TICKET_SECONDS}
+
+@app.get("/notifications/stream")
+async def stream_notifications(
+    request: Request,
+    token: Optional[str] = Depends(oauth2_scheme_optional),
+    ticket: Optional[str] = Query(None, description="Ticket from POST /notifications/stream/ticket, for EventSource clients"),
+):
+    """Server-Sent Events: every new notification for the user is pushed as it is committed.
+
+    The stream is closed with an ``expired`` event when the access token it was
+    opened with expires; the client reconnects with a fresh token or ticket.
+    """
+    if token:
+        claims = decode_token_payload(token)
+        expires_at = claims["exp"]
+    elif ticket:
+        claims = decode_token_payload(ticket, scope=STREAM_TICKET_SCOPE)
+        expires_at = claims["stream_until"]
+    else:
+        raise credentials_exception()
+    user = await run_in_threadpool(principal_for_email, claims["sub"])
+    subscription = notification_broker.subscribe(user.id)
+
+    async def events():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                remaining = expires_at - time.time()
+                if remaining <= 0:
+                    yield sse_message("expired", {"detail": "Token expired"})
+                    break
+                try:
+                    payload = await asyncio.wait_for(
+                        subscription.get(), min(NOTIFICATION_STREAM_HEARTBEAT_SECONDS, remaining)
+                    )
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keep-alive\n\n"
+                    continue
+                yield sse_message("notification", payload, payload["id"])
+        finally:
+            notification_broker.unsubscribe(subscription)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/notifications/unread-count")
+def get_unread_notification_count(
+    db: Session = Depends(get_db),
+    user: Principal = Depends(get_current_principal)
+):
+    """Unread badge count, read from the user's counter row"""
+    return {"unread_count": max(get_user_stats(db, user.id)["unread_notifications"], 0)}
+
 # Missing API Endpoints
 
 @app.get("/categories")
@@ -1302,7 +2712,7 @@ def get_categories(db: Session = Depends(get_db)):
 @app.get("/users/me/items")
 def get_my_items(
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     status: Optional[str] = None  # "active", "pending", "sold"
 ):
     """Get current user's uploaded items"""
@@ -1321,7 +2731,7 @@ def get_my_items(
 @app.get("/users/me/swaps")
 def get_my_swaps(
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     status: Optional[str] = None  # "pending", "active", "completed", "cancelled"
 ):
     """Get current user's swap history"""
@@ -1338,30 +2748,11 @@ def get_my_swaps(
 @app.get("/users/me/dashboard")
 def get_user_dashboard(
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     """Get user dashboard data"""
-    # Get user's items count
-    total_items = db.query(Item).filter(Item.user_id == current_user.id).count()
-    active_items = db.query(Item).filter(
-        Item.user_id == current_user.id,
-        Item.is_available == True,
-        Item.is_approved == True
-    ).count()
-    pending_items = db.query(Item).filter(
-        Item.user_id == current_user.id,
-        Item.is_approved == False
-    ).count()
-    
-    # Get swap statistics
-    total_swaps = db.query(Swap).filter(
-        (Swap.initiator_id == current_user.id) | (Swap.recipient_id == current_user.id)
-    ).count()
-    
-    completed_swaps = db.query(Swap).filter(
-        ((Swap.initiator_id == current_user.id) | (Swap.recipient_id == current_user.id)) &
-        (Swap.status == "COMPLETED")
-    ).count()
+    # Counters come from the materialized user_stats row
+    stats = get_user_stats(db, current_user.id)
     
     # Get recent activity
     recent_items = db.query(Item).filter(Item.user_id == current_user.id).order_by(Item.created_at.desc()).limit(5).all()
@@ -1379,11 +2770,11 @@ def get_user_dashboard(
             "is_admin": current_user.is_admin
         },
         "stats": {
-            "total_items": total_items,
-            "active_items": active_items,
-            "pending_items": pending_items,
-            "total_swaps": total_swaps,
-            "completed_swaps": completed_swaps
+            "total_items": stats["total_items"],
+            "active_items": stats["active_items"],
+            "pending_items": stats["pending_items"],
+            "total_swaps": stats["total_swaps"],
+            "completed_swaps": stats["completed_swaps"]
         },
         "recent_items": recent_items,
         "recent_swaps": recent_swaps
@@ -1407,7 +2798,7 @@ def get_featured_items(
 def mark_notification_read(
     notification_id: str,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     """Mark a notification as read"""
     notification = db.query(Notification).filter(
@@ -1425,40 +2816,39 @@ def mark_notification_read(
 @app.post("/notifications/read-all")
 def mark_all_notifications_read(
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     """Mark all notifications as read"""
-    db.query(Notification).filter(
+    marked = db.query(Notification).filter(
         Notification.user_id == current_user.id,
-        Notification.is_read == False
-    ).update({"is_read": True})
+        notification_is_unread()
+    ).update({"is_read": True}, synchronize_session=False)
+    # Bulk UPDATE bypasses the flush hooks, so adjust the unread counter here
+    if marked:
+        upsert_counters(db.connection(), UserStats.__table__, {"user_id": current_user.id},
+                        {"unread_notifications": -marked})
     db.commit()
     return {"message": "All notifications marked as read"}
 
 @app.get("/admin/dashboard")
 def get_admin_dashboard(
     db: Session = Depends(get_db),
-    admin: User = Depends(require_admin)
+    admin: Principal = Depends(require_admin)
 ):
     """Get admin dashboard statistics"""
-    total_users = db.query(User).count()
-    total_items = db.query(Item).count()
-    pending_items = db.query(Item).filter(Item.is_approved == False).count()
-    flagged_items = db.query(Item).filter(Item.is_flagged_by_ai == True).count()
-    total_swaps = db.query(Swap).count()
-    completed_swaps = db.query(Swap).filter(Swap.status == "COMPLETED").count()
+    stats = current_platform_stats()
     
     # Recent admin actions
     recent_actions = db.query(AdminAction).order_by(AdminAction.created_at.desc()).limit(10).all()
     
     return {
         "stats": {
-            "total_users": total_users,
-            "total_items": total_items,
-            "pending_items": pending_items,
-            "flagged_items": flagged_items,
-            "total_swaps": total_swaps,
-            "completed_swaps": completed_swaps
+            "total_users": stats["total_users"],
+            "total_items": stats["total_items"],
+            "pending_items": stats["pending_items"],
+            "flagged_items": stats["flagged_items"],
+            "total_swaps": stats["total_swaps"],
+            "completed_swaps": stats["completed_swaps"]
         },
         "recent_actions": recent_actions
     }
@@ -1472,49 +2862,25 @@ def get_item_recommendations(
     current_user: Optional[User] = Depends(get_current_user_optional)
 ):
     """Get personalized item recommendations"""
-    query = db.query(Item).filter(
-        Item.is_approved == True,
-        Item.is_available == True
-    )
-    
-    if category_id:
-        query = query.filter(Item.category_id == category_id)
-    
-    # If user is logged in, prioritize items from categories they've interacted with
-    if current_user:
-        # Get user's swap history to find preferred categories
-        user_swaps = db.query(Swap).filter(
-            (Swap.initiator_id == current_user.id) | (Swap.recipient_id == current_user.id)
-        ).all()
-        
-        # Extract item IDs from swaps
-        item_ids = []
-        for swap in user_swaps:
-            item_ids.extend([swap.initiator_item_id, swap.recipient_item_id])
-        
-        if item_ids:
-            # Get categories from user's swap history
-            preferred_categories = db.query(Item.category_id).filter(
-                Item.id.in_(item_ids)
-            ).distinct().all()
-            
-            category_ids = [cat[0] for cat in preferred_categories]
-            if category_ids:
-                # Order by preferred categories first
-                query = query.order_by(
-                    case(
-                        (Item.category_id.in_(category_ids), 0),
-                        else_=1
-                    ),
-                    Item.view_count.desc()
-                )
-    
-    # Fallback to most viewed items
-    if not current_user or not user_swaps:
-        query = query.order_by(Item.view_count.desc())
-    
-    recommendations = query.limit(limit).all()
-    return recommendations
+    # Top-k merge over the precomputed candidate lists, cached per user
+    item_ids = recommendation_engine.recommend(current_user.id if current_user else None, category_id, limit)
+
+    if not item_ids:
+        # Snapshot not built yet: fall back to most viewed items
+        query = db.query(Item).filter(Item.is_approved == True, Item.is_available == True)
+        if category_id:
+            query = query.filter(Item.category_id == category_id)
+        return query.order_by(Item.view_count.desc()).limit(limit).all()
+
+    # Re-check availability; the snapshot can be a few minutes old
+    items = {
+        item.id: item for item in db.query(Item).filter(
+            Item.id.in_(item_ids),
+            Item.is_approved == True,
+            Item.is_available == True
+        )
+    }
+    return [items[item_id] for item_id in item_ids if item_id in items]
 
 @app.get("/swaps/me")
 def get_user_swaps(
@@ -1535,11 +2901,12 @@ def redeem_item_with_points(
     current_user: User = Depends(get_current_user)
 ):
     """Redeem an item using points"""
+    # Row lock on PostgreSQL; elsewhere Item.version rejects a concurrent redemption at commit
     item = db.query(Item).filter(
         Item.id == item_id,
         Item.is_approved == True,
         Item.is_available == True
-    ).first()
+    ).with_for_update().first()
     
     if not item:
         raise HTTPException(status_code=404, detail="Item not found")
@@ -1547,8 +2914,9 @@ def redeem_item_with_points(
     if item.user_id == current_user.id:
         raise HTTPException(status_code=400, detail="Cannot redeem your own item")
     
-    if current_user.points_balance < item.points_value:
-        raise HTTPException(status_code=400, detail="Insufficient points")
+    # Guarded UPDATEs: raises 400 unless the balance still covers the price (free items move no points)
+    if item.points_value:
+        transfer_points(db, current_user.id, item.user_id, item.points_value)
     
     # Create point transaction
     point_transaction = PointTransaction(
@@ -1560,10 +2928,7 @@ def redeem_item_with_points(
         related_item_id=item.id
     )
     
-    # Transfer points to item owner
-    item_owner = db.query(User).filter(User.id == item.user_id).first()
-    item_owner.points_balance += item.points_value
-    current_user.points_balance -= item.points_value
+    owner_email = db.query(User.email).filter(User.id == item.user_id).scalar()
     
     # Mark item as unavailable
     item.is_available = False
@@ -1581,6 +2946,7 @@ def redeem_item_with_points(
     db.add(point_transaction)
     db.add(notification)
     db.commit()
+    invalidate_principal(current_user.email, owner_email)
     
     return {"message": "Item redeemed successfully"}
 
@@ -1615,9 +2981,8 @@ def get_user_profile(
         Item.is_available == True
     ).all()
     
-    # Get user's rating
-    avg_rating = db.query(func.avg(Rating.rating)).filter(Rating.rated_user_id == user_id).scalar()
-    total_ratings = db.query(func.count(Rating.id)).filter(Rating.rated_user_id == user_id).scalar()
+    # Get user's rating (denormalized on the user row)
+    avg_rating, total_ratings = rating_summary(user)
     
     return {
         "user": {
@@ -1628,40 +2993,56 @@ def get_user_profile(
         },
         "stats": {
             "total_items": len(user_items),
-            "average_rating": round(avg_rating or 0, 2),
+            "average_rating": avg_rating,
             "total_ratings": total_ratings
         },
         "items": user_items
     }
-<<<<<<< Updated upstream
-    from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from dotenv import load_dotenv
-from langchain_groq import ChatGroq
-from langchain_core.messages import SystemMessage, HumanMessage
-import json
-import os
 
-# Load environment variables
-load_dotenv()
+# ----------------------------------
+# ReWearBot (RAG chatbot)
+# ----------------------------------
+# Pooled connections shared by every async chatbot request
+chatbot_http_client = httpx.AsyncClient(
+    timeout=CHATBOT_TIMEOUT_SECONDS,
+    limits=httpx.Limits(max_connections=CHATBOT_MAX_CONCURRENCY, max_keepalive_connections=CHATBOT_MAX_CONCURRENCY),
+)
 
 # Load chatbot model
 llm = ChatGroq(
-    model="gemma2-9b-it", 
+    model="gemma2-9b-it",
     temperature=0.7,
-    api_key=os.getenv("GROQ_API_KEY")
+    api_key=os.getenv("GROQ_API_KEY"),
+    http_async_client=chatbot_http_client,
+)
+
+# Retrieval index, so each question only carries the chunks relevant to it.
+# Memory-mapped from the compiled index file and hot-reloaded when it (or the chunks JSON) changes.
+knowledge_base = KnowledgeBase(
+    CHATBOT_KNOWLEDGE_BASE,
+    CHATBOT_INDEX_PATH,
+    dense_dim=CHATBOT_DENSE_DIM,
+    check_interval=CHATBOT_INDEX_CHECK_SECONDS,
+    auto_build=CHATBOT_INDEX_AUTO_BUILD,
 )
 
-# Load knowledge base
-with open("rewear_chunks.json", "r") as f:
-    rewear_chunks = json.load(f)
+@app.on_event("startup")
+def map_knowledge_base():
+    knowledge_base.current()
 
-knowledge_base = "\n\n".join(
-    f"{chunk['title']}\n{chunk['content']}" for chunk in rewear_chunks
+def knowledge_base_version():
+    """Changes whenever the index is rebuilt; cached answers from older versions are dropped"""
+    knowledge_base.current()
+    return knowledge_base.version
+
+answer_cache = AnswerCache(
+    maxsize=CHATBOT_CACHE_SIZE,
+    ttl=CHATBOT_CACHE_TTL_SECONDS,
+    threshold=CHATBOT_CACHE_SIMILARITY,
 )
 
-# Define system prompt
-system_prompt = f"""
+# Define system prompt; {knowledge_base} is filled with the retrieved chunks
+system_prompt_template = """
 You are ReWearBot, a helpful assistant for a platform called ReWear.
 
 Instructions:
@@ -1678,43 +3059,169 @@ Knowledge Base:
 {knowledge_base}
 """
 
+def build_system_prompt(question: str) -> str:
+    context = select_context(knowledge_base.current(), question, k=CHATBOT_TOP_K, token_budget=CHATBOT_CONTEXT_TOKENS)
+    return system_prompt_template.format(knowledge_base=format_context(context))
+
+chat_sessions = ChatSessionStore(
+    maxsize=CHATBOT_SESSION_MAX,
+    ttl=CHATBOT_SESSION_TTL_SECONDS,
+    window_turns=CHATBOT_HISTORY_TURNS,
+)
+
+def build_chat_messages(question: str, session) -> list:
+    """System prompt with retrieved context and the conversation summary, recent turns, then the question"""
+    summary, turns = session.history(CHATBOT_HISTORY_TOKENS)
+    # Follow-ups ("and how long does that take?") retrieve with the previous question too
+    system_prompt = build_system_prompt(f"{turns[-1][0]} {question}" if turns else question)
+    if summary:
+        system_prompt += f"\nEarlier in this conversation:\n{summary}\n"
+    messages = [SystemMessage(content=system_prompt)]
+    for previous_question, previous_answer in turns:
+        messages += [HumanMessage(content=previous_question), AIMessage(content=previous_answer)]
+    messages.append(HumanMessage(content=question))
+    return messages
+
+def chat_session_for(payload, current_user):
+    """A new conversation, or the caller's own live one; 404 for unknown, expired or someone else's ids"""
+    owner_id = current_user.id if current_user else None
+    if not payload.conversation_id:
+        return chat_sessions.create(owner_id)
+    session = chat_sessions.get(payload.conversation_id, owner_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Conversation not found or expired")
+    return session
+
+def is_first_turn(session) -> bool:
+    # Only context-free questions may be answered from (and stored in) the answer cache
+    return not session.turns and not session.summary
+
 # Pydantic model for incoming and outgoing messages
 class ChatRequest(BaseModel):
     message: str
+    conversation_id: Optional[str] = None  # id returned by an earlier answer; omitted = start a new conversation
 
 class ChatResponse(BaseModel):
     response: str
+    conversation_id: Optional[str] = None
 
-# Create FastAPI app if not already present
-app = FastAPI()
+chatbot_slots = asyncio.Semaphore(CHATBOT_MAX_CONCURRENCY)
+
+def chatbot_busy():
+    return HTTPException(status_code=503, detail="Chatbot is busy, please try again shortly", headers={"Retry-After": "1"})
 
 # ReWearBot API Endpoint
 @app.post("/chatbot/ask", response_model=ChatResponse)
-def ask_rewear_bot(payload: ChatRequest):
+async def ask_rewear_bot(payload: ChatRequest, current_user: Optional[User] = Depends(get_current_user_optional)):
+    """Answer in one response; shares the stream endpoint's concurrency cap (503) and timeout (504)"""
+    session = chat_session_for(payload, current_user)
+    first_turn = is_first_turn(session)
+    version = knowledge_base_version()
+    cached = answer_cache.get(payload.message, version) if first_turn else None
+    if cached is not None:
+        chat_sessions.record_turn(session, payload.message, cached)
+        return {"response": cached, "conversation_id": session.id}
+    if chatbot_slots.locked():
+        raise chatbot_busy()
+    async with chatbot_slots:
+        try:
+            ai_response = await asyncio.wait_for(
+                llm.ainvoke(build_chat_messages(payload.message, session)), CHATBOT_TIMEOUT_SECONDS
+            )
+            answer = ai_response.content.strip()
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=504, detail="Chatbot timed out")
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Chatbot error: {e}")
+    if first_turn:
+        answer_cache.set(payload.message, answer, version)
+    chat_sessions.record_turn(session, payload.message, answer)
+    return {"response": answer, "conversation_id": session.id}
+
+async def stream_llm(messages, timeout: float):
+    """Yield answer fragments as the LLM produces them; asyncio.TimeoutError once ``timeout`` seconds have passed"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    stream = llm.astream(messages).__aiter__()
     try:
-        messages = [
-            SystemMessage(content=system_prompt),
-            HumanMessage(content=payload.message)
-        ]
-        ai_response = llm.invoke(messages)
-        return {"response": ai_response.content.strip()}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Chatbot error: {e}")
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise asyncio.TimeoutError()
+            try:
+                chunk = await asyncio.wait_for(stream.__anext__(), remaining)
+            except StopAsyncIteration:
+                return
+            if chunk.content:
+                yield chunk.content
+    finally:
+        await stream.aclose()
+
+@app.post("/chatbot/ask/stream")
+async def ask_rewear_bot_stream(payload: ChatRequest, current_user: Optional[User] = Depends(get_current_user_optional)):
+    """Like /chatbot/ask, but streams the answer as Server-Sent Events.
+
+    Events: ``token`` ({"text": ...}) per fragment, then ``done`` ({"response": full answer,
+    "conversation_id": ...}) or ``error`` ({"detail": ...}).
+    """
+    session = chat_session_for(payload, current_user)
+    first_turn = is_first_turn(session)
+    version = knowledge_base_version()
+    cached = answer_cache.get(payload.message, version) if first_turn else None
+    if cached is None and chatbot_slots.locked():
+        raise chatbot_busy()
+
+    async def events():
+        if cached is not None:
+            chat_sessions.record_turn(session, payload.message, cached)
+            yield sse_message("token", {"text": cached})
+            yield sse_message("done", {"response": cached, "conversation_id": session.id})
+            return
+        async with chatbot_slots:
+            messages = build_chat_messages(payload.message, session)
+            parts = []
+            try:
+                async for text in stream_llm(messages, CHATBOT_TIMEOUT_SECONDS):
+                    parts.append(text)
+                    yield sse_message("token", {"text": text})
+            except asyncio.TimeoutError:
+                yield sse_message("error", {"detail": "Chatbot timed out"})
+                return
+            except Exception as e:
+                yield sse_message("error", {"detail": f"Chatbot error: {e}"})
+                return
+        answer = "".join(parts).strip()
+        if first_turn:
+            answer_cache.set(payload.message, answer, version)
+        chat_sessions.record_turn(session, payload.message, answer)
+        yield sse_message("done", {"response": answer, "conversation_id": session.id})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.on_event("shutdown")
+async def close_chatbot_http_client():
+    await chatbot_http_client.aclose()
 
-=======
+@app.get("/chatbot/cache/stats")
+def get_chatbot_cache_stats(admin: Principal = Depends(require_admin)):
+    """Answer cache hit rate (every hit is an LLM call saved) and live chat sessions"""
+    return {**answer_cache.stats(), "sessions": chat_sessions.stats()}
 
 @app.get("/stats/public")
-def get_public_stats(db: Session = Depends(get_db)):
-    """Get public stats for landing page (total users, items, swaps, completed swaps)."""
-    total_users = db.query(User).count()
-    total_items = db.query(Item).count()
-    total_swaps = db.query(Swap).count()
-    completed_swaps = db.query(Swap).filter(Swap.status == "COMPLETED").count()
+def get_public_stats():
+    """Get public stats for landing page (total users, items, swaps, completed swaps).
+
+    Served from the in-memory platform_stats totals; no database access per request.
+    """
+    stats = current_platform_stats()
     # Optionally, you can add more stats here (e.g., CO2 saved, if you have logic for it)
     return {
-        "total_users": total_users,
-        "total_items": total_items,
-        "total_swaps": total_swaps,
-        "completed_swaps": completed_swaps
+        "total_users": stats["total_users"],
+        "total_items": stats["total_items"],
+        "total_swaps": stats["total_swaps"],
+        "completed_swaps": stats["completed_swaps"]
     }
->>>>>>> Stashed changes
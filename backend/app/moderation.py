@@ -0,0 +1,140 @@
+# app/moderation.py
+
+import queue
+import re
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+# A classifier takes a batch of (title, description) pairs and returns
+# one flag per listing (True = spam / inappropriate, None = could not be scored).
+Classifier = Callable[[List[Tuple[str, str]]], List[Optional[bool]]]
+
+_VERDICT_LINE = re.compile(r"^\W*(\d+)\W+(FLAG|OK)\b", re.IGNORECASE | re.MULTILINE)
+
+
+def parse_batch_verdicts(text: str, count: int) -> List[Optional[bool]]:
+    """Read ``<number>: FLAG|OK`` lines from an LLM reply; listings it skipped or repeated get None"""
+    verdicts = [None] * count
+    seen = set()
+    for number, decision in _VERDICT_LINE.findall(text or ""):
+        i = int(number) - 1
+        if not 0 <= i < count:
+            continue
+        if i in seen:
+            verdicts[i] = None  # contradictory or duplicated answer: ask again rather than guess
+            continue
+        seen.add(i)
+        verdicts[i] = decision.upper() == "FLAG"
+    return verdicts
+
+
+def retry_delay(attempts: int, base: float, cap: float) -> float:
+    """Seconds before a listing that was already tried ``attempts`` times is tried again: doubling, up to ``cap``"""
+    return min(base * 2 ** min(attempts, 32), cap)
+
+
+class KeywordClassifier:
+    """Local stand-in for the LLM moderator; no network, deterministic"""
+
+    SPAM_PATTERNS = [
+        r"buy now", r"limited offer", r"click here", r"visit \S+\.(?:com|net|org)",
+        r"free money", r"whatsapp", r"telegram", r"crypto", r"(.)\1{6,}",
+    ]
+
+    def __init__(self, patterns=None):
+        self.regex = re.compile("|".join(patterns or self.SPAM_PATTERNS), re.IGNORECASE)
+
+    def __call__(self, listings):
+        return [bool(self.regex.search(f"{title}\n{description}")) for title, description in listings]
+
+
+class ModerationQueue:
+    """Background AI moderation for new listings.
+
+    Handlers call ``submit`` and return immediately; worker threads drain the
+    queue in batches of up to ``batch_size``, score them with ``classifier``
+    and hand ``{item_id: is_flagged}`` to ``on_results``. Listings the
+    classifier could not score are left out of the results (and counted in
+    ``unscored``), so they stay unchecked and are queued again by the
+    caller's periodic retry sweep.
+    """
+
+    def __init__(self, classifier: Classifier, on_results: Callable[[Dict[str, bool]], None],
+                 workers: int = 1, batch_size: int = 16, batch_wait: float = 0.5):
+        self.classifier = classifier
+        self.on_results = on_results
+        self.workers = workers
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self._queue = queue.Queue()
+        self._threads = []
+        self._stopped = threading.Event()
+        self._stats_lock = threading.Lock()
+        self.unscored = 0
+
+    def submit(self, item_id: str, title: str, description: str):
+        self._queue.put((item_id, title, description or ""))
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def _next_batch(self):
+        try:
+            batch = [self._queue.get(timeout=self.batch_wait)]
+        except queue.Empty:
+            return []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def process_batch(self, batch):
+        try:
+            flags = self.classifier([(title, description) for _, title, description in batch])
+            results = {item_id: bool(flag) for (item_id, _, _), flag in zip(batch, flags) if flag is not None}
+            self._count_unscored(len(batch) - len(results))
+            if results:
+                self.on_results(results)
+        except Exception as e:
+            self._count_unscored(len(batch))
+            print(f"Moderation error: {e}")
+
+    def _count_unscored(self, n: int):
+        with self._stats_lock:
+            self.unscored += n
+
+    def _run(self):
+        while not self._stopped.is_set():
+            batch = self._next_batch()
+            if batch:
+                self.process_batch(batch)
+
+    def drain(self):
+        """Process everything queued right now on the calling thread (tests, shutdown)"""
+        while True:
+            batch = []
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not batch:
+                return
+            self.process_batch(batch)
+
+    def start(self):
+        if self._threads:
+            return
+        self._stopped.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"moderation-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stopped.set()
+        for thread in self._threads:
+            thread.join(timeout=self.batch_wait + 1)
+        self._threads = []
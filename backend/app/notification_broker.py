@@ -0,0 +1,216 @@
+# app/notification_broker.py
+
+import asyncio
+import json
+import select
+import threading
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from typing import Dict, Set
+
+
+class Subscription:
+    """One connected client: a bounded asyncio queue bound to the event loop it was created on.
+
+    When the client falls behind and the queue is full, further events are
+    dropped (counted in ``dropped``); the client catches up via GET /notifications.
+    """
+
+    def __init__(self, user_id: str, max_queue: int):
+        self.user_id = user_id
+        self.loop = asyncio.get_running_loop()
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.dropped = 0
+
+    def _offer(self, event: dict):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    def deliver(self, event: dict):
+        # Publishers run in worker threads; hand the event over to the subscriber's loop
+        self.loop.call_soon_threadsafe(self._offer, event)
+
+    async def get(self) -> dict:
+        return await self.queue.get()
+
+
+class NotificationBroker(ABC):
+    """Pub/sub interface between code that creates notifications and push connections.
+
+    ``publish`` may be called from any thread; ``subscribe`` / ``unsubscribe``
+    from the event loop. A multi-worker deployment implements the same three
+    methods on top of a shared channel (e.g. Redis pub/sub), fanning each
+    message out to the local subscribers.
+    """
+
+    @abstractmethod
+    def publish(self, user_id: str, event: dict):
+        ...
+
+    @abstractmethod
+    def subscribe(self, user_id: str) -> Subscription:
+        ...
+
+    @abstractmethod
+    def unsubscribe(self, subscription: Subscription):
+        ...
+
+    def start(self):
+        """Begin receiving events from other processes (no-op for in-process brokers)"""
+
+    def stop(self):
+        pass
+
+    def stats(self) -> dict:
+        return {}
+
+
+class InMemoryBroker(NotificationBroker):
+    """Fan-out to the subscribers of this process only.
+
+    Events published by another worker process never reach these subscribers,
+    so with more than one worker a user only hears about notifications that
+    happened to be published (by the outbox dispatcher) in the worker holding
+    their stream.
+    """
+
+    def __init__(self, max_queue: int = 100):
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._subscribers: Dict[str, Set[Subscription]] = defaultdict(set)
+        self.published = 0
+        self.delivered = 0
+        self._dropped_closed = 0  # dropped by connections that are gone
+
+    def publish(self, user_id: str, event: dict):
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+            self.published += 1
+            self.delivered += len(subscribers)
+        for subscription in subscribers:
+            try:
+                subscription.deliver(event)
+            except RuntimeError:
+                # Event loop already closed (server shutting down)
+                self.unsubscribe(subscription)
+
+    def subscribe(self, user_id: str) -> Subscription:
+        subscription = Subscription(user_id, self.max_queue)
+        with self._lock:
+            self._subscribers[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id)
+            if subscribers is not None and subscription in subscribers:
+                subscribers.discard(subscription)
+                self._dropped_closed += subscription.dropped
+                if not subscribers:
+                    del self._subscribers[subscription.user_id]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "connected_users": len(self._subscribers),
+                "connections": sum(len(s) for s in self._subscribers.values()),
+                "published": self.published,
+                "delivered": self.delivered,
+                "dropped": self._dropped_closed + sum(sub.dropped for subs in self._subscribers.values() for sub in subs),
+            }
+
+
+class PostgresNotifyBroker(NotificationBroker):
+    """Fan-out across worker processes over Postgres LISTEN/NOTIFY.
+
+    ``publish`` sends the event with ``pg_notify`` on ``channel``; every
+    process runs a listener thread (``start``) that hands the events it
+    receives to its local subscribers. Whichever worker commits a
+    notification (or drains the outbox), every worker holding a stream for
+    that user delivers it. NOTIFY payloads are limited to 8000 bytes; larger
+    events are dropped, like events for a client that fell behind, and the
+    client catches up via GET /notifications. Needs the psycopg2 driver.
+    """
+
+    def __init__(self, engine, channel: str = "notifications", max_queue: int = 100, poll_interval: float = 1.0):
+        self.engine = engine
+        self.channel = channel
+        self.poll_interval = poll_interval
+        self.local = InMemoryBroker(max_queue)
+        self._stopped = threading.Event()
+        self._thread = None
+        self.publish_failures = 0
+        self.listen_failures = 0
+
+    def publish(self, user_id: str, event: dict):
+        payload = json.dumps({"user_id": user_id, "event": event})
+        try:
+            with self.engine.begin() as conn:
+                conn.exec_driver_sql("SELECT pg_notify(%(channel)s, %(payload)s)",
+                                     {"channel": self.channel, "payload": payload})
+        except Exception as e:
+            self.publish_failures += 1
+            print(f"Notification publish failed: {e}")
+
+    def receive(self, payload: str):
+        """Hand one NOTIFY payload to this process's subscribers"""
+        try:
+            message = json.loads(payload)
+            user_id, event = message["user_id"], message["event"]
+        except (ValueError, KeyError, TypeError):
+            return
+        self.local.publish(user_id, event)
+
+    def subscribe(self, user_id: str) -> Subscription:
+        return self.local.subscribe(user_id)
+
+    def unsubscribe(self, subscription: Subscription):
+        self.local.unsubscribe(subscription)
+
+    def _listen(self):
+        connection = self.engine.raw_connection()
+        try:
+            dbapi_connection = connection.driver_connection
+            dbapi_connection.autocommit = True
+            with dbapi_connection.cursor() as cursor:
+                cursor.execute(f'LISTEN "{self.channel}"')
+            while not self._stopped.is_set():
+                if select.select([dbapi_connection], [], [], self.poll_interval) == ([], [], []):
+                    continue
+                dbapi_connection.poll()
+                while dbapi_connection.notifies:
+                    self.receive(dbapi_connection.notifies.pop(0).payload)
+        finally:
+            connection.invalidate()  # LISTEN state must not go back to the pool
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                self._listen()
+            except Exception as e:
+                # Events sent while reconnecting are missed; clients catch up via GET /notifications
+                self.listen_failures += 1
+                print(f"Notification listener error: {e}")
+                self._stopped.wait(self.poll_interval)
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="notification-listener", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread:
+            self._thread.join(timeout=self.poll_interval + 1)
+            self._thread = None
+
+    def stats(self) -> dict:
+        return {
+            **self.local.stats(),
+            "publish_failures": self.publish_failures,
+            "listen_failures": self.listen_failures,
+        }
@@ -0,0 +1,84 @@
+# app/outbox.py
+
+import threading
+from typing import NamedTuple
+
+
+class BatchResult(NamedTuple):
+    delivered: int = 0
+    failed: int = 0  # charged an attempt, retried later
+    dead_lettered: int = 0  # out of attempts, left in the outbox table and no longer retried
+
+
+class OutboxDispatcher:
+    """Background worker that drains the transactional outbox in batches.
+
+    Request handlers only insert outbox rows inside their own transaction;
+    ``process_batch(limit)`` claims up to ``limit`` of them, performs the side
+    effects and deletes the delivered rows, returning a ``BatchResult``. It
+    runs every ``interval`` seconds, right away after ``wake()`` (called once
+    a transaction with outbox rows commits), and back to back while full
+    batches keep coming.
+    """
+
+    def __init__(self, process_batch, interval: float = 2.0, batch_size: int = 100):
+        self.process_batch = process_batch
+        self.interval = interval
+        self.batch_size = batch_size
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self.processed = 0
+        self.failed = 0
+        self.dead_lettered = 0
+        self.failures = 0
+
+    def wake(self):
+        self._wakeup.set()
+
+    def drain(self):
+        """Process batches until the outbox is empty or an event fails (it is retried on the next run)"""
+        total = 0
+        while True:
+            try:
+                result = self.process_batch(self.batch_size)
+            except Exception as e:
+                print(f"Outbox dispatch error: {e}")
+                self.failures += 1
+                return total
+            total += result.delivered
+            self.processed += result.delivered
+            self.failed += result.failed
+            self.dead_lettered += result.dead_lettered
+            if result.failed or result.dead_lettered or result.delivered < self.batch_size:
+                return total
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            self.drain()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="outbox-dispatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the worker and deliver whatever is still queued"""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout=self.interval + 1)
+            self._thread = None
+        self.drain()
+
+    def stats(self) -> dict:
+        return {
+            "processed": self.processed,
+            "failed": self.failed,
+            "dead_lettered": self.dead_lettered,
+            "failures": self.failures,
+        }
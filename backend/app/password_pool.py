@@ -0,0 +1,154 @@
+# app/password_pool.py
+
+import bisect
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from passlib.context import CryptContext
+
+_contexts = {}
+
+
+def _context(rounds: int) -> CryptContext:
+    # One CryptContext per worker process and cost factor
+    if rounds not in _contexts:
+        _contexts[rounds] = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=rounds)
+    return _contexts[rounds]
+
+
+def bcrypt_rounds(hashed: str):
+    """Cost factor of a bcrypt hash ("$2b$12$..." -> 12), or None if not bcrypt"""
+    try:
+        return int(hashed.split("$")[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+def _warm_up(rounds: int):
+    _context(rounds)
+
+
+def _hash(password: str, rounds: int) -> str:
+    return _context(rounds).hash(password)
+
+
+def _verify_and_update(password: str, hashed: str, rounds: int):
+    """Returns (is_valid, new_hash); new_hash is set when the stored cost factor is outdated"""
+    context = _context(rounds)
+    if not context.verify(password, hashed):
+        return False, None
+    if bcrypt_rounds(hashed) != rounds:
+        return True, context.hash(password)
+    return True, None
+
+
+class HasherOverloaded(Exception):
+    """Raised instead of queueing when too many hashing jobs are already waiting"""
+
+
+class LatencyHistogram:
+    BUCKETS_MS = [10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = [0] * (len(self.BUCKETS_MS) + 1)
+        self.total_ms = 0.0
+        self.count = 0
+
+    def observe(self, ms: float):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.BUCKETS_MS, ms)] += 1
+            self.total_ms += ms
+            self.count += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            labels = [f"le_{b}ms" for b in self.BUCKETS_MS] + ["gt_5000ms"]
+            return {
+                "count": self.count,
+                "avg_ms": round(self.total_ms / self.count, 2) if self.count else 0.0,
+                "buckets": dict(zip(labels, self.counts)),
+            }
+
+
+class PasswordHasher:
+    """bcrypt hashing/verification in a dedicated, size-limited process pool.
+
+    Callers block on the result (handlers already run in the server threadpool),
+    but the CPU work happens outside the server process and off its GIL. At most
+    ``max_pending`` jobs may be queued or running; beyond that ``HasherOverloaded``
+    is raised so the API can shed load with a 503.
+
+    Workers are started with ``start_method`` ("spawn" by default): the server
+    process runs background threads, and forking a multithreaded process can
+    leave children deadlocked on locks those threads held. Call ``start()``
+    before starting other threads.
+    """
+
+    def __init__(self, workers: int = 2, max_pending: int = 32, rounds: int = 12, start_method: str = "spawn"):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.rounds = rounds
+        self.start_method = start_method
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.rejected = 0
+        self.histograms = {"hash": LatencyHistogram(), "verify": LatencyHistogram()}
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context(self.start_method),
+            )
+        return self._executor
+
+    def start(self):
+        """Start the worker processes now rather than on the first login"""
+        with self._lock:
+            pool = self._pool()
+        for _ in range(self.workers):
+            pool.submit(_warm_up, self.rounds)
+
+    def _run(self, operation: str, fn, *args):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.rejected += 1
+                raise HasherOverloaded(f"{self._pending} password jobs pending")
+            self._pending += 1
+            pool = self._pool()
+        start = time.perf_counter()
+        try:
+            return pool.submit(fn, *args).result()
+        finally:
+            self.histograms[operation].observe((time.perf_counter() - start) * 1000)
+            with self._lock:
+                self._pending -= 1
+
+    def hash(self, password: str) -> str:
+        return self._run("hash", _hash, password, self.rounds)
+
+    def verify_and_update(self, password: str, hashed: str):
+        return self._run("verify", _verify_and_update, password, hashed, self.rounds)
+
+    def verify(self, password: str, hashed: str) -> bool:
+        return self.verify_and_update(password, hashed)[0]
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "rounds": self.rounds,
+            "pending": self._pending,
+            "max_pending": self.max_pending,
+            "rejected": self.rejected,
+            "latency": {op: h.snapshot() for op, h in self.histograms.items()},
+        }
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
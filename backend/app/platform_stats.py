@@ -0,0 +1,85 @@
+# app/platform_stats.py
+
+import threading
+import time
+from typing import Callable, Dict
+
+
+class PlatformStats:
+    """In-memory platform totals with stale-while-revalidate refresh.
+
+    ``apply`` adjusts the totals on every committed write, so reads are served
+    from memory. Every ``refresh_interval`` seconds the next read triggers a
+    background recount via ``loader`` (and still returns the current values);
+    that also picks up writes made by other worker processes.
+
+    Deltas applied while a load is running are added on top of its result, so
+    a recount cannot wipe them out. A write that commits just before the
+    loader reads the row may then be counted twice until the next refresh.
+    An empty dict from ``get`` means nothing could be loaded yet.
+    """
+
+    def __init__(self, loader: Callable[[], Dict[str, int]], refresh_interval: float = 300.0):
+        self.loader = loader
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._values = None
+        self._loaded_at = 0.0
+        self._refreshing = False
+        self._pending = {}  # deltas applied since the running load started
+
+    def _load(self):
+        try:
+            values = self.loader()
+        except Exception as e:
+            print(f"Platform stats refresh error: {e}")
+            values = None
+        with self._lock:
+            if values is not None:
+                values = dict(values)
+                for key, delta in self._pending.items():
+                    values[key] = values.get(key, 0) + delta
+                self._values = values
+                self._loaded_at = time.monotonic()
+            self._pending = {}
+            self._refreshing = False
+
+    def _begin_load(self):
+        # Caller holds self._lock
+        self._refreshing = True
+        self._pending = {}
+
+    def get(self) -> Dict[str, int]:
+        with self._lock:
+            values = self._values
+            stale = time.monotonic() - self._loaded_at > self.refresh_interval
+            start_refresh = values is not None and stale and not self._refreshing
+            if start_refresh:
+                self._begin_load()
+        if values is None:
+            # Nothing to serve yet: load synchronously once
+            with self._lock:
+                self._begin_load()
+            self._load()
+            with self._lock:
+                return dict(self._values or {})
+        if start_refresh:
+            threading.Thread(target=self._load, name="platform-stats-refresh", daemon=True).start()
+        return dict(values)
+
+    def apply(self, deltas: Dict[str, int]):
+        """Add committed write deltas to the in-memory totals"""
+        with self._lock:
+            if self._refreshing:
+                for key, delta in deltas.items():
+                    self._pending[key] = self._pending.get(key, 0) + delta
+            if self._values is None:
+                return  # the running load adds them, or the first load will count them
+            values = dict(self._values)
+            for key, delta in deltas.items():
+                values[key] = values.get(key, 0) + delta
+            self._values = values
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = 0.0
@@ -0,0 +1,105 @@
+# app/rag_index.py
+
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Dict, List, Tuple
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset("""
+a an and are as at be by can do does for from how i in is it me my of on or so that the this
+to was what when where which who why will with you your
+""".split())
+
+# Title and tag matches count more than body text (BM25F-style field weights)
+FIELD_WEIGHTS = {"title": 3, "tags": 2, "content": 1}
+
+
+def stem(token: str) -> str:
+    """Crude suffix stripping so "swapping", "swaps" and "swap" match"""
+    for suffix in ("ing", "ed", "es", "s"):
+        if len(token) > len(suffix) + 2 and token.endswith(suffix):
+            token = token[:-len(suffix)]
+            if len(token) > 3 and token[-1] == token[-2] and token[-1] not in "aeiouls":
+                token = token[:-1]  # swapp -> swap
+            break
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    return [stem(t) for t in _TOKEN_RE.findall((text or "").lower()) if len(t) > 1 and t not in STOPWORDS]
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token is close enough for budgeting English prompts
+    return len(text) // 4 + 1
+
+
+def chunk_text(chunk: Dict) -> str:
+    return f"{chunk['title']}\n{chunk['content']}"
+
+
+def chunk_terms(chunk: Dict) -> Counter:
+    terms = Counter()
+    tags = " ".join((chunk.get("metadata") or {}).get("tags") or [])
+    for field, text in (("title", chunk.get("title")), ("content", chunk.get("content")), ("tags", tags)):
+        for token in tokenize(text):
+            terms[token] += FIELD_WEIGHTS[field]
+    return terms
+
+
+class BM25Index:
+    """Okapi BM25 over knowledge-base chunks (title, content and metadata.tags)"""
+
+    def __init__(self, chunks: List[Dict], k1: float = 1.2, b: float = 0.75):
+        self.chunks = chunks
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        self.doc_lengths = []
+        for doc_id, chunk in enumerate(chunks):
+            terms = chunk_terms(chunk)
+            self.doc_lengths.append(sum(terms.values()))
+            for term, tf in terms.items():
+                self.postings[term].append((doc_id, tf))
+        self.avg_length = (sum(self.doc_lengths) / len(self.doc_lengths)) if self.doc_lengths else 0.0
+
+    def chunk(self, doc_id: int) -> Dict:
+        return self.chunks[doc_id]
+
+    def idf(self, term: str) -> float:
+        n = len(self.postings.get(term, ()))
+        return math.log(1 + (len(self.chunks) - n + 0.5) / (n + 0.5))
+
+    def search(self, query: str, k: int = 4) -> List[Tuple[float, int]]:
+        """(score, chunk index) of the best ``k`` chunks, best first; chunks without a query term are skipped"""
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = self.idf(term)
+            for doc_id, tf in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / self.avg_length)
+                scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return sorted(((s, d) for d, s in scores.items()), reverse=True)[:k]
+
+
+def select_context(index, query: str, k: int = 4, token_budget: int = 1200) -> List[Dict]:
+    """Best-matching chunks for ``query``, in rank order, that fit in ``token_budget`` prompt tokens"""
+    selected, used = [], 0
+    for _, doc_id in index.search(query, k):
+        chunk = index.chunk(doc_id)
+        cost = estimate_tokens(chunk_text(chunk))
+        if used + cost > token_budget:
+            continue
+        selected.append(chunk)
+        used += cost
+    return selected
+
+
+def format_context(chunks: List[Dict]) -> str:
+    if not chunks:
+        return "(no matching knowledge base entries)"
+    return "\n\n".join(chunk_text(chunk) for chunk in chunks)
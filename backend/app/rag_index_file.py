@@ -0,0 +1,273 @@
+# app/rag_index_file.py
+
+import json
+import mmap
+import os
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: no build lock, concurrent builds just each replace the file
+    fcntl = None
+
+from rag_index import BM25Index, tokenize
+
+MAGIC = b"RWIDX001"
+_ALIGN = 8
+
+
+def hashed_embedding(text: str, dim: int) -> np.ndarray:
+    """Signed feature hashing of character trigrams, L2-normalized.
+
+    Trigrams make the dense score tolerant of inflections and typos
+    ("notifcation" still lands near "notification"), which BM25 terms are not.
+    """
+    vec = np.zeros(dim, dtype=np.float32)
+    for token in tokenize(text):
+        padded = f"<{token}>"
+        for i in range(len(padded) - 2):
+            h = zlib.crc32(padded[i:i + 3].encode())
+            vec[h % dim] += 1.0 if (h >> 31) & 1 else -1.0
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm else vec
+
+
+def build_index_file(chunks: List[Dict], path: str, dense_dim: int = 0, k1: float = 1.2, b: float = 0.75):
+    """Compile chunks into one binary file: term dictionary, postings, documents and optional dense vectors.
+
+    Layout: MAGIC, uint32 header length, JSON header, then 8-byte aligned
+    sections described in the header as {name: [offset, dtype, count]}.
+    The file is written next to ``path`` and renamed over it, so readers that
+    still map the old file are unaffected.
+    """
+    index = BM25Index(chunks, k1=k1, b=b)
+    terms = sorted(index.postings)
+
+    term_bytes = [t.encode() for t in terms]
+    term_offsets = np.zeros(len(terms) + 1, dtype=np.uint32)
+    term_offsets[1:] = np.cumsum([len(t) for t in term_bytes])
+    posting_offsets = np.zeros(len(terms) + 1, dtype=np.uint32)
+    posting_offsets[1:] = np.cumsum([len(index.postings[t]) for t in terms])
+    posting_docs = np.array([d for t in terms for d, _ in index.postings[t]], dtype=np.uint32)
+    posting_tfs = np.array([tf for t in terms for _, tf in index.postings[t]], dtype=np.float32)
+
+    doc_bytes = [json.dumps(c, ensure_ascii=False).encode() for c in chunks]
+    doc_offsets = np.zeros(len(chunks) + 1, dtype=np.uint64)
+    doc_offsets[1:] = np.cumsum([len(d) for d in doc_bytes])
+
+    sections = {
+        "terms": np.frombuffer(b"".join(term_bytes), dtype=np.uint8),
+        "term_offsets": term_offsets,
+        "posting_offsets": posting_offsets,
+        "posting_docs": posting_docs,
+        "posting_tfs": posting_tfs,
+        "doc_lengths": np.array(index.doc_lengths, dtype=np.float32),
+        "docs": np.frombuffer(b"".join(doc_bytes), dtype=np.uint8),
+        "doc_offsets": doc_offsets,
+    }
+    if dense_dim:
+        sections["dense"] = np.stack([hashed_embedding(f"{c['title']} {c['content']}", dense_dim) for c in chunks]) \
+            if chunks else np.zeros((0, dense_dim), dtype=np.float32)
+
+    header = {
+        "n_docs": len(chunks),
+        "n_terms": len(terms),
+        "avg_length": index.avg_length,
+        "k1": k1,
+        "b": b,
+        "dense_dim": dense_dim,
+        "sections": {},
+    }
+    # Two passes: offsets depend on the header length, which depends on the offsets
+    for _ in range(2):
+        header_bytes = json.dumps(header).encode()
+        offset = len(MAGIC) + 4 + len(header_bytes)
+        for name, array in sections.items():
+            offset += -offset % _ALIGN
+            header["sections"][name] = [offset, array.dtype.str, int(array.size)]
+            offset += array.nbytes
+    header_bytes = json.dumps(header).encode()
+
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(MAGIC)
+            f.write(len(header_bytes).to_bytes(4, "little"))
+            f.write(header_bytes)
+            for name, array in sections.items():
+                f.write(b"\0" * (header["sections"][name][0] - f.tell()))
+                f.write(np.ascontiguousarray(array).tobytes())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return header
+
+
+@contextmanager
+def _build_lock(path: str):
+    """Exclusive lock across processes, so only one worker compiles the index at a time"""
+    with open(path, "a") as f:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class MappedIndex:
+    """Read-only BM25 (+ optional dense) index served straight from an mmap'd index file.
+
+    Nothing is copied at load time, so opening is constant-time and every
+    worker process shares the same page-cache pages.
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a knowledge-base index file")
+        header_length = int.from_bytes(self._mm[len(MAGIC):len(MAGIC) + 4], "little")
+        start = len(MAGIC) + 4
+        header = json.loads(self._mm[start:start + header_length])
+        self.n_docs = header["n_docs"]
+        self.avg_length = header["avg_length"] or 1.0
+        self.k1 = header["k1"]
+        self.b = header["b"]
+        self.dense_dim = header["dense_dim"]
+        for name, (offset, dtype, count) in header["sections"].items():
+            setattr(self, f"_{name}", np.frombuffer(self._mm, dtype=np.dtype(dtype), count=count, offset=offset))
+        if self.dense_dim:
+            self._dense = self._dense.reshape(self.n_docs, self.dense_dim)
+
+    def _term(self, i: int) -> bytes:
+        return self._terms[self._term_offsets[i]:self._term_offsets[i + 1]].tobytes()
+
+    def _lookup(self, term: str) -> Optional[int]:
+        """Binary search of the sorted term dictionary"""
+        key = term.encode()
+        lo, hi = 0, len(self._term_offsets) - 1
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._term(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo if lo < len(self._term_offsets) - 1 and self._term(lo) == key else None
+
+    def chunk(self, doc_id: int) -> Dict:
+        return json.loads(self._docs[self._doc_offsets[doc_id]:self._doc_offsets[doc_id + 1]].tobytes())
+
+    def search(self, query: str, k: int = 4, dense_weight: float = 1.0) -> List[Tuple[float, int]]:
+        """(score, chunk index) of the best ``k`` chunks: BM25, plus ``dense_weight`` x cosine when vectors exist"""
+        scores = np.zeros(self.n_docs, dtype=np.float32)
+        for term in set(tokenize(query)):
+            i = self._lookup(term)
+            if i is None:
+                continue
+            start, end = self._posting_offsets[i], self._posting_offsets[i + 1]
+            docs, tfs = self._posting_docs[start:end], self._posting_tfs[start:end]
+            idf = np.log(1 + (self.n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * self._doc_lengths[docs] / self.avg_length)
+            scores[docs] += idf * tfs * (self.k1 + 1) / (tfs + norm)
+        if self.dense_dim and dense_weight:
+            similarity = self._dense @ hashed_embedding(query, self.dense_dim)
+            scores += dense_weight * np.clip(similarity, 0, None)
+        candidates = np.flatnonzero(scores > 0)
+        top = candidates[np.argsort(-scores[candidates], kind="stable")[:k]]
+        return [(float(scores[d]), int(d)) for d in top]
+
+
+class KnowledgeBase:
+    """Hot-reloadable handle on the mmap'd index built from a chunks JSON file.
+
+    ``current()`` re-checks the files at most every ``check_interval`` seconds:
+    a replaced index file is remapped, and a newer chunks file is recompiled
+    when ``auto_build`` is set (one worker builds, the others wait and map the
+    result). Deployments build the index ahead of time with build_rag_index.py;
+    when the index is stale and cannot be written (read-only app directory),
+    the chunks are served from an in-memory BM25Index instead.
+    ``version`` identifies the loaded index (for cache invalidation).
+    """
+
+    def __init__(self, chunks_path: str, index_path: str, dense_dim: int = 0, check_interval: float = 2.0,
+                 auto_build: bool = True):
+        self.chunks_path = chunks_path
+        self.index_path = index_path
+        self.dense_dim = dense_dim
+        self.check_interval = check_interval
+        self.auto_build = auto_build
+        self._lock = threading.Lock()
+        self._index = None
+        self.version = None
+        self._checked_at = 0.0
+        self.reloads = 0
+        self.build_failures = 0
+
+    def _stat(self, path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size, st.st_ino
+
+    def _is_stale(self, chunks_stat, index_stat) -> bool:
+        return bool(chunks_stat) and (index_stat is None or chunks_stat[0] > index_stat[0])
+
+    def _load_chunks(self) -> List[Dict]:
+        with open(self.chunks_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def rebuild(self):
+        """Compile the chunks file into the index file, unless another process just did"""
+        with _build_lock(f"{self.index_path}.lock"):
+            if self._is_stale(self._stat(self.chunks_path), self._stat(self.index_path)):
+                build_index_file(self._load_chunks(), self.index_path, dense_dim=self.dense_dim)
+
+    def _refresh(self):
+        chunks_stat = self._stat(self.chunks_path)
+        index_stat = self._stat(self.index_path)
+        if self._is_stale(chunks_stat, index_stat):
+            if self.version == ("memory", chunks_stat):
+                return  # already serving these chunks from memory
+            if self.auto_build:
+                try:
+                    self.rebuild()
+                except OSError as e:
+                    self.build_failures += 1
+                    print(f"Knowledge base index build error: {e}")
+                index_stat = self._stat(self.index_path)
+            if self._is_stale(chunks_stat, index_stat):
+                self._index = BM25Index(self._load_chunks())
+                self.version = ("memory", chunks_stat)
+                self.reloads += 1
+                return
+        if index_stat != self.version:
+            self._index = MappedIndex(self.index_path)
+            self.version = index_stat
+            self.reloads += 1
+
+    def current(self):
+        """The MappedIndex, or the in-memory BM25Index fallback; both have ``search`` and ``chunk``"""
+        now = time.monotonic()
+        if self._index is not None and now - self._checked_at < self.check_interval:
+            return self._index
+        with self._lock:
+            if self._index is None or now - self._checked_at >= self.check_interval:
+                try:
+                    self._refresh()
+                except Exception as e:
+                    if self._index is None:
+                        raise
+                    print(f"Knowledge base reload error: {e}")  # keep serving the last good index
+                self._checked_at = now
+            return self._index
@@ -0,0 +1,129 @@
+# app/recommendations.py
+
+import heapq
+import threading
+from typing import Callable, Dict, List, Optional
+
+from cache import TTLCache
+
+# Weights of the signals in the final score
+CATEGORY_WEIGHT = 1.0
+TAG_WEIGHT = 0.5
+POPULARITY_WEIGHT = 0.1
+
+
+class RecommendationSnapshot:
+    """Precomputed structures the endpoint reads; built by the background job.
+
+    candidates:         {category_id: [(item_id, owner_id, view_count), ...]} best first
+    item_tags:          {item_id: [tag_id, ...]}
+    category_affinity:  {user_id: {category_id: weight}}
+    tag_affinity:       {user_id: {tag_id: weight}}
+    """
+
+    def __init__(self, candidates=None, item_tags=None, category_affinity=None, tag_affinity=None):
+        self.candidates = candidates or {}
+        self.item_tags = item_tags or {}
+        self.category_affinity = {u: _normalize(w) for u, w in (category_affinity or {}).items()}
+        self.tag_affinity = {u: _normalize(w) for u, w in (tag_affinity or {}).items()}
+        # Global popularity list for anonymous users and cold starts
+        merged = [c for items in self.candidates.values() for c in items]
+        self.popular = sorted(merged, key=lambda c: c[2] or 0, reverse=True)
+
+
+def _normalize(weights: Dict[str, float]) -> Dict[str, float]:
+    top = max((w for w in weights.values() if w > 0), default=0)
+    return {k: w / top for k, w in weights.items() if w > 0} if top else {}
+
+
+class RecommendationEngine:
+    """Top-k merge over per-category candidate lists, weighted by user affinity.
+
+    ``loader()`` returns a fresh RecommendationSnapshot; ``start`` rebuilds it
+    every ``refresh_interval`` seconds in a background thread. Results are
+    cached per (user, category, limit) until the next rebuild or ``cache_ttl``.
+    """
+
+    def __init__(self, loader: Callable[[], RecommendationSnapshot], refresh_interval: float = 600,
+                 cache_size: int = 10000, cache_ttl: float = 300):
+        self.loader = loader
+        self.refresh_interval = refresh_interval
+        self.snapshot = RecommendationSnapshot()
+        self.cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def rebuild(self):
+        try:
+            snapshot = self.loader()
+        except Exception as e:
+            print(f"Recommendation rebuild error: {e}")
+            return False
+        self.snapshot = snapshot
+        self.cache.clear()
+        return True
+
+    def _score(self, snapshot, item_id, category_id, rank, size, categories, tags):
+        score = CATEGORY_WEIGHT * categories.get(category_id, 0.0)
+        item_tags = snapshot.item_tags.get(item_id)
+        if tags and item_tags:
+            score += TAG_WEIGHT * sum(tags.get(t, 0.0) for t in item_tags) / len(item_tags)
+        return score + POPULARITY_WEIGHT * (1 - rank / size)
+
+    def recommend(self, user_id: Optional[str], category_id: Optional[str] = None, limit: int = 10) -> List[str]:
+        """Item ids, best first"""
+        key = (user_id, category_id, limit)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        if limit <= 0:
+            return []
+        snapshot = self.snapshot
+        categories = snapshot.category_affinity.get(user_id, {}) if user_id else {}
+        tags = snapshot.tag_affinity.get(user_id, {}) if user_id else {}
+
+        if category_id:
+            lists = {category_id: snapshot.candidates.get(category_id, [])}
+        elif categories:
+            lists = snapshot.candidates
+        else:
+            # No history: plain popularity
+            lists = {None: snapshot.popular}
+
+        # Lists are best first, so within a list the score is bounded by the category term, the
+        # largest possible tag term and the popularity at the current rank: once that bound falls
+        # below the k-th best score so far, the rest of the list cannot make the top k.
+        max_tag_score = TAG_WEIGHT if tags else 0.0
+        top = []  # min-heap of the best (score, item_id) so far
+        for cat, candidates in sorted(lists.items(), key=lambda kv: categories.get(kv[0], 0.0), reverse=True):
+            size = len(candidates) or 1
+            category_score = CATEGORY_WEIGHT * categories.get(cat, 0.0)
+            for rank, (item_id, owner_id, _) in enumerate(candidates):
+                if len(top) == limit and category_score + max_tag_score + POPULARITY_WEIGHT * (1 - rank / size) < top[0][0]:
+                    break
+                if user_id and owner_id == user_id:
+                    continue
+                entry = (self._score(snapshot, item_id, cat, rank, size, categories, tags), item_id)
+                if len(top) < limit:
+                    heapq.heappush(top, entry)
+                elif entry > top[0]:
+                    heapq.heapreplace(top, entry)
+        result = [item_id for _, item_id in sorted(top, reverse=True)]
+        self.cache.set(key, result)
+        return result
+
+    def _run(self):
+        self.rebuild()
+        while not self._stopped.wait(self.refresh_interval):
+            self.rebuild()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="recommendations", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+Rebuild the materialized user_stats counters from the items, swaps and
+point_transactions tables and report drift. Safe on a live database: the
+counter tables are locked while they are rebuilt, so concurrent writes wait
+instead of being overwritten. On SQLite that lock covers the whole database,
+and writers that wait longer than their busy timeout fail, so rebuild there
+during a quiet period (--check takes no lock). Run from the backend directory:
+
+    python app/reconcile_stats.py [--check]
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.dirname(__file__))
+
+from main import SessionLocal, reconcile_user_stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild user_stats counters")
+    parser.add_argument("--check", action="store_true", help="only report drift, do not rewrite counters")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        report = reconcile_user_stats(db, fix=not args.check)
+    finally:
+        db.close()
+
+    for user_id, diff in report["drift"].items():
+        details = ", ".join(f"{c}: {v['stored']} -> {v['actual']}" for c, v in diff.items())
+        print(f"⚠️  {user_id}: {details}")
+    print(f"✅ Checked {report['users_checked']} users, {report['users_drifted']} drifted"
+          + ("" if args.check else " (counters rebuilt)"))
@@ -0,0 +1,33 @@
+# app/schema_upgrade.py
+
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateColumn, CreateIndex
+
+
+def upgrade_schema(engine, metadata):
+    """Bring tables that already exist up to date with the models.
+
+    ``create_all`` only creates missing tables. Columns added to a model later
+    are added with ``ALTER TABLE ... ADD COLUMN`` (their ``server_default``
+    fills existing rows, so NOT NULL columns must have one), and missing
+    indexes are created. Returns the added "table.column" names.
+    """
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    preparer = engine.dialect.identifier_preparer
+    added = []
+    with engine.begin() as conn:
+        for table in metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing_columns = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+                column_sql = CreateColumn(column).compile(dialect=engine.dialect)
+                conn.execute(text(f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {column_sql}"))
+                added.append(f"{table.name}.{column.name}")
+            for index in table.indexes:
+                # IF NOT EXISTS rather than checkfirst: reflection skips expression indexes
+                conn.execute(CreateIndex(index, if_not_exists=True))
+    return added
@@ -0,0 +1,110 @@
+# app/search_index.py
+
+import re
+from sqlalchemy import text, String, Float, or_, desc
+from sqlalchemy.exc import OperationalError
+
+# Which full-text backend is active: "fts5" (SQLite), "postgres", or None (ILIKE fallback)
+_backend = None
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# Same expression in the index and in queries, so the planner can use the GIN index
+PG_DOCUMENT = "to_tsvector('simple', coalesce({t}title, '') || ' ' || coalesce({t}description, ''))"
+
+
+def init_search_index(engine):
+    """Create the full-text index for items if the database supports one"""
+    global _backend
+    dialect = engine.dialect.name
+    try:
+        with engine.begin() as conn:
+            if dialect == "sqlite":
+                exists = conn.execute(
+                    text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'items_fts'")
+                ).first()
+                if not exists:
+                    conn.execute(text(
+                        "CREATE VIRTUAL TABLE items_fts USING fts5("
+                        "item_id UNINDEXED, title, description, tokenize = 'unicode61')"
+                    ))
+                    # Backfill listings created before the index existed
+                    conn.execute(text(
+                        "INSERT INTO items_fts (item_id, title, description) "
+                        "SELECT id, title, coalesce(description, '') FROM items"
+                    ))
+                _backend = "fts5"
+            elif dialect == "postgresql":
+                # Expression index: Postgres keeps it in sync on every write
+                conn.execute(text(
+                    f"CREATE INDEX IF NOT EXISTS ix_items_fts ON items USING GIN ({PG_DOCUMENT.format(t='')})"
+                ))
+                _backend = "postgres"
+    except OperationalError as e:
+        print(f"Full-text search unavailable, falling back to ILIKE: {e}")
+        _backend = None
+    return _backend
+
+
+def index_item(db, item):
+    """Add or refresh a listing in the index, inside the caller's transaction"""
+    if _backend != "fts5":
+        return
+    db.execute(text("DELETE FROM items_fts WHERE item_id = :id"), {"id": item.id})
+    db.execute(
+        text("INSERT INTO items_fts (item_id, title, description) VALUES (:id, :title, :description)"),
+        {"id": item.id, "title": item.title or "", "description": item.description or ""},
+    )
+
+
+def unindex_item(db, item_id: str):
+    if _backend != "fts5":
+        return
+    db.execute(text("DELETE FROM items_fts WHERE item_id = :id"), {"id": item_id})
+
+
+def _terms(search: str):
+    return _TOKEN_RE.findall(search.lower())
+
+
+def apply_search(query, search: str, item_model):
+    """Filter ``query`` to listings matching ``search``, ranked best-first.
+
+    Every term is prefix-matched, so "jack blu" finds "Blue denim jacket".
+    Returns the new query and whether it is ordered by relevance.
+    """
+    terms = _terms(search)
+    if not terms:
+        return query, False
+
+    if _backend == "fts5":
+        match = " ".join(f'"{t}"*' for t in terms)
+        ranked = (
+            text("SELECT item_id, bm25(items_fts) AS rank FROM items_fts WHERE items_fts MATCH :match")
+            .bindparams(match=match)
+            .columns(item_id=String, rank=Float)
+            .subquery("fts")
+        )
+        query = query.join(ranked, ranked.c.item_id == item_model.id).order_by(ranked.c.rank)
+        return query, True
+
+    if _backend == "postgres":
+        tsquery = " & ".join(f"{t}:*" for t in terms)
+        document = PG_DOCUMENT.format(t="items.")
+        rank = text(f"ts_rank({document}, to_tsquery('simple', :tsquery))").bindparams(tsquery=tsquery)
+        query = (
+            query.filter(text(f"{document} @@ to_tsquery('simple', :tsquery)").bindparams(tsquery=tsquery))
+            .order_by(desc(rank))
+        )
+        return query, True
+
+    # Escape LIKE wildcards so "100%" or "t_shirt" match literally
+    escaped = search.lower().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    search_pattern = f"%{escaped}%"
+    query = query.filter(
+        or_(
+            item_model.title.ilike(search_pattern, escape="\\"),
+            item_model.description.ilike(search_pattern, escape="\\")
+        )
+    )
+    return query, False
@@ -0,0 +1,171 @@
+# app/similarity.py
+
+import math
+import re
+import threading
+import zlib
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# Relative weight of each listing field in the feature vector
+FIELD_WEIGHTS = {
+    "title": 2.0,
+    "description": 0.5,
+    "brand": 1.5,
+    "color": 1.0,
+    "material": 1.0,
+    "tag": 1.5,
+    "category": 2.0,
+}
+
+
+def listing_features(listing: Dict) -> Dict[str, float]:
+    """Weighted "field:token" features of a listing (title, description, brand, color, material, tags, category)"""
+    features: Dict[str, float] = {}
+
+    def add(field, tokens):
+        for token in tokens:
+            key = f"{field}:{token}"
+            features[key] = features.get(key, 0.0) + FIELD_WEIGHTS[field]
+
+    for field in ("title", "description", "brand", "color", "material"):
+        add(field, _TOKEN_RE.findall((listing.get(field) or "").lower()))
+    add("tag", [t.lower() for t in listing.get("tags") or []])
+    if listing.get("category_id"):
+        add("category", [listing["category_id"]])
+    # Sublinear term frequency so long descriptions do not dominate
+    return {k: math.log1p(v) for k, v in features.items()}
+
+
+class SimilarityIndex:
+    """In-memory cosine-similarity index over hashed listing feature vectors.
+
+    Each listing becomes a ``dim``-dimensional signed feature-hashing vector,
+    L2-normalized and stored as one row of a float32 matrix, so a query is a
+    single matrix-vector product (or matrix-matrix for batches). Rows are
+    added/removed incrementally; freed rows are reused. ``dim`` should be well
+    above the number of distinct features a pair of listings is compared on
+    (thousands), or hash collisions dominate the cosine.
+
+    ``rebuild`` replaces the whole contents at once; ``ready`` is False until
+    the first rebuild has finished.
+    """
+
+    def __init__(self, dim: int = 2048, initial_capacity: int = 1024):
+        self.dim = dim
+        self._vectors = np.zeros((initial_capacity, dim), dtype=np.float32)
+        self._alive = np.zeros(initial_capacity, dtype=bool)
+        self._ids: List[Optional[str]] = [None] * initial_capacity
+        self._rows: Dict[str, int] = {}
+        self._free: List[int] = []
+        self._size = 0  # rows in use, including freed ones
+        self._lock = threading.Lock()
+        self.ready = False
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, item_id):
+        return item_id in self._rows
+
+    def vectorize(self, listing: Dict) -> np.ndarray:
+        vec = np.zeros(self.dim, dtype=np.float32)
+        for feature, weight in listing_features(listing).items():
+            h = zlib.crc32(feature.encode())
+            vec[h % self.dim] += weight if (h >> 31) & 1 else -weight
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    def _grow(self):
+        capacity = len(self._alive) * 2
+        vectors = np.zeros((capacity, self.dim), dtype=np.float32)
+        vectors[:self._size] = self._vectors[:self._size]
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:self._size] = self._alive[:self._size]
+        self._ids.extend([None] * (capacity - len(self._ids)))
+        self._vectors, self._alive = vectors, alive
+
+    def add(self, item_id: str, listing: Dict):
+        """Insert or replace a listing"""
+        vec = self.vectorize(listing)
+        with self._lock:
+            row = self._rows.get(item_id)
+            if row is None:
+                if self._free:
+                    row = self._free.pop()
+                else:
+                    if self._size == len(self._alive):
+                        self._grow()
+                    row = self._size
+                    self._size += 1
+                self._rows[item_id] = row
+                self._ids[row] = item_id
+            self._vectors[row] = vec
+            self._alive[row] = True
+
+    def add_many(self, listings: Iterable[Tuple[str, Dict]]):
+        for item_id, listing in listings:
+            self.add(item_id, listing)
+
+    def rebuild(self, listings: Iterable[Tuple[str, Dict]]):
+        """Vectorize ``listings`` into a fresh matrix, then swap it in; queries keep the old one meanwhile"""
+        fresh = SimilarityIndex(self.dim, initial_capacity=max(len(self._alive), 1))
+        fresh.add_many(listings)
+        with self._lock:
+            self._vectors, self._alive, self._ids = fresh._vectors, fresh._alive, fresh._ids
+            self._rows, self._free, self._size = fresh._rows, fresh._free, fresh._size
+            self.ready = True
+
+    def remove(self, item_id: str):
+        with self._lock:
+            row = self._rows.pop(item_id, None)
+            if row is None:
+                return
+            self._alive[row] = False
+            self._vectors[row] = 0
+            self._ids[row] = None
+            self._free.append(row)
+
+    def vector_for(self, item_id: str) -> Optional[np.ndarray]:
+        row = self._rows.get(item_id)
+        return None if row is None else self._vectors[row].copy()
+
+    def query(self, vectors: np.ndarray, k: int = 10, exclude: Optional[List[Optional[str]]] = None):
+        """Top-k cosine neighbours for each row of ``vectors`` (shape (m, dim)).
+
+        Returns one list of (item_id, score) per query, best first. ``exclude``
+        optionally gives one item id per query to leave out (the item itself).
+        """
+        vectors = np.atleast_2d(vectors).astype(np.float32, copy=False)
+        with self._lock:
+            size = self._size
+            ids = self._ids[:size]
+            scores = self._vectors[:size] @ vectors.T  # (size, m)
+            if self._free:
+                scores[~self._alive[:size]] = -np.inf
+            if exclude:
+                for col, item_id in enumerate(exclude):
+                    row = self._rows.get(item_id) if item_id else None
+                    if row is not None:
+                        scores[row, col] = -np.inf
+
+        results = []
+        k = min(k, size)
+        for col in range(scores.shape[1]):
+            if k <= 0:
+                results.append([])
+                continue
+            column = scores[:, col]
+            top = np.argpartition(column, -k)[-k:]
+            top = top[np.argsort(column[top])[::-1]]
+            results.append([(ids[r], float(column[r])) for r in top if np.isfinite(column[r])])
+        return results
+
+    def similar_to(self, item_id: str, k: int = 10) -> List[Tuple[str, float]]:
+        vec = self.vector_for(item_id)
+        if vec is None:
+            return []
+        return self.query(vec, k, exclude=[item_id])[0]
@@ -0,0 +1,130 @@
+# app/uploads.py
+
+import hashlib
+import os
+import uuid
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional; without it no thumbnails are generated
+    Image = None
+
+CHUNK_SIZE = 1024 * 1024
+
+# Allowance for form fields and multipart framing on top of the file bytes
+FORM_OVERHEAD_BYTES = 64 * 1024
+
+
+class UploadBudget:
+    """Byte limits for one request: per file and for all files together"""
+
+    def __init__(self, max_file_bytes: int, max_request_bytes: int):
+        self.max_file_bytes = max_file_bytes
+        self.max_request_bytes = max_request_bytes
+        self.used = 0
+
+
+class UploadSizeLimitMiddleware:
+    """Reject multipart request bodies larger than ``max_body_bytes`` with 413.
+
+    Starlette spools the whole multipart body before the endpoint runs, so the
+    checks in stream_upload_to_disk alone would not bound memory, disk or
+    bandwidth. A too-large Content-Length is refused before anything is read;
+    bodies without one are counted as they arrive and cut off at the limit.
+    """
+
+    def __init__(self, app, max_body_bytes: int):
+        self.app = app
+        self.max_body_bytes = max_body_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        headers = dict(scope.get("headers") or [])
+        if not headers.get(b"content-type", b"").startswith(b"multipart/"):
+            return await self.app(scope, receive, send)
+        too_large = HTTPException(status_code=413, detail=f"Upload exceeds {self.max_body_bytes} bytes per request")
+        try:
+            declared = int(headers.get(b"content-length", b""))
+        except ValueError:
+            declared = None
+        if declared is not None and declared > self.max_body_bytes:
+            response = JSONResponse({"detail": too_large.detail}, status_code=413, headers={"Connection": "close"})
+            return await response(scope, receive, send)
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_bytes:
+                    # Raised inside form parsing; FastAPI turns it into the 413 response
+                    raise too_large
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+def remove_quietly(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+async def stream_upload_to_disk(upload: UploadFile, directory: str, budget: UploadBudget):
+    """Copy an upload to ``directory`` in chunks without blocking the event loop.
+
+    File I/O runs in the thread pool and only one chunk is held in memory at a
+    time. Raises 413 (and removes the partial file) when a limit is exceeded.
+    Returns the path of the written file and the sha256 hex digest of its content.
+    """
+    await run_in_threadpool(os.makedirs, directory, exist_ok=True)
+    path = os.path.join(directory, f"{uuid.uuid4()}.jpg")
+    f = await run_in_threadpool(open, path, "wb")
+    written = 0
+    digest = hashlib.sha256()
+    try:
+        while True:
+            chunk = await upload.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            written += len(chunk)
+            budget.used += len(chunk)
+            if written > budget.max_file_bytes:
+                raise HTTPException(status_code=413, detail=f"Image {upload.filename} exceeds {budget.max_file_bytes} bytes")
+            if budget.used > budget.max_request_bytes:
+                raise HTTPException(status_code=413, detail=f"Upload exceeds {budget.max_request_bytes} bytes per request")
+            digest.update(chunk)
+            await run_in_threadpool(f.write, chunk)
+    except BaseException:
+        await run_in_threadpool(f.close)
+        await run_in_threadpool(remove_quietly, path)
+        raise
+    await run_in_threadpool(f.close)
+    return path, digest.hexdigest()
+
+
+def make_thumbnail(path: str, max_side: int = 400, quality: int = 80):
+    """Write a WebP thumbnail next to ``path``; returns its path, or None if unavailable"""
+    if Image is None:
+        return None
+    root, _ = os.path.splitext(path)
+    thumb_path = f"{root}_thumb.webp"
+    if os.path.exists(thumb_path):
+        return thumb_path
+    try:
+        with Image.open(path) as img:
+            img.thumbnail((max_side, max_side))
+            if img.mode not in ("RGB", "RGBA"):
+                img = img.convert("RGB")
+            img.save(thumb_path, "WEBP", quality=quality)
+    except Exception as e:
+        print(f"Thumbnail error for {path}: {e}")
+        return None
+    return thumb_path
@@ -0,0 +1,126 @@
+# app/view_buffer.py
+
+import threading
+from collections import defaultdict
+from datetime import datetime
+
+
+class ViewBuffer:
+    """In-process write-behind buffer for item page views.
+
+    Views are collected in memory and handed to ``flush_fn(counts, logs)`` in
+    one batch, either every ``interval`` seconds or as soon as ``max_pending``
+    events are waiting. At most ``max_pending`` events are ever held, so that
+    is also the most a crash can lose. Views beyond that are dropped and
+    counted in ``stats()``: while flushes keep failing (database outage), or
+    while a slow flush is running and traffic refills the buffer
+    (``dropped_during_flush``, part of ``dropped``).
+    """
+
+    def __init__(self, flush_fn, interval: float = 5.0, max_pending: int = 1000):
+        self.flush_fn = flush_fn
+        self.interval = interval
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._counts = defaultdict(int)
+        self._logs = []
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self.flushed = 0
+        self.dropped = 0
+        self.dropped_during_flush = 0
+        self.flush_failures = 0
+        self._flushing = False
+
+    def record(self, item_id: str, user_id=None, user_agent=None, ip_address=None):
+        """Queue a single view; never touches the database"""
+        with self._lock:
+            if len(self._logs) >= self.max_pending:
+                # The buffer is flushed as soon as it fills up, so it is only full again while
+                # flushes fail or while a flush is still writing the previous batch
+                self.dropped += 1
+                if self._flushing:
+                    self.dropped_during_flush += 1
+                self._wakeup.set()
+                return
+            self._counts[item_id] += 1
+            self._logs.append({
+                "item_id": item_id,
+                "user_id": user_id,
+                "user_agent": user_agent,
+                "ip_address": ip_address,
+                "created_at": datetime.utcnow(),
+            })
+            pending = len(self._logs)
+        if pending >= self.max_pending:
+            self._wakeup.set()
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._logs)
+
+    def flush(self):
+        """Swap out the pending batch and write it with a single flush_fn call"""
+        with self._lock:
+            if not self._logs:
+                return 0
+            counts, logs = dict(self._counts), self._logs
+            self._counts = defaultdict(int)
+            self._logs = []
+            self._flushing = True
+        try:
+            self.flush_fn(counts, logs)
+        except Exception as e:
+            print(f"View flush error: {e}")
+            # Put the batch back so the next flush retries it, oldest views first out beyond max_pending
+            with self._lock:
+                self._flushing = False
+                self.flush_failures += 1
+                merged = logs + self._logs
+                overflow, self._logs = merged[:-self.max_pending or None], merged[-self.max_pending:]
+                for item_id, n in counts.items():
+                    self._counts[item_id] += n
+                for log in overflow:
+                    self._counts[log["item_id"]] -= 1
+                    if not self._counts[log["item_id"]]:
+                        del self._counts[log["item_id"]]
+                self.dropped += len(overflow)
+            return 0
+        with self._lock:
+            self._flushing = False
+            self.flushed += len(logs)
+        return len(logs)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "pending": len(self._logs),
+                "max_pending": self.max_pending,
+                "flushed": self.flushed,
+                "dropped": self.dropped,
+                "dropped_during_flush": self.dropped_during_flush,
+                "flush_failures": self.flush_failures,
+            }
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="view-buffer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the flusher thread and write whatever is still pending"""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout=self.interval + 1)
+            self._thread = None
+        self.flush()
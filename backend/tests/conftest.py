@@ -0,0 +1,30 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app")
+sys.path.insert(0, APP_DIR)
+
+# Set before anything imports database.py, so the suite never touches the DATABASE_URL from .env
+os.environ["DATABASE_URL"] = os.getenv("TEST_DATABASE_URL") or "sqlite:///" + os.path.join(tempfile.mkdtemp(), "test.db")
+os.environ.setdefault("MODERATION_CLASSIFIER", "keyword")
+
+OPTIONAL_APP_PACKAGES = {"google", "langchain_groq", "langchain_core"}
+
+
+@pytest.fixture(scope="session")
+def app_module():
+    """The FastAPI app module, on the test database (TEST_DATABASE_URL, or a throwaway SQLite file).
+
+    Skipped only when an optional LLM client (google-generativeai,
+    langchain-groq) is not installed; any other import error fails the suite.
+    """
+    try:
+        import main
+    except ModuleNotFoundError as e:
+        if (e.name or "").split(".")[0] not in OPTIONAL_APP_PACKAGES:
+            raise
+        pytest.skip(f"optional package {e.name} is not installed")
+    return main
@@ -0,0 +1,71 @@
+import pytest
+
+from answer_cache import AnswerCache, normalize_question, question_tokens
+
+
+def test_normalize_question():
+    assert normalize_question("  How do I EARN points?! ") == "how do i earn points"
+
+
+def test_question_tokens_keep_question_words_and_negations():
+    assert question_tokens("How do I swap?") == ["how", "swap"]
+    assert "not" in question_tokens("Why can't I swap?")
+    assert "not" in question_tokens("I cannot log in")
+
+
+def test_exact_hit_ignores_case_and_punctuation():
+    cache = AnswerCache()
+    cache.set("How do I swap?", "Send a swap request.")
+    assert cache.get("how do i swap") == "Send a swap request."
+    assert cache.stats()["exact_hits"] == 1
+
+
+def test_near_duplicate_hit():
+    cache = AnswerCache()
+    cache.set("How can I earn points?", "List items.")
+    assert cache.get("how do I earn points") == "List items."
+    assert cache.stats()["similar_hits"] == 1
+
+
+@pytest.mark.parametrize("question", [
+    "When can I swap?",
+    "Who can I swap with?",
+    "Where do I swap?",
+    "Can I swap?",
+    "Why can't I swap?",
+])
+def test_different_short_questions_do_not_share_an_answer(question):
+    cache = AnswerCache()
+    cache.set("How do I swap?", "Send a swap request.")
+    assert cache.get(question) is None
+
+
+@pytest.mark.parametrize("cached, question", [
+    ("How do I earn points?", "When do I earn points?"),
+    ("Why can I redeem items with points?", "Why can't I redeem items with points?"),
+])
+def test_question_word_and_negation_changes_miss(cached, question):
+    cache = AnswerCache()
+    cache.set(cached, "answer")
+    assert cache.get(question) is None
+
+
+def test_version_change_clears_cache():
+    cache = AnswerCache()
+    cache.set("How do I earn points?", "answer", version=1)
+    assert cache.get("How do I earn points?", version=2) is None
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_ttl_and_lru_eviction(monkeypatch):
+    import answer_cache
+    now = [1000.0]
+    monkeypatch.setattr(answer_cache.time, "monotonic", lambda: now[0])
+    cache = AnswerCache(maxsize=2, ttl=10)
+    cache.set("first question about points", "1")
+    cache.set("second question about swaps", "2")
+    cache.set("third question about items", "3")
+    assert len(cache) == 2
+    assert cache.get("first question about points") is None
+    now[0] += 11
+    assert cache.get("third question about items") is None
@@ -0,0 +1,17 @@
+import uuid
+
+
+def test_optional_user_resolves_token_subject(app_module):
+    main = app_module
+    db = main.SessionLocal()
+    try:
+        user = main.User(id=str(uuid.uuid4()), email=f"{uuid.uuid4().hex}@example.com")
+        db.add(user)
+        db.commit()
+        token = main.create_access_token(data={"sub": user.email})
+
+        assert main.get_current_user_optional(token, db).id == user.id
+        assert main.get_current_user_optional(None, db) is None
+        assert main.get_current_user_optional("not-a-token", db) is None
+    finally:
+        db.close()
@@ -0,0 +1,97 @@
+"""Keyset (cursor) paging of GET /items walks the same rows, in the same order, as skip/limit."""
+
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException, Response
+
+VIEW_COUNTS = [5, None, 3, None, 5, 0, 1]
+
+
+@pytest.fixture
+def category_id(app_module):
+    """A category of its own holding one approved item per VIEW_COUNTS entry (None stored as NULL)"""
+    main = app_module
+    db = main.SessionLocal()
+    try:
+        user = main.User(id=str(uuid.uuid4()), email=f"{uuid.uuid4().hex}@example.com")
+        category = main.Category(id=str(uuid.uuid4()), name=f"cat-{uuid.uuid4().hex[:8]}")
+        db.add_all([user, category])
+        start = datetime(2024, 1, 1)
+        unviewed = []
+        for i, views in enumerate(VIEW_COUNTS):
+            # Pairs share a created_at so the id tiebreaker is exercised too
+            item = main.Item(id=str(uuid.uuid4()), title=f"Item {i}", condition="GOOD", item_type="TOP",
+                             category_id=category.id, user_id=user.id, is_approved=True, is_available=True,
+                             created_at=start + timedelta(days=i // 2), view_count=views)
+            db.add(item)
+            if views is None:
+                unviewed.append(item.id)
+        db.commit()
+        # The column default fills in None on INSERT; rows from before it existed hold NULL
+        db.query(main.Item).filter(main.Item.id.in_(unviewed)).update({"view_count": None}, synchronize_session=False)
+        db.commit()
+        nulls = db.query(main.Item).filter(main.Item.category_id == category.id,
+                                           main.Item.view_count.is_(None)).count()
+        assert nulls == VIEW_COUNTS.count(None)
+        return category.id
+    finally:
+        db.close()
+
+
+def browse(main, category_id, sort_by, skip=0, limit=2, cursor=None):
+    db = main.SessionLocal()
+    try:
+        response = Response()
+        items = main.browse_items(category_id=category_id, tags=None, condition=None, item_type=None,
+                                  search=None, sort_by=sort_by, skip=skip, limit=limit, cursor=cursor,
+                                  response=response, db=db)
+        return [item.id for item in items], response.headers.get("X-Next-Cursor")
+    finally:
+        db.close()
+
+
+def test_cursor_round_trip(app_module):
+    main = app_module
+    created_at = datetime(2024, 5, 17, 12, 30, 1, 250)
+    assert main.decode_cursor(main.encode_cursor(created_at, "item-1")) == (created_at.isoformat(), "item-1")
+    assert main.decode_cursor(main.encode_cursor(7, "item-2")) == (7, "item-2")
+    with pytest.raises(HTTPException) as exc:
+        main.decode_cursor("not a cursor")
+    assert exc.value.status_code == 400
+
+
+@pytest.mark.parametrize("sort_by", ["newest", "popular"])
+def test_cursor_pages_match_skip_limit(app_module, category_id, sort_by):
+    main = app_module
+    expected, _ = browse(main, category_id, sort_by, limit=len(VIEW_COUNTS))
+    assert len(expected) == len(VIEW_COUNTS)
+
+    seen, cursor = [], None
+    for skip in range(0, len(VIEW_COUNTS), 2):
+        page, next_cursor = browse(main, category_id, sort_by, cursor=cursor)
+        assert page == browse(main, category_id, sort_by, skip=skip)[0]
+        seen += page
+        cursor = next_cursor
+        if cursor is None:
+            break
+    assert seen == expected
+
+
+def test_popular_ranks_null_view_counts_as_zero(app_module, category_id):
+    main = app_module
+    ids, _ = browse(main, category_id, "popular", limit=len(VIEW_COUNTS))
+    db = main.SessionLocal()
+    try:
+        views = [db.get(main.Item, item_id).view_count or 0 for item_id in ids]
+    finally:
+        db.close()
+    assert views == sorted((v or 0 for v in VIEW_COUNTS), reverse=True)
+
+
+def test_popular_cursor_with_a_non_numeric_key_is_rejected(app_module, category_id):
+    main = app_module
+    with pytest.raises(HTTPException) as exc:
+        browse(main, category_id, "popular", cursor=main.encode_cursor("2024-01-01T00:00:00", "x"))
+    assert exc.value.status_code == 400
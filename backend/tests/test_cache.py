@@ -0,0 +1,37 @@
+import threading
+
+from cache import TTLCache
+
+
+def test_lru_eviction_and_stats():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_expired_entries_are_misses():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1, ttl=-1)
+    assert cache.get("a", "missing") == "missing"
+    assert len(cache) == 0
+
+
+def test_backfills_are_counted_exactly_across_threads():
+    cache = TTLCache(maxsize=100, ttl=60)
+
+    def backfill(worker):
+        for i in range(1000):
+            cache.set((worker, i % 10), i, backfill=True)
+
+    threads = [threading.Thread(target=backfill, args=(w,)) for w in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    cache.set("plain", 1)
+    assert cache.stats()["backfills"] == 8000
@@ -0,0 +1,80 @@
+import pytest
+from fastapi import HTTPException
+
+import chat_sessions
+from chat_sessions import ChatSessionStore, extractive_summary
+
+
+def test_ids_are_generated_by_the_server():
+    store = ChatSessionStore()
+    a, b = store.create(), store.create()
+    assert a.id != b.id and len(a.id) >= 32
+    assert store.get(a.id) is a
+
+
+def test_unknown_ids_are_not_created():
+    store = ChatSessionStore()
+    assert store.get("made-up-by-a-client") is None
+    assert len(store) == 0
+
+
+def test_sessions_are_bound_to_their_owner():
+    store = ChatSessionStore()
+    session = store.create(owner_id="alice")
+    assert store.get(session.id, owner_id="alice") is session
+    assert store.get(session.id, owner_id="mallory") is None
+    assert store.get(session.id) is None
+    anonymous = store.create()
+    assert store.get(anonymous.id, owner_id="alice") is None
+
+
+def test_window_and_summary():
+    store = ChatSessionStore(window_turns=2)
+    session = store.create()
+    for i in range(4):
+        store.record_turn(session, f"question {i}", f"Answer {i}. More detail.")
+    assert [q for q, _ in session.turns] == ["question 2", "question 3"]
+    assert session.summary.splitlines() == ["- Q: question 0 A: Answer 0.", "- Q: question 1 A: Answer 1."]
+    summary, turns = session.history(token_budget=1000)
+    assert summary == session.summary and len(turns) == 2
+
+
+def test_history_respects_token_budget():
+    store = ChatSessionStore(window_turns=10)
+    session = store.create()
+    for i in range(5):
+        store.record_turn(session, "q" * 40, "a" * 40)
+    _, turns = session.history(token_budget=45)
+    assert len(turns) == 2
+
+
+def test_expiry_and_lru_eviction(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(chat_sessions.time, "monotonic", lambda: now[0])
+    store = ChatSessionStore(maxsize=2, ttl=10)
+    first, second = store.create(), store.create()
+    store.get(first.id)
+    store.create()
+    assert store.get(second.id) is None  # least recently used
+    assert store.stats()["evicted"] == 1
+    now[0] += 11
+    assert store.get(first.id) is None
+    assert store.stats()["expired"] == 2
+
+
+def test_extractive_summary_is_bounded():
+    summary = extractive_summary("", [(f"question {i}", "x" * 200) for i in range(50)], max_tokens=100)
+    assert summary.count("\n") < 49
+    assert "question 49" in summary
+
+
+def test_endpoint_rejects_unknown_and_foreign_conversations(app_module):
+    main = app_module
+    alice, bob = main.User(id="alice"), main.User(id="bob")
+    session = main.chat_session_for(main.ChatRequest(message="hi"), alice)
+    assert session.owner_id == "alice"
+    assert main.chat_session_for(main.ChatRequest(message="hi", conversation_id=session.id), alice) is session
+    for conversation_id, user in ((session.id, bob), (session.id, None), ("guessed", alice)):
+        with pytest.raises(HTTPException) as exc:
+            main.chat_session_for(main.ChatRequest(message="hi", conversation_id=conversation_id), user)
+        assert exc.value.status_code == 404
@@ -0,0 +1,158 @@
+import asyncio
+import json
+import uuid
+
+import pytest
+from fastapi import HTTPException
+
+
+class Chunk:
+    def __init__(self, content):
+        self.content = content
+
+
+class FakeLLM:
+    """Stands in for the ChatGroq client: ``astream`` yields ``parts`` (raising Exceptions), ``delay`` seconds apart"""
+
+    def __init__(self, parts, delay=0.0):
+        self.parts = parts
+        self.delay = delay
+        self.calls = 0
+        self.closed = False
+
+    async def astream(self, messages):
+        self.calls += 1
+        try:
+            for part in self.parts:
+                await asyncio.sleep(self.delay)
+                if isinstance(part, Exception):
+                    raise part
+                yield Chunk(part)
+        finally:
+            self.closed = True
+
+    async def ainvoke(self, messages):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return Chunk("".join(self.parts))
+
+
+@pytest.fixture
+def use_llm(app_module, monkeypatch):
+    """Installs a FakeLLM (and timeout) on the app, with a one-slot cap and no knowledge-base lookups"""
+    main = app_module
+    monkeypatch.setattr(main, "build_chat_messages", lambda question, session: [question])
+    monkeypatch.setattr(main, "knowledge_base_version", lambda: 1)
+    monkeypatch.setattr(main, "chatbot_slots", asyncio.Semaphore(1))
+
+    def use(parts, delay=0.0, timeout=5.0):
+        fake = FakeLLM(parts, delay)
+        monkeypatch.setattr(main, "llm", fake)
+        monkeypatch.setattr(main, "CHATBOT_TIMEOUT_SECONDS", timeout)
+        return fake
+
+    return use
+
+
+def question():
+    return f"How do points work? {uuid.uuid4().hex}"  # unique, so the answer cache never hits by accident
+
+
+async def stream_events(main, message):
+    response = await main.ask_rewear_bot_stream(main.ChatRequest(message=message), current_user=None)
+    events = []
+    async for raw in response.body_iterator:
+        lines = dict(line.split(": ", 1) for line in raw.strip().splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def test_stream_llm_skips_empty_chunks_and_closes_the_stream(app_module, use_llm):
+    main = app_module
+    fake = use_llm(["Earn ", "", "points"])
+
+    async def collect():
+        return [text async for text in main.stream_llm([], timeout=1.0)]
+
+    assert asyncio.run(collect()) == ["Earn ", "points"]
+    assert fake.closed
+
+
+def test_stream_llm_times_out(app_module, use_llm):
+    main = app_module
+    fake = use_llm(["slow"] * 10, delay=0.05)
+
+    async def collect():
+        return [text async for text in main.stream_llm([], timeout=0.12)]
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(collect())
+    assert fake.closed
+
+
+def test_stream_sends_tokens_then_done_and_caches_the_answer(app_module, use_llm):
+    main = app_module
+    fake = use_llm(["List an item", " to earn points."])
+    message = question()
+
+    events = asyncio.run(stream_events(main, message))
+    assert [name for name, _ in events] == ["token", "token", "done"]
+    assert [data["text"] for _, data in events[:2]] == ["List an item", " to earn points."]
+    assert events[-1][1]["response"] == "List an item to earn points."
+    assert events[-1][1]["conversation_id"]
+
+    # A repeated first-turn question is answered from the cache, without the LLM
+    cached = asyncio.run(stream_events(main, message))
+    assert cached[-1][0] == "done"
+    assert cached[-1][1]["response"] == "List an item to earn points."
+    assert fake.calls == 1
+
+
+def test_stream_reports_llm_failures_as_an_error_event(app_module, use_llm):
+    main = app_module
+    use_llm(["Partial", RuntimeError("upstream reset")])
+    events = asyncio.run(stream_events(main, question()))
+    assert [name for name, _ in events] == ["token", "error"]
+    assert "upstream reset" in events[-1][1]["detail"]
+
+
+def test_stream_reports_timeouts_as_an_error_event(app_module, use_llm):
+    main = app_module
+    use_llm(["slow"] * 10, delay=0.05, timeout=0.12)
+    events = asyncio.run(stream_events(main, question()))
+    assert events[-1] == ("error", {"detail": "Chatbot timed out"})
+    assert all(name == "token" for name, _ in events[:-1])
+
+
+@pytest.mark.parametrize("endpoint", ["ask_rewear_bot_stream", "ask_rewear_bot"])
+def test_busy_when_every_slot_is_taken(app_module, use_llm, endpoint):
+    main = app_module
+    fake = use_llm(["unused"])
+
+    async def ask_while_full():
+        async with main.chatbot_slots:
+            await getattr(main, endpoint)(main.ChatRequest(message=question()), current_user=None)
+
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(ask_while_full())
+    assert exc.value.status_code == 503
+    assert exc.value.headers == {"Retry-After": "1"}
+    assert fake.calls == 0
+
+
+def test_ask_answers_and_releases_its_slot(app_module, use_llm):
+    main = app_module
+    use_llm(["Swap directly ", "or redeem points. "])
+    answer = asyncio.run(main.ask_rewear_bot(main.ChatRequest(message=question()), current_user=None))
+    assert answer["response"] == "Swap directly or redeem points."
+    assert answer["conversation_id"]
+    assert not main.chatbot_slots.locked()
+
+
+def test_ask_times_out_with_504(app_module, use_llm):
+    main = app_module
+    use_llm(["late"], delay=0.2, timeout=0.05)
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(main.ask_rewear_bot(main.ChatRequest(message=question()), current_user=None))
+    assert exc.value.status_code == 504
+    assert not main.chatbot_slots.locked()
@@ -0,0 +1,183 @@
+"""Double-spend and double-accept races: concurrent requests may fail, but never both succeed."""
+
+import threading
+import uuid
+
+import pytest
+from fastapi import HTTPException
+
+THREADS = 8
+
+
+def race(n, fn):
+    """Run ``fn(i)`` in ``n`` threads released at once; returns how many returned without raising"""
+    barrier = threading.Barrier(n)
+    successes = []
+
+    def run(i):
+        barrier.wait()
+        try:
+            fn(i)
+            successes.append(i)
+        except Exception:
+            pass
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return len(successes)
+
+
+@pytest.fixture
+def make_user(app_module):
+    def make(points=0):
+        db = app_module.SessionLocal()
+        try:
+            user = app_module.User(id=str(uuid.uuid4()), email=f"{uuid.uuid4().hex}@example.com",
+                                   points_balance=points, is_verified=True)
+            db.add(user)
+            db.commit()
+            return user.id
+        finally:
+            db.close()
+    return make
+
+
+def make_item(main, owner_id, points=0):
+    db = main.SessionLocal()
+    try:
+        item = main.Item(id=str(uuid.uuid4()), title="Jacket", condition="GOOD", item_type="TOP",
+                         user_id=owner_id, points_value=points, is_approved=True, is_available=True)
+        db.add(item)
+        db.commit()
+        return item.id
+    finally:
+        db.close()
+
+
+def call_as(main, user_id, endpoint, *args):
+    db = main.SessionLocal()
+    try:
+        user = db.get(main.User, user_id)
+        return endpoint(*args, db=db, current_user=user)
+    finally:
+        db.close()
+
+
+def balances(main, *user_ids):
+    db = main.SessionLocal()
+    try:
+        return [db.get(main.User, user_id).points_balance for user_id in user_ids]
+    finally:
+        db.close()
+
+
+def test_double_spend(app_module, make_user):
+    main = app_module
+    buyer = make_user(points=100)
+    seller = make_user()
+    items = [make_item(main, seller, points=60) for _ in range(THREADS)]
+
+    succeeded = race(THREADS, lambda i: call_as(main, buyer, main.redeem_item_with_points, items[i]))
+
+    assert succeeded == 1
+    assert balances(main, buyer, seller) == [40, 60]
+
+
+def test_same_item_redeemed_once(app_module, make_user):
+    main = app_module
+    seller = make_user()
+    buyers = [make_user(points=100) for _ in range(THREADS)]
+    item = make_item(main, seller, points=30)
+
+    succeeded = race(THREADS, lambda i: call_as(main, buyers[i], main.redeem_item_with_points, item))
+
+    assert succeeded == 1
+    assert sum(balances(main, seller, *buyers)) == 100 * THREADS
+    assert balances(main, seller) == [30]
+
+
+def test_double_accept(app_module, make_user):
+    main = app_module
+    recipient = make_user()
+    wanted = make_item(main, recipient)
+    swap_ids = []
+    db = main.SessionLocal()
+    try:
+        for _ in range(THREADS):
+            initiator = make_user()
+            swap = main.Swap(id=str(uuid.uuid4()), initiator_id=initiator, recipient_id=recipient,
+                             initiator_item_id=make_item(main, initiator), recipient_item_id=wanted,
+                             status="PENDING")
+            db.add(swap)
+            swap_ids.append(swap.id)
+        db.commit()
+    finally:
+        db.close()
+
+    accept = main.SwapStatusUpdate(status="ACCEPTED")
+    succeeded = race(THREADS, lambda i: call_as(main, recipient, main.update_swap_status, swap_ids[i], accept))
+
+    assert succeeded == 1
+    db = main.SessionLocal()
+    try:
+        statuses = [db.get(main.Swap, swap_id).status for swap_id in swap_ids]
+    finally:
+        db.close()
+    assert statuses.count("ACCEPTED") == 1
+
+
+def test_transfer_rejects_non_positive_amounts(app_module, make_user):
+    main = app_module
+    a, b = make_user(points=10), make_user(points=10)
+    db = main.SessionLocal()
+    try:
+        for amount in (0, -5):
+            with pytest.raises(HTTPException) as exc:
+                main.transfer_points(db, a, b, amount)
+            assert exc.value.status_code == 400
+        db.rollback()
+    finally:
+        db.close()
+    assert balances(main, a, b) == [10, 10]
+
+
+def test_free_item_can_be_redeemed(app_module, make_user):
+    main = app_module
+    seller, buyer = make_user(), make_user(points=0)
+    item = make_item(main, seller, points=0)
+
+    assert call_as(main, buyer, main.redeem_item_with_points, item) == {"message": "Item redeemed successfully"}
+    assert balances(main, seller, buyer) == [0, 0]
+    db = main.SessionLocal()
+    try:
+        assert db.get(main.Item, item).is_available is False
+    finally:
+        db.close()
+
+
+def test_unscored_listing_is_claimed_by_one_sweeper(app_module, make_user):
+    main = app_module
+    owner = make_user()
+    db = main.SessionLocal()
+    try:
+        pending = [main.Item(id=str(uuid.uuid4()), title="Jacket", condition="GOOD", item_type="TOP", user_id=owner)
+                   for _ in range(3)]
+        db.add_all(pending)
+        db.commit()
+        item_ids = {item.id for item in pending}
+    finally:
+        db.close()
+    claims = []
+
+    def sweep(i):
+        db = main.SessionLocal()
+        try:
+            claims.extend(item_id for item_id, _, _ in main.claim_unscored_items(db, 1000) if item_id in item_ids)
+        finally:
+            db.close()
+
+    race(THREADS, sweep)
+    assert sorted(claims) == sorted(item_ids)
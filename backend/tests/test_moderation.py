@@ -0,0 +1,87 @@
+import uuid
+from datetime import datetime, timedelta
+
+from moderation import KeywordClassifier, ModerationQueue, parse_batch_verdicts, retry_delay
+
+
+def test_parse_batch_verdicts():
+    text = "1: FLAG\n2: ok\n**3** - Flag\n"
+    assert parse_batch_verdicts(text, 3) == [True, False, True]
+
+
+def test_parse_batch_verdicts_leaves_missing_and_conflicting_answers_unscored():
+    text = "1: OK\n1: FLAG\n3: FLAG\n7: OK\nsorry, I cannot help with listing 2"
+    assert parse_batch_verdicts(text, 3) == [None, None, True]
+    assert parse_batch_verdicts("", 2) == [None, None]
+
+
+def make_queue(classifier):
+    saved = []
+    queue = ModerationQueue(classifier, saved.append, batch_size=8)
+    return queue, saved
+
+
+def test_unscored_listings_are_not_saved():
+    queue, saved = make_queue(lambda listings: [True, None, False])
+    for item_id in ["a", "b", "c"]:
+        queue.submit(item_id, "title", "description")
+    queue.drain()
+    assert saved == [{"a": True, "c": False}]
+    assert queue.unscored == 1
+
+
+def test_classifier_error_saves_nothing():
+    def failing(listings):
+        raise RuntimeError("API unavailable")
+
+    queue, saved = make_queue(failing)
+    queue.submit("a", "title", "description")
+    queue.drain()
+    assert saved == []
+    assert queue.unscored == 1
+
+
+def test_keyword_classifier():
+    queue, saved = make_queue(KeywordClassifier())
+    queue.submit("spam", "Jacket", "BUY NOW at visit cheap.com")
+    queue.submit("clean", "Jacket", "Lightly worn denim jacket")
+    queue.drain()
+    assert saved == [{"spam": True, "clean": False}]
+
+
+def test_retry_delay_doubles_up_to_the_cap():
+    assert [retry_delay(n, 60, 3600) for n in range(8)] == [60, 120, 240, 480, 960, 1920, 3600, 3600]
+    assert retry_delay(10_000, 60, 3600) == 3600
+
+
+def test_expired_moderation_lease_is_claimed_again_with_backoff(app_module):
+    main = app_module
+    db = main.SessionLocal()
+    try:
+        owner = main.User(id=str(uuid.uuid4()), email=f"{uuid.uuid4().hex}@example.com")
+        item = main.Item(id=str(uuid.uuid4()), title="Jacket", condition="GOOD", item_type="TOP", user_id=owner.id)
+        db.add_all([owner, item])
+        db.commit()
+
+        def claim():
+            claimed = [item_id for item_id, _, _ in main.claim_unscored_items(db, 1000)]
+            db.refresh(item)
+            return item.id in claimed
+
+        assert claim()
+        assert item.moderation_attempts == 1
+        first_lease = item.moderation_retry_at - datetime.utcnow()
+        assert not claim()  # leased to the worker that claimed it
+
+        item.moderation_retry_at = datetime.utcnow() - timedelta(seconds=1)  # that worker never scored it
+        db.commit()
+        assert claim()
+        assert item.moderation_attempts == 2
+        assert item.moderation_retry_at - datetime.utcnow() > first_lease * 1.5
+
+        main.save_moderation_results({item.id: False})
+        item.moderation_retry_at = None
+        db.commit()
+        assert not claim()  # scored listings are never claimed
+    finally:
+        db.close()
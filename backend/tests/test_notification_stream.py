@@ -0,0 +1,142 @@
+import asyncio
+import json
+import os
+import uuid
+from datetime import timedelta
+
+import pytest
+from fastapi import HTTPException
+
+from notification_broker import InMemoryBroker, NotificationBroker, PostgresNotifyBroker
+
+
+def test_broker_interface_is_abstract():
+    class Incomplete(NotificationBroker):
+        def publish(self, user_id, event):
+            pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_in_memory_broker_fans_out_to_the_users_subscriptions():
+    async def scenario():
+        broker = InMemoryBroker(max_queue=1)
+        mine, other = broker.subscribe("u1"), broker.subscribe("u2")
+        broker.publish("u1", {"id": "n1"})
+        broker.publish("u1", {"id": "n2"})  # queue full: dropped
+        await asyncio.sleep(0)
+        assert await mine.get() == {"id": "n1"}
+        assert other.queue.empty()
+        broker.unsubscribe(mine)
+        broker.unsubscribe(other)
+        return broker.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["connections"] == 0
+    assert stats["published"] == 2
+    assert stats["dropped"] == 1
+
+
+class UnreachableEngine:
+    def begin(self):
+        raise ConnectionError("database unavailable")
+
+
+def test_postgres_broker_fans_received_payloads_out_to_local_subscribers():
+    async def scenario():
+        broker = PostgresNotifyBroker(UnreachableEngine(), max_queue=10)
+        mine, other = broker.subscribe("u1"), broker.subscribe("u2")
+        broker.receive(json.dumps({"user_id": "u1", "event": {"id": "n1"}}))
+        broker.receive("not json")
+        broker.receive(json.dumps({"event": {"id": "no user"}}))
+        await asyncio.sleep(0)
+        assert await mine.get() == {"id": "n1"}
+        assert mine.queue.empty() and other.queue.empty()
+        broker.publish("u1", {"id": "n2"})  # a failed NOTIFY is counted, not raised into the commit hook
+        broker.unsubscribe(mine)
+        broker.unsubscribe(other)
+        return broker.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["connections"] == 0
+    assert stats["published"] == 1
+    assert stats["publish_failures"] == 1
+
+
+@pytest.mark.skipif(not (os.getenv("TEST_DATABASE_URL") or "").startswith("postgresql"),
+                    reason="needs TEST_DATABASE_URL pointing at Postgres")
+def test_postgres_broker_delivers_events_published_by_another_broker(app_module):
+    main = app_module
+    listener = PostgresNotifyBroker(main.engine, channel="test_notifications", poll_interval=0.1)
+    publisher = PostgresNotifyBroker(main.engine, channel="test_notifications")  # stands in for another worker
+
+    async def scenario():
+        subscription = listener.subscribe("u1")
+        listener.start()
+        try:
+            for _ in range(50):  # until the listener has issued LISTEN
+                publisher.publish("u1", {"id": "n1"})
+                try:
+                    return await asyncio.wait_for(subscription.get(), 0.1)
+                except asyncio.TimeoutError:
+                    continue
+        finally:
+            listener.stop()
+            listener.unsubscribe(subscription)
+
+    assert asyncio.run(scenario()) == {"id": "n1"}
+
+
+@pytest.fixture
+def user_email(app_module):
+    main = app_module
+    db = main.SessionLocal()
+    try:
+        user = main.User(id=str(uuid.uuid4()), email=f"{uuid.uuid4().hex}@example.com")
+        db.add(user)
+        db.commit()
+        return user.email
+    finally:
+        db.close()
+
+
+def create_ticket(main, token):
+    db = main.SessionLocal()
+    try:
+        return main.create_notification_stream_ticket(token, db)["ticket"]
+    finally:
+        db.close()
+
+
+def test_ticket_is_not_an_access_token(app_module, user_email):
+    main = app_module
+    token = main.create_access_token(data={"sub": user_email})
+    ticket = create_ticket(main, token)
+
+    assert main.decode_token_payload(ticket, scope=main.STREAM_TICKET_SCOPE)["sub"] == user_email
+    with pytest.raises(HTTPException):
+        main.decode_token_subject(ticket)
+    with pytest.raises(HTTPException):
+        create_ticket(main, ticket)
+    with pytest.raises(HTTPException):
+        asyncio.run(main.stream_notifications(ConnectedRequest(), token=None, ticket=token))
+
+
+class ConnectedRequest:
+    async def is_disconnected(self):
+        return False
+
+
+def test_stream_closes_when_the_access_token_expires(app_module, user_email):
+    main = app_module
+    token = main.create_access_token(data={"sub": user_email}, expires_delta=timedelta(seconds=1))
+    ticket = create_ticket(main, token)
+
+    async def read_stream():
+        response = await main.stream_notifications(ConnectedRequest(), token=None, ticket=ticket)
+        return [message async for message in response.body_iterator]
+
+    messages = asyncio.run(asyncio.wait_for(read_stream(), 5))
+    assert messages[-1].startswith("event: expired")
+    assert main.notification_broker.stats()["connections"] == 0
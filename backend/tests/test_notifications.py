@@ -0,0 +1,63 @@
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import Response
+
+
+@pytest.fixture
+def user_with_notifications(app_module):
+    """A user with 25 notifications, newest first: every third one read, every fifth one with is_read NULL"""
+    main = app_module
+    db = main.SessionLocal()
+    try:
+        user = main.User(id=str(uuid.uuid4()), email=f"{uuid.uuid4().hex}@example.com")
+        db.add(user)
+        db.flush()
+        now = datetime.utcnow()
+        for i in range(25):
+            db.add(main.Notification(user_id=user.id, type="SWAP_REQUEST", title=f"n{i}", message="m",
+                                     is_read=i % 3 == 0, created_at=now - timedelta(minutes=i)))
+        db.flush()
+        notifications = main.Notification.__table__
+        db.execute(notifications.update()
+                   .where(notifications.c.user_id == user.id, notifications.c.title.in_([f"n{i}" for i in range(0, 25, 5)]))
+                   .values(is_read=None))
+        db.commit()
+        return main.Principal.model_validate(user)
+    finally:
+        db.close()
+
+
+def list_notifications(main, user, **params):
+    db = main.SessionLocal()
+    try:
+        response = Response()
+        params = {"unread_only": False, "limit": None, "cursor": None, **params}
+        notifs = main.get_my_notifications(db=db, user=user, response=response, **params)
+        return [main.NotificationResponse.model_validate(n) for n in notifs], response.headers.get("X-Next-Cursor")
+    finally:
+        db.close()
+
+
+def test_without_limit_or_cursor_everything_is_returned(app_module, user_with_notifications):
+    notifs, cursor = list_notifications(app_module, user_with_notifications)
+    assert [n.title for n in notifs] == [f"n{i}" for i in range(25)]
+    assert cursor is None
+
+
+def test_limit_pages_through_with_the_cursor(app_module, user_with_notifications):
+    titles, cursor = [], None
+    while True:
+        page, cursor = list_notifications(app_module, user_with_notifications, limit=10, cursor=cursor)
+        titles += [n.title for n in page]
+        if cursor is None:
+            break
+    assert titles == [f"n{i}" for i in range(25)]
+
+
+def test_unread_only_includes_null_rows(app_module, user_with_notifications):
+    notifs, _ = list_notifications(app_module, user_with_notifications, unread_only=True)
+    expected = [f"n{i}" for i in range(25) if i % 5 == 0 or i % 3 != 0]
+    assert [n.title for n in notifs] == expected
+    assert not any(n.is_read for n in notifs)
@@ -0,0 +1,70 @@
+import json
+import uuid
+from datetime import datetime
+
+from outbox import BatchResult, OutboxDispatcher
+
+
+def make_dispatcher(results, batch_size=2):
+    calls = []
+
+    def process_batch(limit):
+        calls.append(limit)
+        result = results.pop(0) if results else BatchResult()
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    return OutboxDispatcher(process_batch, interval=0.01, batch_size=batch_size), calls
+
+
+def test_drain_continues_while_batches_are_full():
+    dispatcher, calls = make_dispatcher([BatchResult(2), BatchResult(2), BatchResult(1)])
+    assert dispatcher.drain() == 5
+    assert len(calls) == 3
+    assert dispatcher.stats()["processed"] == 5
+
+
+def test_drain_stops_after_a_failed_event():
+    dispatcher, calls = make_dispatcher([BatchResult(1, 1, 0), BatchResult(2)])
+    assert dispatcher.drain() == 1
+    assert len(calls) == 1
+    assert dispatcher.stats()["failed"] == 1
+
+
+def test_batch_errors_are_counted():
+    dispatcher, _ = make_dispatcher([RuntimeError("db down")])
+    assert dispatcher.drain() == 0
+    assert dispatcher.stats()["failures"] == 1
+
+
+def test_dead_lettered_count_in_stats():
+    dispatcher, _ = make_dispatcher([BatchResult(1, 0, 1)])
+    dispatcher.drain()
+    assert dispatcher.stats()["dead_lettered"] == 1
+
+
+def test_one_bad_event_is_charged_alone(app_module):
+    main = app_module
+    db = main.SessionLocal()
+    try:
+        db.query(main.OutboxEvent).delete()
+        user = main.User(id=str(uuid.uuid4()), email=f"{uuid.uuid4().hex}@example.com")
+        db.add(user)
+        good = {"user_id": user.id, "type": "TEST", "title": "t", "message": "m",
+                "created_at": datetime.utcnow().isoformat()}
+        for payload in (good, {"missing": "fields"}, good):
+            db.add(main.OutboxEvent(event_type="notification", payload=json.dumps(payload)))
+        db.commit()
+
+        result = main.process_outbox_batch(10)
+        assert result == BatchResult(delivered=2, failed=1, dead_lettered=0)
+        remaining = db.query(main.OutboxEvent).all()
+        assert len(remaining) == 1 and remaining[0].attempts == 1
+
+        for _ in range(main.OUTBOX_MAX_ATTEMPTS - 1):
+            result = main.process_outbox_batch(10)
+        assert result.dead_lettered == 1
+        assert main.process_outbox_batch(10) == BatchResult()
+    finally:
+        db.close()
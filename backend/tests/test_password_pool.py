@@ -0,0 +1,41 @@
+import pytest
+
+from password_pool import HasherOverloaded, PasswordHasher, bcrypt_rounds
+
+
+@pytest.fixture
+def hasher():
+    hasher = PasswordHasher(workers=1, max_pending=4, rounds=4)
+    hasher.start()
+    yield hasher
+    hasher.shutdown()
+
+
+def test_pool_uses_spawn(hasher):
+    assert hasher._executor._mp_context.get_start_method() == "spawn"
+
+
+def test_hash_and_verify(hasher):
+    hashed = hasher.hash("correct horse")
+    assert bcrypt_rounds(hashed) == 4
+    assert hasher.verify("correct horse", hashed)
+    assert not hasher.verify("wrong", hashed)
+
+
+def test_outdated_cost_factor_is_rehashed(hasher):
+    old = PasswordHasher(workers=1, rounds=5)
+    try:
+        hashed = old.hash("pw")
+    finally:
+        old.shutdown()
+    valid, new_hash = hasher.verify_and_update("pw", hashed)
+    assert valid and bcrypt_rounds(new_hash) == 4
+
+
+def test_overload_is_rejected():
+    hasher = PasswordHasher(workers=1, max_pending=0, rounds=4)
+    with pytest.raises(HasherOverloaded):
+        hasher.hash("pw")
+    assert hasher.stats()["rejected"] == 1
+    hasher.shutdown()
+
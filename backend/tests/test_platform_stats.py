@@ -0,0 +1,89 @@
+import threading
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from platform_stats import PlatformStats
+
+
+class Loader:
+    def __init__(self, *results):
+        self.results = list(results)
+        self.calls = 0
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self):
+        self.calls += 1
+        self.release.wait(5)
+        result = self.results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_first_read_loads_synchronously_and_writes_apply_deltas():
+    stats = PlatformStats(Loader({"total_items": 3}))
+    stats.apply({"total_items": 1})  # nothing loaded yet: the load counts it
+    assert stats.get() == {"total_items": 3}
+    stats.apply({"total_items": 2, "total_swaps": 1})
+    assert stats.get() == {"total_items": 5, "total_swaps": 1}
+
+
+def test_stale_read_serves_current_values_and_refreshes_once_in_background():
+    loader = Loader({"total_items": 1}, {"total_items": 10})
+    stats = PlatformStats(loader, refresh_interval=60)
+    stats.get()
+    stats.invalidate()
+    loader.release.clear()
+    assert stats.get() == {"total_items": 1}
+    assert stats.get() == {"total_items": 1}  # refresh already running
+    loader.release.set()
+    wait_until(lambda: stats.get() == {"total_items": 10})
+    assert loader.calls == 2
+
+
+def test_failed_refresh_keeps_the_last_values_and_retries_on_the_next_read():
+    loader = Loader({"total_items": 1}, RuntimeError("database unavailable"), {"total_items": 2})
+    stats = PlatformStats(loader, refresh_interval=60)
+    stats.get()
+    stats.invalidate()
+    stats.get()
+    wait_until(lambda: loader.calls == 2 and not stats._refreshing)
+    assert stats.get() == {"total_items": 1}
+    wait_until(lambda: stats.get() == {"total_items": 2})
+    assert loader.calls == 3
+
+
+def test_delta_applied_during_a_refresh_is_kept():
+    loader = Loader({"total_items": 1}, {"total_items": 1})  # the recount's snapshot predates the write below
+    stats = PlatformStats(loader, refresh_interval=60)
+    stats.get()
+    stats.invalidate()
+    loader.release.clear()
+    stats.get()
+    wait_until(lambda: loader.calls == 2)
+    stats.apply({"total_items": 1})
+    assert stats.get() == {"total_items": 2}
+    loader.release.set()
+    wait_until(lambda: not stats._refreshing)
+    assert stats.get() == {"total_items": 2}
+
+
+def test_failed_first_load_serves_nothing_and_endpoints_answer_503(app_module, monkeypatch):
+    main = app_module
+    loader = Loader(RuntimeError("database unavailable"), {"total_users": 1, "total_items": 2, "pending_items": 0,
+                                                           "flagged_items": 0, "total_swaps": 0, "completed_swaps": 0})
+    monkeypatch.setattr(main, "platform_stats", PlatformStats(loader))
+    with pytest.raises(HTTPException) as exc:
+        main.get_public_stats()
+    assert exc.value.status_code == 503
+    assert main.get_public_stats() == {"total_users": 1, "total_items": 2, "total_swaps": 0, "completed_swaps": 0}
@@ -0,0 +1,90 @@
+"""The listing, dashboard and detail endpoints issue the same number of statements for N and 2N rows."""
+
+import uuid
+
+import pytest
+from fastapi import Response
+
+from database import count_queries
+
+N = 5
+
+
+@pytest.fixture
+def seed(app_module):
+    main = app_module
+
+    def seed(n):
+        """A user with ``n`` approved items, each with 2 images and ``n`` tags, in a category of their own"""
+        db = main.SessionLocal()
+        try:
+            user = main.User(id=str(uuid.uuid4()), email=f"{uuid.uuid4().hex}@example.com",
+                             first_name="Ada", last_name="L")
+            category = main.Category(id=str(uuid.uuid4()), name=f"cat-{uuid.uuid4().hex[:8]}")
+            db.add_all([user, category])
+            item_ids = []
+            for i in range(n):
+                item = main.Item(id=str(uuid.uuid4()), title=f"Item {i}", condition="GOOD", item_type="TOP",
+                                 category_id=category.id, user_id=user.id, is_approved=True, is_available=True)
+                db.add(item)
+                db.add_all([main.ItemImage(item_id=item.id, image_url=f"/img/{item.id}-{k}.jpg", is_primary=k == 0)
+                            for k in range(2)])
+                db.flush()
+                main.attach_tags(db, item.id, [f"tag-{uuid.uuid4().hex[:8]}" for _ in range(n)])
+                item_ids.append(item.id)
+            db.commit()
+            return main.Principal.model_validate(user), category.id, item_ids
+        finally:
+            db.close()
+
+    return seed
+
+
+def statement_count(main, call):
+    db = main.SessionLocal()
+    try:
+        call(db)  # warm caches, so only the per-request statements are counted
+        with count_queries(main.engine) as statements:
+            call(db)
+        return len(statements)
+    finally:
+        db.close()
+
+
+def test_listing(app_module, seed):
+    main = app_module
+    counts = []
+    for n in (N, 2 * N):
+        _, category_id, item_ids = seed(n)
+
+        def call(db):
+            items = main.browse_items(category_id=category_id, tags=None, condition=None, item_type=None,
+                                      search=None, sort_by="newest", skip=0, limit=100, cursor=None,
+                                      response=Response(), db=db)
+            assert len(items) == len(item_ids)
+
+        counts.append(statement_count(main, call))
+    assert counts[0] == counts[1]
+
+
+def test_dashboard(app_module, seed):
+    main = app_module
+    counts = []
+    for n in (N, 2 * N):
+        principal, _, _ = seed(n)
+        counts.append(statement_count(main, lambda db: main.get_user_dashboard(db=db, current_user=principal)))
+    assert counts[0] == counts[1]
+
+
+def test_detail(app_module, seed):
+    main = app_module
+    counts = []
+    for n in (N, 2 * N):
+        _, _, item_ids = seed(n)
+
+        def call(db):
+            detail = main.get_item_detail(item_ids[0], db=db, request=None, current_user=None)
+            assert len(detail.tags) == n
+
+        counts.append(statement_count(main, call))
+    assert counts[0] == counts[1]
@@ -0,0 +1,30 @@
+from rag_index import BM25Index, estimate_tokens, format_context, select_context, stem, tokenize
+
+CHUNKS = [
+    {"title": "Swapping items", "content": "Request a swap from the item page.", "metadata": {"tags": ["swap"]}},
+    {"title": "Points", "content": "Earn points when your listing is swapped.", "metadata": {"tags": ["points"]}},
+    {"title": "Shipping", "content": "Agree on shipping with the other member.", "metadata": {}},
+]
+
+
+def test_stem_and_tokenize():
+    assert {stem("swapping"), stem("swaps"), stem("swap")} == {"swap"}
+    assert tokenize("How do I swap my jacket?") == ["swap", "jacket"]
+    assert tokenize(None) == []
+
+
+def test_search_ranks_title_and_tag_matches_first():
+    index = BM25Index(CHUNKS)
+    results = index.search("how do swaps work", k=4)
+    assert [doc_id for _, doc_id in results] == [0, 1]
+    assert results[0][0] > results[1][0]
+    assert index.search("refund policy") == []
+
+
+def test_select_context_respects_token_budget():
+    index = BM25Index(CHUNKS)
+    first = CHUNKS[0]
+    budget = estimate_tokens(f"{first['title']}\n{first['content']}")
+    assert select_context(index, "swap", k=4, token_budget=budget) == [first]
+    assert format_context([]) == "(no matching knowledge base entries)"
+    assert format_context([first]).startswith("Swapping items\n")
@@ -0,0 +1,112 @@
+import json
+import os
+import threading
+import time
+
+import pytest
+
+import rag_index_file
+from rag_index import BM25Index
+from rag_index_file import KnowledgeBase, MappedIndex, build_index_file
+
+CHUNKS = [
+    {"title": "Swapping items", "content": "Request a swap from the item page.", "metadata": {"tags": ["swap"]}},
+    {"title": "Points", "content": "Earn points when your listing is swapped.", "metadata": {"tags": ["points"]}},
+    {"title": "Notifications", "content": "Unread notifications show a badge.", "metadata": {}},
+]
+
+
+def write_chunks(path, chunks):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(chunks, f)
+
+
+@pytest.mark.parametrize("dense_dim", [0, 32])
+def test_mapped_index_matches_bm25(tmp_path, dense_dim):
+    path = str(tmp_path / "kb.idx")
+    build_index_file(CHUNKS, path, dense_dim=dense_dim)
+    mapped, expected = MappedIndex(path), BM25Index(CHUNKS)
+    for query in ["swap", "points for listing", "notification badge", "nothing matches"]:
+        got = mapped.search(query, k=3, dense_weight=0)
+        want = expected.search(query, k=3)
+        assert [d for _, d in got] == [d for _, d in want]
+        assert [s for s, _ in got] == pytest.approx([s for s, _ in want], rel=1e-5)
+    assert mapped.chunk(2) == CHUNKS[2]
+    assert os.listdir(tmp_path) == ["kb.idx"]
+
+
+def test_dense_vectors_tolerate_typos(tmp_path):
+    path = str(tmp_path / "kb.idx")
+    build_index_file(CHUNKS, path, dense_dim=256)
+    assert MappedIndex(path).search("notifcations", k=1)[0][1] == 2
+
+
+def test_failed_write_leaves_no_temp_file(tmp_path, monkeypatch):
+    def fail(*args):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(rag_index_file.os, "replace", fail)
+    with pytest.raises(OSError):
+        build_index_file(CHUNKS, str(tmp_path / "kb.idx"))
+    assert os.listdir(tmp_path) == []
+
+
+def test_newer_chunks_are_recompiled(tmp_path):
+    chunks_path, index_path = str(tmp_path / "kb.json"), str(tmp_path / "kb.idx")
+    write_chunks(chunks_path, CHUNKS[:1])
+    kb = KnowledgeBase(chunks_path, index_path, check_interval=0)
+    assert kb.current().n_docs == 1
+    write_chunks(chunks_path, CHUNKS)
+    os.utime(chunks_path, ns=(os.stat(index_path).st_mtime_ns + 1,) * 2)
+    assert kb.current().n_docs == 3
+    assert kb.reloads == 2
+
+
+def test_concurrent_workers_build_once(tmp_path, monkeypatch):
+    chunks_path, index_path = str(tmp_path / "kb.json"), str(tmp_path / "kb.idx")
+    write_chunks(chunks_path, CHUNKS)
+    builds = []
+    real_build = rag_index_file.build_index_file
+
+    def counting_build(*args, **kwargs):
+        builds.append(1)
+        time.sleep(0.05)  # the other workers find the index still missing and queue on the lock
+        return real_build(*args, **kwargs)
+
+    monkeypatch.setattr(rag_index_file, "build_index_file", counting_build)
+    workers = [KnowledgeBase(chunks_path, index_path) for _ in range(4)]
+    barrier = threading.Barrier(len(workers))
+
+    def start_worker(kb):
+        barrier.wait()
+        kb.current()
+
+    threads = [threading.Thread(target=start_worker, args=(kb,)) for kb in workers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(builds) == 1
+    assert all(isinstance(kb.current(), MappedIndex) for kb in workers)
+
+
+def test_unwritable_index_falls_back_to_memory(tmp_path):
+    chunks_path = str(tmp_path / "kb.json")
+    write_chunks(chunks_path, CHUNKS)
+    kb = KnowledgeBase(chunks_path, str(tmp_path / "missing-dir" / "kb.idx"), check_interval=0)
+    index = kb.current()
+    assert isinstance(index, BM25Index)
+    assert index.search("swap", k=1)[0][1] == 0
+    assert kb.build_failures == 1
+    assert kb.current() is index  # same chunks: no new build attempt
+    assert kb.build_failures == 1
+
+
+def test_stale_index_is_served_from_memory_without_auto_build(tmp_path):
+    chunks_path, index_path = str(tmp_path / "kb.json"), str(tmp_path / "kb.idx")
+    build_index_file(CHUNKS[:1], index_path)
+    write_chunks(chunks_path, CHUNKS)
+    os.utime(chunks_path, ns=(os.stat(index_path).st_mtime_ns + 1,) * 2)
+    kb = KnowledgeBase(chunks_path, index_path, auto_build=False)
+    assert len(kb.current().chunks) == 3
+    assert MappedIndex(index_path).n_docs == 1
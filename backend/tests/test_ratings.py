@@ -0,0 +1,98 @@
+"""users.rating_sum / rating_count stay equal to the ratings table."""
+
+import threading
+import uuid
+
+import pytest
+
+
+@pytest.fixture
+def make_user(app_module):
+    def make():
+        db = app_module.SessionLocal()
+        try:
+            user = app_module.User(id=str(uuid.uuid4()), email=f"{uuid.uuid4().hex}@example.com")
+            db.add(user)
+            db.commit()
+            return user.id
+        finally:
+            db.close()
+    return make
+
+
+def rate(main, rater_id, rated_user_id, stars):
+    db = main.SessionLocal()
+    try:
+        rater = db.get(main.User, rater_id)
+        main.rate_user(main.RatingCreate(rated_user_id=rated_user_id, rating=stars), db=db, user=rater)
+    finally:
+        db.close()
+
+
+def aggregates(main, user_id):
+    db = main.SessionLocal()
+    try:
+        user = db.get(main.User, user_id)
+        return user.rating_sum, user.rating_count
+    finally:
+        db.close()
+
+
+def test_new_overwrite_and_delete(app_module, make_user):
+    main = app_module
+    rated, alice, bob = make_user(), make_user(), make_user()
+    rate(main, alice, rated, 4)
+    rate(main, bob, rated, 2)
+    assert aggregates(main, rated) == (6, 2)
+
+    rate(main, alice, rated, 5)
+    assert aggregates(main, rated) == (7, 2)
+
+    db = main.SessionLocal()
+    try:
+        db.delete(db.query(main.Rating).filter_by(rater_id=bob, rated_user_id=rated).one())
+        db.commit()
+    finally:
+        db.close()
+    assert aggregates(main, rated) == (5, 1)
+
+
+def test_concurrent_overwrites_by_the_same_rater(app_module, make_user):
+    main = app_module
+    rated, rater = make_user(), make_user()
+    rate(main, rater, rated, 1)
+    barrier = threading.Barrier(4)
+
+    def overwrite(stars):
+        barrier.wait()
+        rate(main, rater, rated, stars)
+
+    threads = [threading.Thread(target=overwrite, args=(stars,)) for stars in (2, 3, 4, 5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    db = main.SessionLocal()
+    try:
+        final = db.query(main.Rating.rating).filter_by(rater_id=rater, rated_user_id=rated).scalar()
+    finally:
+        db.close()
+    assert aggregates(main, rated) == (final, 1)
+
+
+def test_backfill_recomputes_drifted_aggregates(app_module, make_user):
+    main = app_module
+    rated, other, alice, bob = make_user(), make_user(), make_user(), make_user()
+    rate(main, alice, rated, 3)
+    rate(main, bob, rated, 5)
+    db = main.SessionLocal()
+    try:
+        db.query(main.User).filter(main.User.id.in_([rated, other])).update(
+            {main.User.rating_sum: 99, main.User.rating_count: 9}, synchronize_session=False)
+        db.commit()
+        assert main.backfill_rating_aggregates(db) >= 1
+    finally:
+        db.close()
+    assert aggregates(main, rated) == (8, 2)
+    assert aggregates(main, other) == (0, 0)
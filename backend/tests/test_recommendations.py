@@ -0,0 +1,71 @@
+import heapq
+import random
+
+import pytest
+
+from recommendations import RecommendationEngine, RecommendationSnapshot
+
+
+def random_snapshot(seed, categories=5, per_category=40, users=6, tags=12):
+    rng = random.Random(seed)
+    candidates, item_tags = {}, {}
+    for c in range(categories):
+        items = []
+        for i in range(per_category):
+            item_id = f"c{c}-i{i}"
+            items.append((item_id, f"u{rng.randrange(users)}", rng.randrange(1000)))
+            item_tags[item_id] = [f"t{rng.randrange(tags)}" for _ in range(rng.randrange(4))]
+        items.sort(key=lambda c: c[2], reverse=True)
+        candidates[f"c{c}"] = items
+    category_affinity = {f"u{u}": {f"c{rng.randrange(categories)}": rng.random() for _ in range(2)} for u in range(users)}
+    tag_affinity = {f"u{u}": {f"t{rng.randrange(tags)}": rng.random() for _ in range(3)} for u in range(users)}
+    return RecommendationSnapshot(candidates, item_tags, category_affinity, tag_affinity)
+
+
+def brute_force(engine, snapshot, user_id, category_id, limit):
+    categories = snapshot.category_affinity.get(user_id, {}) if user_id else {}
+    tags = snapshot.tag_affinity.get(user_id, {}) if user_id else {}
+    if category_id:
+        lists = {category_id: snapshot.candidates.get(category_id, [])}
+    elif categories:
+        lists = snapshot.candidates
+    else:
+        lists = {None: snapshot.popular}
+    scored = []
+    for cat, candidates in lists.items():
+        size = len(candidates) or 1
+        for rank, (item_id, owner_id, _) in enumerate(candidates):
+            if user_id and owner_id == user_id:
+                continue
+            scored.append((engine._score(snapshot, item_id, cat, rank, size, categories, tags), item_id))
+    return [item_id for _, item_id in heapq.nlargest(limit, scored)]
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("user_id", [None, "u0", "u3", "unknown"])
+@pytest.mark.parametrize("category_id", [None, "c1"])
+def test_top_k_merge_matches_full_scan(seed, user_id, category_id):
+    snapshot = random_snapshot(seed)
+    engine = RecommendationEngine(lambda: snapshot)
+    engine.rebuild()
+    for limit in (1, 5, 20):
+        assert engine.recommend(user_id, category_id, limit) == brute_force(engine, snapshot, user_id, category_id, limit)
+
+
+def test_merge_stops_early(monkeypatch):
+    snapshot = random_snapshot(0, per_category=500)
+    engine = RecommendationEngine(lambda: snapshot)
+    engine.rebuild()
+    scored = []
+    original = engine._score
+    monkeypatch.setattr(engine, "_score", lambda *args: scored.append(1) or original(*args))
+    engine.recommend("u0", None, 10)
+    assert len(scored) < 5 * 500 / 2
+
+
+def test_own_items_are_skipped():
+    snapshot = RecommendationSnapshot({"c": [("a", "me", 10), ("b", "other", 5)]})
+    engine = RecommendationEngine(lambda: snapshot)
+    engine.rebuild()
+    assert engine.recommend("me", "c", 10) == ["b"]
+    assert engine.recommend(None, None, 10) == ["a", "b"]
@@ -0,0 +1,85 @@
+"""reconcile_user_stats(fix=True) does not lose counter updates committed while it recounts, and counter writes lock rows in key order."""
+
+import threading
+import uuid
+
+
+def test_write_during_reconcile_is_not_lost(app_module, monkeypatch):
+    main = app_module
+    db = main.SessionLocal()
+    try:
+        user = main.User(id=str(uuid.uuid4()), email=f"{uuid.uuid4().hex}@example.com")
+        db.add(user)
+        db.commit()
+        user_id = user.id
+    finally:
+        db.close()
+
+    recounted, resume = threading.Event(), threading.Event()
+    real_compute = main.compute_user_stats
+
+    def paused_compute(session):
+        result = real_compute(session)
+        recounted.set()
+        resume.wait(5)  # the writer below commits now, unless the counters are locked
+        return result
+
+    def reconcile():
+        session = main.SessionLocal()
+        try:
+            main.reconcile_user_stats(session)
+        finally:
+            session.close()
+
+    def notify():
+        session = main.SessionLocal()
+        try:
+            session.add(main.Notification(user_id=user_id, type="SWAP_REQUEST", title="t", message="m"))
+            session.commit()
+        finally:
+            session.close()
+
+    monkeypatch.setattr(main, "compute_user_stats", paused_compute)
+    reconciler = threading.Thread(target=reconcile)
+    reconciler.start()
+    assert recounted.wait(5)
+    writer = threading.Thread(target=notify)
+    writer.start()
+    writer.join(0.3)
+    resume.set()
+    reconciler.join()
+    writer.join()
+    monkeypatch.undo()
+
+    db = main.SessionLocal()
+    try:
+        assert main.get_user_stats(db, user_id)["unread_notifications"] == 1
+        assert user_id not in main.reconcile_user_stats(db, fix=False)["drift"]
+    finally:
+        db.close()
+
+
+def test_counter_rows_are_upserted_in_key_order(app_module, monkeypatch):
+    main = app_module
+    db = main.SessionLocal()
+    try:
+        users = [main.User(id=f"{uuid.uuid4().hex}-{suffix}", email=f"{uuid.uuid4().hex}@example.com")
+                 for suffix in "ba"]
+        db.add_all(users)
+        db.commit()
+
+        upserted = []
+        real_upsert = main.upsert_counters
+
+        def recording_upsert(conn, table, key, deltas):
+            upserted.append(key["user_id"])
+            real_upsert(conn, table, key, deltas)
+
+        monkeypatch.setattr(main, "upsert_counters", recording_upsert)
+        # Notifications for users in reverse key order; the counters must still be locked lowest key first
+        for user in sorted(users, key=lambda u: u.id, reverse=True):
+            db.add(main.Notification(user_id=user.id, type="SWAP_REQUEST", title="t", message="m"))
+        db.commit()
+        assert upserted == sorted(user.id for user in users)
+    finally:
+        db.close()
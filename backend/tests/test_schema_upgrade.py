@@ -0,0 +1,54 @@
+from sqlalchemy import Boolean, Column, DateTime, Integer, MetaData, String, Table, create_engine, inspect, text
+
+from schema_upgrade import upgrade_schema
+
+
+def baseline_users_table(metadata):
+    """The users table as it was before the rating aggregates were added"""
+    return Table(
+        "users", metadata,
+        Column("id", String, primary_key=True),
+        Column("email", String, unique=True, index=True),
+        Column("password_hash", String),
+        Column("first_name", String),
+        Column("last_name", String),
+        Column("is_admin", Boolean),
+        Column("is_verified", Boolean),
+        Column("created_at", DateTime),
+        Column("updated_at", DateTime),
+        Column("points_balance", Integer),
+    )
+
+
+def test_new_columns_are_added_with_their_server_default(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    old = MetaData()
+    baseline_users_table(old)
+    old.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO users (id, email) VALUES ('u1', 'a@example.com')"))
+
+    new = MetaData()
+    users = baseline_users_table(new)
+    users.append_column(Column("rating_sum", Integer, server_default="0", nullable=False))
+    users.append_column(Column("rating_count", Integer, server_default="0", nullable=False))
+
+    assert upgrade_schema(engine, new) == ["users.rating_sum", "users.rating_count"]
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT rating_sum, rating_count FROM users")).all() == [(0, 0)]
+    assert upgrade_schema(engine, new) == []
+
+
+def test_app_models_upgrade_a_baseline_users_table(app_module, tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    old = MetaData()
+    baseline_users_table(old)
+    old.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO users (id, email) VALUES ('u1', 'a@example.com')"))
+
+    added = upgrade_schema(engine, app_module.Base.metadata)
+    assert {"users.rating_sum", "users.rating_count"} <= set(added)
+    assert {c["name"] for c in inspect(engine).get_columns("users")} >= {"rating_sum", "rating_count"}
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT rating_sum, rating_count FROM users")).all() == [(0, 0)]
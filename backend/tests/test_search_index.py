@@ -0,0 +1,145 @@
+"""search_index keeps the full-text index in step with listings and never lets user input reach the query syntax."""
+
+import os
+
+import pytest
+from sqlalchemy import Column, String, Text, create_engine, text
+from sqlalchemy.orm import Session, declarative_base
+
+import search_index
+from search_index import apply_search, index_item, init_search_index, unindex_item
+
+Base = declarative_base()
+
+
+class Item(Base):
+    """Just the columns search_index reads"""
+    __tablename__ = "items"
+    id = Column(String, primary_key=True)
+    title = Column(String)
+    description = Column(Text)
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    # init_search_index sets a module global; restore the app's backend afterwards
+    monkeypatch.setattr(search_index, "_backend", search_index._backend)
+    engine = create_engine(f"sqlite:///{tmp_path / 'search.db'}")
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+    engine.dispose()
+
+
+def add(db, item_id, title, description=None):
+    item = Item(id=item_id, title=title, description=description)
+    db.add(item)
+    index_item(db, item)
+    db.commit()
+    return item
+
+
+def search(db, term):
+    query, _ = apply_search(db.query(Item), term, Item)
+    return [item.id for item in query.all()]
+
+
+def test_fts5_backfills_and_follows_inserts_updates_and_deletes(db):
+    db.add(Item(id="old", title="Vintage wool coat"))
+    db.commit()
+    assert init_search_index(db.get_bind()) == "fts5"
+    assert search(db, "wool") == ["old"]  # listed before the index existed
+
+    add(db, "jacket", "Blue denim jacket", "Barely worn")
+    assert search(db, "jack blu") == ["jacket"]  # every term is prefix-matched
+
+    jacket = db.get(Item, "jacket")
+    jacket.title = "Red denim jacket"
+    index_item(db, jacket)
+    db.commit()
+    assert search(db, "blue") == []
+    assert search(db, "red") == ["jacket"]
+
+    unindex_item(db, "jacket")
+    db.delete(jacket)
+    db.commit()
+    assert search(db, "denim") == []
+
+
+def test_fts5_ranks_better_matches_first(db):
+    init_search_index(db.get_bind())
+    add(db, "once", "Denim skirt", "Pleated")
+    add(db, "twice", "Denim jacket", "Heavy denim, denim buttons")
+    query, ranked = apply_search(db.query(Item), "denim", Item)
+    assert ranked
+    assert [item.id for item in query.all()] == ["twice", "once"]
+
+
+@pytest.mark.parametrize("term", [
+    'jacket" OR "coat',
+    "jacket*",
+    "NEAR(jacket coat)",
+    "title:jacket",
+    "-coat jacket",
+    "jacket'; DROP TABLE items; --",
+])
+def test_fts5_query_syntax_in_user_input_is_inert(db, term):
+    init_search_index(db.get_bind())
+    add(db, "jacket", "Denim jacket")
+    add(db, "coat", "Wool coat")
+    found = search(db, term)  # would raise a MATCH syntax error if passed through
+    assert "coat" not in found or "jacket" not in found
+    assert db.execute(text("SELECT count(*) FROM items")).scalar() == 2
+
+
+def test_punctuation_only_search_does_not_filter(db):
+    init_search_index(db.get_bind())
+    add(db, "jacket", "Denim jacket")
+    query, ranked = apply_search(db.query(Item), '"*()', Item)
+    assert not ranked
+    assert [item.id for item in query.all()] == ["jacket"]
+
+
+def test_like_fallback_matches_substrings_and_escapes_wildcards(db, monkeypatch):
+    monkeypatch.setattr(search_index, "_backend", None)
+    add(db, "cotton", "100% cotton tee")
+    add(db, "wool", "1000 wool socks")
+    add(db, "tshirt", "Plain t_shirt")
+    add(db, "tee", "Plain tshirt", "Organic COTTON")
+
+    query, ranked = apply_search(db.query(Item), "Cotton", Item)
+    assert not ranked
+    assert sorted(item.id for item in query.all()) == ["cotton", "tee"]  # title or description, any case
+    assert search(db, "100%") == ["cotton"]
+    assert search(db, "t_shirt") == ["tshirt"]
+
+
+@pytest.mark.skipif(not (os.getenv("TEST_DATABASE_URL") or "").startswith("postgresql"),
+                    reason="needs TEST_DATABASE_URL pointing at Postgres")
+def test_postgres_expression_index_follows_writes(app_module):
+    main = app_module
+    assert search_index._backend == "postgres"
+    db = main.SessionLocal()
+    try:
+        owner = main.User(id="fts-owner", email="fts-owner@example.com")
+        item = main.Item(id="fts-item", title="Blue denim jacket", condition="GOOD", item_type="TOP",
+                         user_id=owner.id)
+        db.add_all([owner, item])
+        db.commit()
+
+        def found(term):
+            query, _ = apply_search(db.query(main.Item).filter(main.Item.id == item.id), term, main.Item)
+            return [row.id for row in query.all()]
+
+        assert found("jack blu") == [item.id]
+        assert found("jacket' & !coat") == [item.id]
+        item.title = "Red wool coat"
+        db.commit()
+        assert found("denim") == []
+        assert found("wool") == [item.id]
+        db.delete(item)
+        db.delete(owner)
+        db.commit()
+        assert found("wool") == []
+    finally:
+        db.close()
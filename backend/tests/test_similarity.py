@@ -0,0 +1,110 @@
+import uuid
+
+import pytest
+from fastapi import HTTPException
+
+from similarity import SimilarityIndex
+
+JACKET = {"title": "Blue denim jacket", "brand": "Levis", "color": "blue", "material": "denim",
+          "tags": ["denim", "jacket"], "category_id": "outerwear"}
+JACKET_2 = {"title": "Denim jacket, washed blue", "brand": "Wrangler", "color": "blue", "material": "denim",
+            "tags": ["jacket"], "category_id": "outerwear"}
+COAT = {"title": "Wool winter coat", "color": "grey", "material": "wool", "tags": ["coat"], "category_id": "outerwear"}
+SNEAKERS = {"title": "White leather sneakers", "brand": "Adidas", "color": "white", "material": "leather",
+            "tags": ["shoes"], "category_id": "footwear"}
+
+
+@pytest.fixture
+def index():
+    index = SimilarityIndex(initial_capacity=2)
+    index.add_many([("jacket", JACKET), ("jacket2", JACKET_2), ("coat", COAT), ("sneakers", SNEAKERS)])
+    return index
+
+
+def test_neighbours_are_ordered_and_exclude_the_item_itself(index):
+    neighbours = index.similar_to("jacket", k=3)
+    assert [item_id for item_id, _ in neighbours] == ["jacket2", "coat", "sneakers"]
+    scores = [score for _, score in neighbours]
+    assert scores == sorted(scores, reverse=True)
+    assert index.similar_to("jacket", k=1)[0][0] == "jacket2"
+    assert index.similar_to("missing") == []
+
+
+def test_unrelated_listings_barely_collide(index):
+    assert dict(index.similar_to("jacket", k=3))["sneakers"] < 0.1
+
+
+def test_remove_and_reuse_rows(index):
+    index.remove("jacket2")
+    assert "jacket2" not in index
+    assert [item_id for item_id, _ in index.similar_to("jacket", k=3)] == ["coat", "sneakers"]
+    index.add("jacket3", JACKET_2)
+    assert len(index) == 4
+    assert index.similar_to("jacket", k=1)[0][0] == "jacket3"
+
+
+def test_rebuild_replaces_the_contents(index):
+    assert not index.ready
+    index.rebuild([("coat", COAT), ("sneakers", SNEAKERS)])
+    assert index.ready
+    assert len(index) == 2
+    assert "jacket" not in index
+    assert [item_id for item_id, _ in index.similar_to("coat")] == ["sneakers"]
+
+
+def make_items(main, listings):
+    db = main.SessionLocal()
+    try:
+        owner = main.User(id=str(uuid.uuid4()), email=f"{uuid.uuid4().hex}@example.com")
+        category = main.Category(id=str(uuid.uuid4()), name=f"cat-{uuid.uuid4().hex[:8]}")
+        db.add_all([owner, category])
+        ids = []
+        for listing in listings:
+            item = main.Item(id=str(uuid.uuid4()), title=listing["title"], brand=listing.get("brand"),
+                             color=listing.get("color"), material=listing.get("material"), category_id=category.id, condition="GOOD",
+                             item_type="TOP", user_id=owner.id, is_approved=True, is_available=True)
+            db.add(item)
+            ids.append(item.id)
+        db.commit()
+        return ids
+    finally:
+        db.close()
+
+
+def similar(main, item_id, limit=10):
+    db = main.SessionLocal()
+    try:
+        return [item.id for item in main.get_similar_items(item_id, limit=limit, db=db)]
+    finally:
+        db.close()
+
+
+def test_similar_items_endpoint(app_module, monkeypatch):
+    main = app_module
+    monkeypatch.setattr(main, "similarity_index", SimilarityIndex())
+    ids = make_items(main, [JACKET, JACKET_2, SNEAKERS])
+    jacket, jacket_2, sneakers = ids
+    # The test database is shared, so keep other tests' listings out of the index
+    approved_listings = main.approved_listings
+    monkeypatch.setattr(main, "approved_listings",
+                        lambda db: ((i, listing) for i, listing in approved_listings(db) if i in ids))
+
+    assert similar(main, jacket) == []  # startup build still running
+
+    main.load_similarity_index()
+    assert main.similarity_index.ready
+    assert similar(main, jacket, limit=1) == [jacket_2]
+    with pytest.raises(HTTPException) as exc:
+        similar(main, str(uuid.uuid4()))
+    assert exc.value.status_code == 404
+
+    # Removed by another worker: gone after the next refresh
+    db = main.SessionLocal()
+    try:
+        db.get(main.Item, jacket_2).is_approved = False
+        db.commit()
+    finally:
+        db.close()
+    main.load_similarity_index()
+    assert jacket_2 not in similar(main, jacket)
+    assert sneakers in similar(main, jacket)
@@ -0,0 +1,19 @@
+import uuid
+
+
+def test_tag_ids_are_cached_only_after_commit(app_module):
+    main = app_module
+    name = f"tag-{uuid.uuid4().hex[:8]}"
+    db = main.SessionLocal()
+    try:
+        main.resolve_tag_ids(db, [name])
+        assert main.tag_id_cache.get(name) is None
+        db.rollback()
+        assert main.tag_id_cache.get(name) is None
+        assert db.query(main.Tag).filter(main.Tag.name == name).first() is None
+
+        ids = main.resolve_tag_ids(db, [name])
+        db.commit()
+        assert main.tag_id_cache.get(name) == ids[name]
+    finally:
+        db.close()
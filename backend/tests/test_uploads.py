@@ -0,0 +1,86 @@
+import asyncio
+import io
+import os
+import time
+from typing import List
+
+import pytest
+from fastapi import FastAPI, File, HTTPException, UploadFile
+from fastapi.testclient import TestClient
+
+from blob_store import BlobStore
+from uploads import UploadBudget, UploadSizeLimitMiddleware, stream_upload_to_disk
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.add_middleware(UploadSizeLimitMiddleware, max_body_bytes=1000)
+
+    @app.post("/upload")
+    async def upload(images: List[UploadFile] = File(...)):
+        return {"files": len(images)}
+
+    return TestClient(app)
+
+
+def test_small_upload_passes(client):
+    assert client.post("/upload", files=[("images", ("a.jpg", b"x" * 100))]).json() == {"files": 1}
+
+
+def test_declared_length_over_limit_is_refused(client):
+    assert client.post("/upload", files=[("images", ("a.jpg", b"x" * 5000))]).status_code == 413
+
+
+def test_streamed_body_is_cut_off_at_limit(client):
+    def body():
+        yield b'--b\r\nContent-Disposition: form-data; name="images"; filename="a.jpg"\r\n\r\n'
+        for _ in range(10):
+            yield b"x" * 500
+        yield b"\r\n--b--\r\n"
+
+    response = client.post("/upload", content=body(), headers={"content-type": "multipart/form-data; boundary=b"})
+    assert response.status_code == 413
+
+
+def test_per_file_limit_removes_partial_file(tmp_path):
+    upload = UploadFile(io.BytesIO(b"x" * 3000), filename="big.jpg")
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(stream_upload_to_disk(upload, str(tmp_path), UploadBudget(1000, 10000)))
+    assert exc.value.status_code == 413
+    assert os.listdir(tmp_path) == []
+
+
+def write_tmp(directory, content):
+    path = os.path.join(directory, f"{time.time_ns()}.tmp")
+    with open(path, "wb") as f:
+        f.write(content)
+    return path
+
+
+def test_discard_removes_only_new_unshared_blobs(tmp_path):
+    store = BlobStore(str(tmp_path / "blobs"), "/blobs")
+    digest = "a" * 64
+    path, created = store.put(write_tmp(tmp_path, b"one"), digest)
+    assert created is not None
+    assert store.discard(digest, created) == 3
+    assert not os.path.exists(path)
+
+    path, created = store.put(write_tmp(tmp_path, b"two"), digest)
+    time.sleep(0.01)
+    _, reused = store.put(write_tmp(tmp_path, b"two"), digest)  # another upload of the same photo
+    assert reused is None
+    assert store.discard(digest, created) == 0
+    assert os.path.exists(path)
+
+
+def test_failed_image_leaves_no_blobs_behind(app_module, tmp_path, monkeypatch):
+    main = app_module
+    monkeypatch.setattr(main, "blob_store", BlobStore(str(tmp_path / "blobs"), "/blobs"))
+    monkeypatch.setattr(main, "UPLOAD_DIR", str(tmp_path))
+    monkeypatch.setattr(main, "UPLOAD_MAX_FILE_BYTES", 1000)
+    images = [UploadFile(io.BytesIO(b"ok" * 10), filename="a.jpg"),
+              UploadFile(io.BytesIO(b"x" * 5000), filename="b.jpg")]
+    with pytest.raises(HTTPException):
+        asyncio.run(main.save_item_images("item", images))
+    assert list(main.blob_store.iter_blobs()) == []
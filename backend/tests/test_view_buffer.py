@@ -0,0 +1,112 @@
+from collections import Counter
+
+from view_buffer import ViewBuffer
+
+
+class FlakyStore:
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.batches = []
+
+    def __call__(self, counts, logs):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("database unavailable")
+        self.batches.append((counts, logs))
+
+
+def assert_counts_match_logs(buffer):
+    assert dict(buffer._counts) == dict(Counter(log["item_id"] for log in buffer._logs))
+
+
+def test_flush_writes_one_batch():
+    store = FlakyStore()
+    buffer = ViewBuffer(store, max_pending=10)
+    for item_id in ["a", "b", "a"]:
+        buffer.record(item_id)
+    assert buffer.flush() == 3
+    assert len(store.batches) == 1
+    counts, logs = store.batches[0]
+    assert counts == {"a": 2, "b": 1}
+    assert [log["item_id"] for log in logs] == ["a", "b", "a"]
+    assert buffer.stats()["flushed"] == 3
+    assert buffer.pending() == 0
+
+
+def test_failed_flush_is_retried():
+    store = FlakyStore(failures=1)
+    buffer = ViewBuffer(store, max_pending=10)
+    buffer.record("a")
+    assert buffer.flush() == 0
+    buffer.record("b")
+    assert buffer.flush() == 2
+    counts, logs = store.batches[0]
+    assert counts == {"a": 1, "b": 1}
+    assert [log["item_id"] for log in logs] == ["a", "b"]
+    assert buffer.stats()["flush_failures"] == 1
+
+
+def test_record_drops_views_beyond_max_pending():
+    buffer = ViewBuffer(FlakyStore(), max_pending=3)
+    for i in range(5):
+        buffer.record(f"item-{i}")
+    assert buffer.pending() == 3
+    assert buffer.stats()["dropped"] == 2
+    assert_counts_match_logs(buffer)
+
+
+def test_repeated_flush_failures_keep_the_buffer_bounded():
+    store = FlakyStore(failures=100)
+    buffer = ViewBuffer(store, max_pending=4)
+    for i in range(20):
+        buffer.record(f"item-{i % 3}")
+        if i % 2:
+            buffer.flush()
+            # Views recorded while the failing flush was in flight
+            buffer._logs.extend({"item_id": "late"} for _ in range(3))
+            buffer._counts["late"] += 3
+            buffer.flush()
+        assert buffer.pending() <= buffer.max_pending
+        assert_counts_match_logs(buffer)
+    stats = buffer.stats()
+    assert stats["pending"] == 4
+    assert stats["flushed"] == 0
+    assert stats["dropped"] == 20 + 10 * 3 - 4
+
+
+def test_requeue_drops_the_oldest_views_first():
+    store = FlakyStore(failures=1)
+    buffer = ViewBuffer(store, max_pending=3)
+    for item_id in ["old", "a", "b"]:
+        buffer.record(item_id)
+
+    def record_during_flush(counts, logs):
+        buffer.record("new")
+        store(counts, logs)
+
+    buffer.flush_fn = record_during_flush
+    buffer.flush()
+    assert [log["item_id"] for log in buffer._logs] == ["a", "b", "new"]
+    assert buffer.stats()["dropped"] == 1
+    assert_counts_match_logs(buffer)
+
+
+def test_views_dropped_during_a_slow_successful_flush_are_counted_separately():
+    store = FlakyStore()
+    buffer = ViewBuffer(store, max_pending=2)
+    buffer.record("a")
+    buffer.record("b")
+
+    def slow_flush(counts, logs):
+        for item_id in ["c", "d", "e"]:  # traffic refills the buffer before this write returns
+            buffer.record(item_id)
+        store(counts, logs)
+
+    buffer.flush_fn = slow_flush
+    assert buffer.flush() == 2
+    stats = buffer.stats()
+    assert stats["flush_failures"] == 0
+    assert stats["dropped"] == stats["dropped_during_flush"] == 1
+    buffer.record("f")  # no flush running: a full buffer is not a slow flush
+    assert buffer.stats()["dropped_during_flush"] == 1
+    assert buffer.stats()["dropped"] == 2
@@ -50,6 +50,7 @@ export const itemsApi = {
     sort_by?: string;
     skip?: number;
     limit?: number;
+    cursor?: string;
   } = {}): Promise<Item[]> => {
     const response = await api.get('/items', { params: filters });
     return response.data;
@@ -1,44 +1,72 @@
-from langchain_core.messages import SystemMessage, HumanMessage
-from langchain_groq import ChatGroq
-from dotenv import load_dotenv
-import os
-import json
-
-load_dotenv()
-
-llm = ChatGroq(model="gemma2-9b-it", temperature=0.7, api_key=os.getenv("GROQ_API_KEY"))
-
-with open("rewear_chunks.json", "r") as f:
-    rewear_chunks = json.load(f)
-
-knowledge_base = "\n\n".join(f"{chunk['title']}\n{chunk['content']}" for chunk in rewear_chunks)
-
-system_prompt = f"""
-You are ReWearBot, a helpful assistant for a platform called ReWear.
-
-Instructions:
-- You help users understand and use the ReWear platform.
-- ReWear is a community-driven platform for swapping unused clothes via direct exchange or a point-based system.
-- You should respond clearly, concisely, and with step-by-step guidance when needed.
-- Always answer based on the knowledge base provided below.
-- If a user asks "How do I start swapping?" or "How do I earn points?", explain the correct process based on the APIs and user flow.
-- You should avoid hallucinating any answers outside this knowledge base.
-- Keep your tone friendly but professional.
-- If asked a question outside the scope of ReWear (e.g., banking, movies), respond: “I specialize in ReWear-related questions. Please ask me something about the platform.”
-
-Knowledge Base:
-{knowledge_base}
-"""
-
-# Initialize chat history
-chat_history = [
-    SystemMessage(content=system_prompt)
-]
-
-user_query = str(input("You: "))
-chat_history.append(HumanMessage(content=user_query))
-
-ai_response = llm.invoke(chat_history)
-chat_history.append(ai_response) 
-
-print(f"AI: {ai_response.content}")
\ No newline at end of file
+from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
+from langchain_groq import ChatGroq
+from dotenv import load_dotenv
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "backend", "app"))
+
+from rag_index import select_context, format_context
+from rag_index_file import KnowledgeBase
+from chat_sessions import ChatSessionStore
+
+load_dotenv()
+
+llm = ChatGroq(model="gemma2-9b-it", temperature=0.7, api_key=os.getenv("GROQ_API_KEY"))
+
+# Same knowledge base and index file as the server (backend/app); compiled on first run
+# (or when the JSON is newer), then memory-mapped
+app_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend", "app")
+chunks_path = os.getenv("CHATBOT_KNOWLEDGE_BASE", os.path.join(app_dir, "rewear_chunks.json"))
+knowledge_base = KnowledgeBase(
+    chunks_path,
+    os.getenv("CHATBOT_INDEX_PATH", os.path.splitext(chunks_path)[0] + ".idx"),
+    dense_dim=int(os.getenv("CHATBOT_DENSE_DIM", "0")),
+    auto_build=os.getenv("CHATBOT_INDEX_AUTO_BUILD", "1") == "1",
+)
+
+system_prompt_template = """
+You are ReWearBot, a helpful assistant for a platform called ReWear.
+
+Instructions:
+- You help users understand and use the ReWear platform.
+- ReWear is a community-driven platform for swapping unused clothes via direct exchange or a point-based system.
+- You should respond clearly, concisely, and with step-by-step guidance when needed.
+- Always answer based on the knowledge base provided below.
+- If a user asks "How do I start swapping?" or "How do I earn points?", explain the correct process based on the APIs and user flow.
+- You should avoid hallucinating any answers outside this knowledge base.
+- Keep your tone friendly but professional.
+- If asked a question outside the scope of ReWear (e.g., banking, movies), respond: “I specialize in ReWear-related questions. Please ask me something about the platform.”
+
+Knowledge Base:
+{knowledge_base}
+"""
+
+# One conversation per run; older turns are folded into a running summary
+chat_sessions = ChatSessionStore(maxsize=1, window_turns=int(os.getenv("CHATBOT_HISTORY_TURNS", "6")))
+session = chat_sessions.create()
+
+while True:
+    user_query = str(input("You: ")).strip()
+    if user_query.lower() in ("", "exit", "quit"):
+        break
+
+    summary, turns = session.history(int(os.getenv("CHATBOT_HISTORY_TOKENS", "1000")))
+
+    # Only the chunks relevant to the question (and the previous one, for follow-ups) go into the prompt
+    retrieval_query = f"{turns[-1][0]} {user_query}" if turns else user_query
+    context = select_context(knowledge_base.current(), retrieval_query, k=int(os.getenv("CHATBOT_TOP_K", "4")),
+                             token_budget=int(os.getenv("CHATBOT_CONTEXT_TOKENS", "1200")))
+    system_prompt = system_prompt_template.format(knowledge_base=format_context(context))
+    if summary:
+        system_prompt += f"\nEarlier in this conversation:\n{summary}\n"
+
+    chat_history = [SystemMessage(content=system_prompt)]
+    for question, answer in turns:
+        chat_history += [HumanMessage(content=question), AIMessage(content=answer)]
+    chat_history.append(HumanMessage(content=user_query))
+
+    ai_response = llm.invoke(chat_history)
+    chat_sessions.record_turn(session, user_query, ai_response.content)
+
+    print(f"AI: {ai_response.content}")